@@ -1,5 +1,13 @@
+from .cache import *
+from .instrumentation import *
+from .partitions import *
+from .schema import *
+from .block_index import *
 from .swap_math import *
 from .data_update import *
 from .pool_helpers import *
 from .swap import *
+from .session import *
+from .replay import *
 from .test_helpers import *
+from .synthetic import *
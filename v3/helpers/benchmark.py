@@ -0,0 +1,469 @@
+import polars as pl
+import numpy as np
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from .connectors import local
+from .partitions import *
+from .data_update import _update_tables
+from .pool_helpers import createSwapDF, dtToBN
+from .synthetic import generateSynthetic
+
+BENCHMARK_TABLES = [
+    "factory_pool_created",
+    "pool_initialize_events",
+    "pool_swap_events",
+    "pool_mint_burn_events",
+]
+
+
+def loadLocalDatabase(
+    connector, data_path, tables, chain, pool, min_block=None, max_block=None
+):
+    """
+    Copies the events of the chain (and the pool for the tables pulled per pool)
+    from a data path into the local database of the connector
+
+    Notice: min_block/max_block only copy the events between them (inclusive)
+    """
+    for table in tables:
+        df = scanTable(data_path, table, chain, pool).filter(pl.col("chain_name") == chain)
+
+        if table in POOL_PARTITIONED_TABLES:
+            df = df.filter(pl.col("address") == pool)
+        if min_block is not None:
+            df = df.filter(pl.col("block_number") >= min_block)
+        if max_block is not None:
+            df = df.filter(pl.col("block_number") <= max_block)
+
+        df = df.collect()
+        if not df.is_empty():
+            connector.load(df, table)
+
+
+def countRows(data_path, tables):
+    """
+    Counts the rows that are stored in the data path
+    """
+    rows = 0
+    for table in tables:
+        if len(tableFiles(data_path, table)) != 0:
+            rows += scanTable(data_path, table).select(pl.count()).collect().item()
+
+    return rows
+
+
+def timeUpdate(pool, tables, workers):
+    """
+    Times one _update_tables run of the pool against its local connector
+    """
+    pool.connector.queries.clear()
+    rows_before = countRows(pool.data_path, tables)
+
+    start = time.perf_counter()
+    _update_tables(pool, tables, False, [pool.chain], workers)
+    seconds = time.perf_counter() - start
+
+    rows = countRows(pool.data_path, tables) - rows_before
+    segments = pool.connector.queries["read"]
+
+    return {
+        "seconds": seconds,
+        "rows": rows,
+        "segments": segments,
+        "rows_per_second": rows / seconds,
+        "seconds_per_segment": seconds / segments if segments != 0 else None,
+    }
+
+
+def benchmarkIngest(
+    source_path,
+    pool,
+    chain,
+    tables=[],
+    tgt_max_rows=10_000,
+    split=0.9,
+    workers=1,
+    read_ahead=4,
+    work_path=None,
+):
+    """
+    Measures the throughput of the update loop without credentials or a network
+
+    The events of the pool in source_path are copied into a local sqlite database
+    1. backfill - the events up to the split quantile of the swap blocks
+    are pulled into an empty data path
+    2. incremental - the rest of the events are added to the database
+    and pulled on top of the backfill
+
+    Returns rows/sec and seconds per segment of both runs
+
+    Notice: source_path is any data path (e.g. data/examples)
+    Notice: work_path keeps the database and pulled data, otherwise
+    a temporary folder is used and removed
+    """
+    if tables == []:
+        tables = BENCHMARK_TABLES
+
+    pool = pool.lower()
+
+    cleanup = work_path is None
+    if work_path is None:
+        work_path = tempfile.mkdtemp(prefix="v3_benchmark_")
+    else:
+        os.makedirs(work_path, exist_ok=True)
+
+    db_path = f"{work_path}/benchmark.db"
+    data_path = f"{work_path}/data"
+    assert not os.path.exists(db_path), f"{db_path} already exists"
+
+    try:
+        split_block = int(
+            scanTable(source_path, "pool_swap_events", chain, pool)
+            .filter((pl.col("chain_name") == chain) & (pl.col("address") == pool))
+            .select(pl.col("block_number").quantile(split, "nearest"))
+            .collect()
+            .item()
+        )
+
+        connector = local(db_path)
+        loadLocalDatabase(
+            connector, source_path, tables, chain, pool, max_block=split_block
+        )
+
+        Path(data_path).mkdir(parents=True, exist_ok=True)
+        state = SimpleNamespace(
+            pool=pool,
+            chain=chain,
+            data_path=data_path,
+            tables=tables,
+            tgt_max_rows=tgt_max_rows,
+            read_ahead=read_ahead,
+            connector=connector,
+        )
+
+        results = {"backfill": timeUpdate(state, tables, workers)}
+
+        loadLocalDatabase(
+            connector, source_path, tables, chain, pool, min_block=split_block + 1
+        )
+        results["incremental"] = timeUpdate(state, tables, workers)
+
+    finally:
+        if cleanup:
+            shutil.rmtree(work_path, ignore_errors=True)
+
+    for run, result in results.items():
+        print(
+            f"{run}: {result['rows']} rows in {result['seconds']:.2f}s "
+            f"({result['rows_per_second']:,.0f} rows/sec) over {result['segments']} segments"
+        )
+
+    return results
+
+
+def readRSS():
+    """
+    The resident memory of the process in bytes (None if /proc is not available)
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+
+
+class rssSampler:
+    """
+    Samples the resident memory on a background thread while the
+    block is running to find its peak
+
+    Notice: the peak is only as fine as the sampling interval
+    """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.start = None
+        self.peak = None
+        self.done = threading.Event()
+
+    def sample(self):
+        while not self.done.is_set():
+            rss = readRSS()
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            self.done.wait(self.interval)
+
+    def __enter__(self):
+        self.start = readRSS()
+        self.peak = self.start
+        self.done.clear()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.done.set()
+        self.thread.join()
+
+        rss = readRSS()
+        if rss is not None:
+            self.peak = max(self.peak or 0, rss)
+
+
+def timeCase(fn, repeats, setup=None):
+    """
+    Times fn over repeats runs (after one warm up run) and samples the peak memory
+
+    Notice: setup runs before every run and is not timed (e.g. clearing caches)
+    """
+    if setup is not None:
+        setup()
+    fn()
+
+    seconds = []
+    peak, start = 0, None
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+
+        with rssSampler() as sampler:
+            t = time.perf_counter()
+            fn()
+            seconds.append(time.perf_counter() - t)
+
+        if sampler.peak is not None:
+            peak = max(peak, sampler.peak)
+            start = sampler.start if start is None else min(start, sampler.start)
+
+    return {
+        "seconds": seconds,
+        "median": float(np.median(seconds)),
+        "min": min(seconds),
+        "peak_rss_mb": peak / 2**20 if start is not None else None,
+        "rss_delta_mb": (peak - start) / 2**20 if start is not None else None,
+    }
+
+
+def gitCommit():
+    """
+    The commit the benchmark was ran on (None outside of a git checkout)
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def swapSizes(pool, as_of, token):
+    """
+    Finds a swap size that stays in range and one that crosses
+    at least 10 initialized ticks at as_of
+    """
+    amounts = [10.0**x for x in range(6, 27)]
+    crossed = pool.swapInBatch(
+        pl.DataFrame(
+            {
+                "as_of": [as_of] * len(amounts),
+                "tokenIn": [token] * len(amounts),
+                "swapIn": amounts,
+            }
+        )
+    )["ticksCrossed"].to_list()
+
+    in_range = [a for a, c in zip(amounts, crossed) if c == 0]
+    multi_tick = [a for a, c in zip(amounts, crossed) if c is not None and c >= 10]
+
+    return (
+        in_range[-1] if len(in_range) != 0 else amounts[0],
+        multi_tick[0] if len(multi_tick) != 0 else amounts[-1],
+    )
+
+
+def benchmarkPool(pool_class, address, chain, data_path, repeats=5):
+    """
+    Times the hot paths of one pool
+
+    The swaps are timed on a warm swap state (the state is cached
+    per as_of), createLiq and createSwapDF are timed cold
+    """
+    results = {}
+    pool = None
+
+    def load():
+        nonlocal pool
+        pool = pool_class(address, chain, data_path=data_path)
+
+    results["init"] = timeCase(load, repeats)
+
+    def coldCaches():
+        pool.clearCaches()
+
+    def readDisk():
+        saved = pool.cache.pop("swaps")
+        try:
+            pool.readFromMemoryOrDisk("pool_swap_events", pool.data_path)
+        finally:
+            pool.cache["swaps"] = saved
+
+    results["readFromMemoryOrDisk"] = timeCase(readDisk, repeats)
+
+    swaps = pool.swaps
+    as_of = swaps["as_of"][int(len(swaps) * 0.9)]
+
+    results["createLiq"] = timeCase(lambda: pool.createLiq(as_of), repeats, coldCaches)
+    results["createSwapDF"] = timeCase(
+        lambda: createSwapDF(as_of, pool), repeats, coldCaches
+    )
+
+    in_range, multi_tick = swapSizes(pool, as_of, pool.token0)
+    for case, amount in [("swapIn_in_range", in_range), ("swapIn_multi_tick", multi_tick)]:
+        calldata = {"as_of": as_of, "tokenIn": pool.token0, "swapIn": amount}
+        results[case] = timeCase(lambda: pool.swapIn(calldata), repeats)
+        results[case]["amount"] = amount
+
+    start = swaps["block_timestamp"][0].replace(tzinfo=None)
+    for gas in [False, True]:
+        results[f"getPriceSeries_gas={gas}"] = timeCase(
+            lambda: pool.getPriceSeries(start, frequency="1h", gas=gas), repeats
+        )
+
+    end = swaps["block_timestamp"][-1].replace(tzinfo=None)
+    dts = [start + (end - start) * x for x in np.linspace(0, 1, 100)]
+    results["dtToBN_x100"] = timeCase(
+        lambda: [dtToBN(dt, pool) for dt in dts], repeats
+    )
+
+    return results
+
+
+def benchmarkSuite(
+    sizes=[10_000, 100_000, 1_000_000],
+    repeats=5,
+    output=None,
+    work_path=None,
+    seed=0,
+):
+    """
+    Times the hot paths of v3Pool (see benchmarkPool) on synthetic pools
+    of every size (number of swaps, with a tenth as many positions)
+
+    Returns (and writes to output as json) the seconds and peak memory
+    of every case with the commit, python and polars versions, so runs
+    on different commits can be compared (see compareBenchmarks)
+
+    Notice: work_path keeps the synthetic data between runs, otherwise
+    a temporary folder is used and removed
+    """
+    from ..state import v3Pool
+
+    cleanup = work_path is None
+    if work_path is None:
+        work_path = tempfile.mkdtemp(prefix="v3_benchmark_")
+
+    report = {
+        "commit": gitCommit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "polars": pl.__version__,
+        "platform": platform.platform(),
+        "repeats": repeats,
+        "results": [],
+    }
+
+    try:
+        for size in sizes:
+            data_path = f"{work_path}/swaps_{size}"
+
+            # the synthetic data is deterministic for the seed
+            if not os.path.exists(data_path):
+                generateSynthetic(
+                    data_path,
+                    swaps_per_pool=size,
+                    positions_per_pool=max(size // 10, 1),
+                    n_blocks=max(size * 10, 100_000),
+                    seed=seed,
+                )
+            address = (
+                scanTable(data_path, "factory_pool_created")
+                .select("pool")
+                .collect()["pool"][0]
+            )
+
+            results = benchmarkPool(v3Pool, address, "ethereum", data_path, repeats)
+
+            for case, result in results.items():
+                report["results"].append({"size": size, "case": case, **result})
+                print(
+                    f"{size:>10} {case:<28} {result['median'] * 1e3:10.2f}ms"
+                    f" peak {result['peak_rss_mb'] or 0:8.0f}MB"
+                )
+
+    finally:
+        if cleanup:
+            shutil.rmtree(work_path, ignore_errors=True)
+
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    return report
+
+
+def compareBenchmarks(before, after):
+    """
+    Compares the median times of two benchmarkSuite json outputs
+
+    Returns a dataframe of every (size, case) with the ratio after / before
+    """
+
+    def read(path):
+        with open(path) as f:
+            report = json.load(f)
+
+        return pl.DataFrame(
+            [
+                {"size": r["size"], "case": r["case"], "median": r["median"]}
+                for r in report["results"]
+            ]
+        )
+
+    return (
+        read(before)
+        .join(read(after), on=["size", "case"], suffix="_after")
+        .with_columns(ratio=pl.col("median_after") / pl.col("median"))
+        .sort(["case", "size"])
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "suite":
+        # python -m v3.helpers.benchmark suite [output.json] [size ...]
+        output = sys.argv[2] if len(sys.argv) > 2 else f"benchmark_{gitCommit()}.json"
+        sizes = [int(size) for size in sys.argv[3:]] or [10_000, 100_000, 1_000_000]
+        benchmarkSuite(sizes, output=output)
+    else:
+        # the UNI/ETH pool in data/examples
+        benchmarkIngest(
+            str(Path(__file__).parent.parent / "data" / "examples"),
+            "0x1d42064Fc4Beb5F8aAF85F4617AE8b3b5B8Bd801",
+            "ethereum",
+            tgt_max_rows=100,
+        )
@@ -0,0 +1,172 @@
+from .partitions import *
+import polars as pl
+import numpy as np
+import os
+from datetime import datetime, timezone
+
+# the tables that are read to build the index from the stored data
+BLOCK_INDEX_TABLES = [
+    "pool_swap_events",
+    "pool_mint_burn_events",
+    "pool_initialize_events",
+]
+
+
+def blockIndexPath(data_path, chain):
+    """
+    The block index of a chain is a flat file of sorted
+    (block_number, block_timestamp in us) int64 pairs
+    """
+    return f"{data_path}/block_index/{chain}.bin"
+
+
+def readBlockIndex(data_path, chain):
+    """
+    Memory maps the block index of the chain as a (n, 2) array
+    Returns None if the index was not built yet
+    """
+    path = blockIndexPath(data_path, chain)
+
+    if not os.path.exists(path):
+        return None
+
+    if os.path.getsize(path) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+
+    return np.memmap(path, dtype=np.int64, mode="r").reshape(-1, 2)
+
+
+def blockPairs(df):
+    """
+    Returns the sorted unique (block_number, block_timestamp in us) pairs
+    """
+    return (
+        df.select(
+            pl.col("block_number").cast(pl.Int64),
+            pl.col("block_timestamp").dt.epoch("us").cast(pl.Int64),
+        )
+        .unique(subset="block_number")
+        .sort("block_number")
+        .to_numpy()
+        .astype(np.int64)
+    )
+
+
+def writeBlockIndex(pairs, data_path, chain):
+    """
+    Writes the whole index and then moves it into place
+    """
+    path = blockIndexPath(data_path, chain)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    np.ascontiguousarray(pairs, dtype=np.int64).tofile(f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+
+
+def updateBlockIndex(df, data_path):
+    """
+    Adds the blocks of freshly pulled events to the index of their chain
+
+    New blocks after the end of the index are appended, otherwise the
+    index is merged and rewritten
+
+    Notice: df must already be written, a chain without an index gets
+    one built from everything on disk (see buildBlockIndex)
+    """
+    if df.is_empty():
+        return
+
+    for chain, chain_df in df.partition_by("chain_name", as_dict=True).items():
+        if type(chain) == tuple:
+            chain = chain[0]
+
+        index = readBlockIndex(data_path, chain)
+        if index is None:
+            # the events written before the index existed are on disk too
+            buildBlockIndex(data_path, chain)
+            continue
+
+        pairs = blockPairs(chain_df)
+
+        if index.shape[0] == 0 or pairs[0, 0] > index[-1, 0]:
+            # incremental updates only add blocks at the end
+            with open(blockIndexPath(data_path, chain), "ab") as f:
+                f.write(np.ascontiguousarray(pairs).tobytes())
+
+        else:
+            merged = np.concatenate([np.asarray(index), pairs])
+            _, unique = np.unique(merged[:, 0], return_index=True)
+            writeBlockIndex(merged[unique], data_path, chain)
+
+
+def buildBlockIndex(data_path, chain):
+    """
+    Builds the block index of the chain from the events already on disk
+    """
+    frames = []
+    for table in BLOCK_INDEX_TABLES:
+        if len(tableFiles(data_path, table, chain)) == 0:
+            continue
+
+        frames.append(
+            scanTable(data_path, table, chain)
+            .filter(pl.col("chain_name") == chain)
+            .select(["block_number", "block_timestamp"])
+            .unique(subset="block_number")
+            .collect()
+        )
+
+    if len(frames) == 0:
+        pairs = np.empty((0, 2), dtype=np.int64)
+    else:
+        pairs = blockPairs(pl.concat(frames))
+
+    writeBlockIndex(pairs, data_path, chain)
+
+    return readBlockIndex(data_path, chain)
+
+
+def getBlockIndex(data_path, chain):
+    """
+    Returns the block index of the chain and builds it if it is missing
+    """
+    index = readBlockIndex(data_path, chain)
+
+    if index is None:
+        index = buildBlockIndex(data_path, chain)
+
+    return index
+
+
+def blockIndexFrame(data_path, chain):
+    """
+    Returns the block index of the chain as a (block_timestamp, block_number)
+    polars dataframe sorted by block_timestamp
+    """
+    index = getBlockIndex(data_path, chain)
+
+    return (
+        pl.DataFrame(
+            {
+                "block_timestamp": np.asarray(index[:, 1]),
+                "block_number": np.asarray(index[:, 0]),
+            }
+        )
+        .with_columns(
+            block_timestamp=pl.from_epoch("block_timestamp", time_unit="us")
+            .dt.replace_time_zone("UTC")
+        )
+        .set_sorted("block_timestamp")
+    )
+
+
+def toEpochUs(dt):
+    """
+    Converts a (naive = utc) datetime to us since the epoch
+    """
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+
+    delta = dt - datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+    return (delta.days * 86_400 + delta.seconds) * 1_000_000 + delta.microseconds
@@ -0,0 +1,104 @@
+from collections import OrderedDict
+import numpy as np
+import polars as pl
+import sys
+
+
+def estimateSize(value):
+    """
+    Rough estimate of the bytes held by a cached value
+    """
+    if isinstance(value, pl.DataFrame):
+        return value.estimated_size()
+    elif isinstance(value, np.ndarray):
+        return value.nbytes
+    elif isinstance(value, dict):
+        return sum(estimateSize(v) for v in value.values())
+    elif isinstance(value, (tuple, list)):
+        return sum(estimateSize(v) for v in value)
+
+    return sys.getsizeof(value)
+
+
+class lruCache:
+    """
+    Bounded least-recently-used cache
+
+    Entries are evicted once there are more than max_entries or once
+    the estimated size of the entries goes over max_bytes
+    None disables either bound
+    """
+
+    def __init__(self, max_entries=32, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Returns the cached value (and marks it as recently used)
+        or None if it is missing
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+
+        return self.entries[key]
+
+    def put(self, key, value):
+        """
+        Adds the value to the cache and evicts the least recently used
+        entries until the cache is within its bounds
+        """
+        if key in self.entries:
+            self.bytes -= self.sizes[key]
+
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        self.sizes[key] = estimateSize(value)
+        self.bytes += self.sizes[key]
+
+        # always keep the newest entry, even if it is over the byte budget
+        while len(self.entries) > 1 and (
+            (self.max_entries is not None and len(self.entries) > self.max_entries)
+            or (self.max_bytes is not None and self.bytes > self.max_bytes)
+        ):
+            old, _ = self.entries.popitem(last=False)
+            self.bytes -= self.sizes.pop(old)
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Drops every entry but keeps the counters
+        """
+        self.entries.clear()
+        self.sizes.clear()
+        self.bytes = 0
+
+    def stats(self):
+        """
+        Returns the hit/miss/eviction counters and the current size
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+        }
@@ -0,0 +1,40 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+# test_helpers.test_assertion(pool) is a runtime check of a pool, not a test
+collect_ignore = ["test_helpers.py"]
+
+EXAMPLES = Path(__file__).parent.parent / "data" / "examples"
+TABLES = [
+    "factory_pool_created",
+    "pool_initialize_events",
+    "pool_mint_burn_events",
+    "pool_swap_events",
+]
+
+# UNI/WETH 30 bps on ethereum, the pool of the example data
+EXAMPLE_POOL = "0x1d42064Fc4Beb5F8aAF85F4617AE8b3b5B8Bd801"
+
+
+@pytest.fixture(scope="session")
+def example_path(tmp_path_factory):
+    """
+    A data folder with the example tables, laid out like a pulled v3/data
+    """
+    data_path = tmp_path_factory.mktemp("data")
+    for table in TABLES:
+        (data_path / table).mkdir()
+        shutil.copy(
+            EXAMPLES / table / "example.parquet",
+            data_path / table / f"0_0_0_{table}.parquet",
+        )
+    return str(data_path)
+
+
+@pytest.fixture(scope="session")
+def example_pool(example_path):
+    from v3 import state
+
+    return state.v3Pool(EXAMPLE_POOL, "ethereum", data_path=example_path)
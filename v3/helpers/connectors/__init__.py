@@ -1,2 +1,5 @@
+from .filters import *
 from .gbq import *
 from .allium import *
+from .local import *
+from .async_adapter import *
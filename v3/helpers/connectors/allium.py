@@ -1,5 +1,137 @@
 import polars as pl
 import requests
+import io
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .filters import address_filter
+
+# the declared schema of each remote table, in the order of the
+# select statements in get_remote_table. these match data/examples
+# large numbers (amounts, prices, liquidity) are kept as strings
+ALLIUM_SCHEMA = {
+    "factory_pool_created": {
+        "chain_name": pl.Utf8,
+        "block_timestamp": pl.Utf8,
+        "block_number": pl.Int64,
+        "transaction_hash": pl.Utf8,
+        "log_index": pl.Int64,
+        "token0": pl.Utf8,
+        "token1": pl.Utf8,
+        "fee": pl.Utf8,
+        "tick_spacing": pl.Utf8,
+        "pool": pl.Utf8,
+    },
+    "pool_swap_events": {
+        "chain_name": pl.Utf8,
+        "address": pl.Utf8,
+        "block_timestamp": pl.Utf8,
+        "block_number": pl.Int64,
+        "transaction_hash": pl.Utf8,
+        "log_index": pl.Int64,
+        "sender": pl.Utf8,
+        "recipient": pl.Utf8,
+        "amount0": pl.Utf8,
+        "amount1": pl.Utf8,
+        "sqrt_price_x96": pl.Utf8,
+        "liquidity": pl.Utf8,
+        "tick": pl.Utf8,
+        "to_address": pl.Utf8,
+        "from_address": pl.Utf8,
+        "transaction_index": pl.Int64,
+        "gas_price": pl.Utf8,
+        "gas_used": pl.Utf8,
+        "l1_fee": pl.Utf8,
+    },
+    "pool_mint_burn_events": {
+        "chain_name": pl.Utf8,
+        "address": pl.Utf8,
+        "block_timestamp": pl.Utf8,
+        "block_hash": pl.Utf8,
+        "block_number": pl.Int64,
+        "transaction_hash": pl.Utf8,
+        "log_index": pl.Int64,
+        "amount": pl.Utf8,
+        "amount0": pl.Utf8,
+        "amount1": pl.Utf8,
+        "owner": pl.Utf8,
+        "tick_lower": pl.Utf8,
+        "tick_upper": pl.Utf8,
+        "type_of_event": pl.Int64,
+        "to_address": pl.Utf8,
+        "from_address": pl.Utf8,
+        "transaction_index": pl.Int64,
+        "gas_price": pl.Utf8,
+        "gas_used": pl.Utf8,
+        "l1_fee": pl.Utf8,
+    },
+    "pool_initialize_events": {
+        "chain_name": pl.Utf8,
+        "address": pl.Utf8,
+        "block_timestamp": pl.Utf8,
+        "block_number": pl.Int64,
+        "transaction_hash": pl.Utf8,
+        "log_index": pl.Int64,
+        "sqrt_price_x96": pl.Utf8,
+        "tick": pl.Utf8,
+        "to_address": pl.Utf8,
+        "from_address": pl.Utf8,
+        "transaction_index": pl.Int64,
+        "gas_price": pl.Utf8,
+        "gas_used": pl.Utf8,
+        "l1_fee": pl.Utf8,
+    },
+    "nfp": {
+        "name": pl.Utf8,
+        "chain_name": pl.Utf8,
+        "transaction_hash": pl.Utf8,
+        "block_number": pl.Int64,
+        "tx_index": pl.Int64,
+        "from_address": pl.Utf8,
+        "amount": pl.Utf8,
+        "amount0": pl.Utf8,
+        "amount1": pl.Utf8,
+        "tokenId": pl.Utf8,
+        "address": pl.Utf8,
+        "tick_lower": pl.Utf8,
+        "tick_upper": pl.Utf8,
+    },
+}
+
+
+def get_allium_session(retries=5, backoff_factor=1, pool_size=16):
+    """
+    Creates a keep-alive session that retries failed queries with
+    exponential backoff (respecting Retry-After on rate limits)
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["POST"],
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(
+        max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+
+    return session
+
+
+class allium_query(str):
+    """
+    The SQL text of a query with the declared schema of its rows
+
+    Notice: it is still a string, so other connectors and the async adapter
+    pass it through unchanged
+    """
+
+    def __new__(cls, q, schema=None):
+        query = super().__new__(cls, q)
+        query.schema = schema
+        return query
 
 
 class allium:
@@ -7,6 +139,8 @@ class allium:
         self.allium_query_id = allium_query_id
         self.allium_api_key = allium_api_key
 
+        self.session = get_allium_session()
+
     def get_nfp_table(self, chain):
         chain_to_nfp_contract = {
                 'ethereum': '0xc36442b4a4522e871399cd717abdd847ab11fe88'.lower(),
@@ -90,7 +224,8 @@ class allium:
                     t1.fee_details['receipt_gas_used']::varchar as "gas_used",
                     t1.fee_details['receipt_l1_fee']::varchar as "l1_fee"
                 from {allium_chain_name}.dex.uniswap_v3_events t1
-                where 1=1 and t1.event='swap' and t1.liquidity_pool_address='{pool}'
+                where 1=1 and t1.event='swap'
+                {address_filter(table, pool, 't1.liquidity_pool_address', chain)}
             )
             """
 
@@ -125,7 +260,8 @@ class allium:
                     t1.fee_details['receipt_gas_used']::varchar as "gas_used",
                     t1.fee_details['receipt_l1_fee']::varchar as "l1_fee"
                 from {allium_chain_name}.dex.uniswap_v3_events t1
-                where 1=1 and event in ('mint', 'burn') and t1.liquidity_pool_address='{pool}'
+                where 1=1 and event in ('mint', 'burn')
+                {address_filter(table, pool, 't1.liquidity_pool_address', chain)}
             )
             """
 
@@ -201,7 +337,7 @@ class allium:
                             t2.log_index as "core_log_index"
                     from {allium_chain_name}.dex.uniswap_v3_events t2
                     where 1=1 and event in ('mint', 'burn') 
-                    and t2.liquidity_pool_address='{pool}'
+                    {address_filter('pool_mint_burn_events', pool, 't2.liquidity_pool_address', chain)}
                 ) mb
                 on nfp."transaction_hash" == mb."transaction_hash"
                 and nfp."amount" == mb."amount"
@@ -258,8 +394,8 @@ class allium:
         """
         Pull from internal GBQ data lake
         """
-        table, max_block_of_segment, min_block_of_segment, pool, chain = args
-        table = self.get_remote_table(table, pool, chain)
+        table_name, max_block_of_segment, min_block_of_segment, pool, chain = args
+        table = self.get_remote_table(table_name, pool, chain)
 
         q = f"""select * 
             FROM {table}
@@ -268,7 +404,8 @@ class allium:
             AND "block_number" >= {min_block_of_segment}
             """
 
-        return q
+        # the schema travels with the query so execute can decode into typed columns
+        return allium_query(q, ALLIUM_SCHEMA[table_name])
 
     def get_template(self, query_type, *args):
         if query_type == "minMax":
@@ -280,26 +417,46 @@ class allium:
         else:
             raise ValueError("Missing table definition")
 
+    def decode(self, content, schema):
+        """
+        Decode the JSON response straight into typed columns
+        instead of building a python dict per row
+
+        Notice: only the data field is decoded, with the declared schema
+        """
+        response_df = pl.read_json(
+            io.BytesIO(content),
+            schema={"data": pl.List(pl.Struct(schema))},
+        )
+
+        if response_df["data"].list.len().fill_null(0).sum() == 0:
+            return pl.DataFrame()
+
+        return response_df.select(pl.col("data").explode()).unnest("data")
+
     def execute(self, q):
+        schema = getattr(q, "schema", None)
+
         # Send a POST request to the Allium API to execute the query
-        response = requests.post(
+        response = self.session.post(
             f"https://api.allium.so/api/v1/explorer/queries/{self.allium_query_id}/run",
             json={"query_text": q},
             headers={"X-API-Key": self.allium_api_key},
             timeout=240,
         )
+        response.raise_for_status()
 
-        # Parse the JSON response
-        response_json = response.json()
-        data = response_json.get("data")
+        if schema is not None:
+            df = self.decode(response.content, schema)
+        else:
+            # small queries (minMax, findSegment) have no declared schema
+            data = response.json().get("data")
+            df = pl.DataFrame(data) if data else pl.DataFrame()
 
         # Raise an exception if no data is returned
-        if not data:
+        if df.is_empty():
             return pl.DataFrame()
 
-        # Create a DataFrame from the data
-        df = pl.DataFrame(data)
-
         # Rename columns to match expected format
         column_renames = {
             "tick_spacing": "tickSpacing",
@@ -0,0 +1,106 @@
+import asyncio
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+
+
+def is_async_connector(connector):
+    """
+    A connector is async if its execute is a coroutine function
+
+    async connectors implement the same get_template as the sync
+    connectors (see template.py) but with
+        async def execute(self, q) -> pl.DataFrame
+    """
+    return inspect.iscoroutinefunction(getattr(connector, "execute", None))
+
+
+class rate_limiter:
+    """
+    Spaces out the queries to at most rate_limit queries per second
+
+    Notice: rate_limit=None disables the limit
+    """
+
+    def __init__(self, rate_limit=None):
+        self.interval = 1 / rate_limit if rate_limit else 0
+        self.next_at = 0
+        self.lock = None
+        self.loop = None
+
+    async def wait(self):
+        if self.interval == 0:
+            return
+
+        # asyncio primitives are bound to the loop they are first used on
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            self.lock = asyncio.Lock()
+            self.next_at = 0
+
+        async with self.lock:
+            now = loop.time()
+            delay = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class async_connector:
+    """
+    Wraps a connector so many queries can be awaited at once
+
+    1. sync connectors (gbq, allium, connector_template) are executed
+    on a pool of max_concurrency threads
+    2. async connectors are awaited directly
+
+    At most max_concurrency queries run at once and they are started
+    at most rate_limit per second (the limits of the provider)
+
+    Notice: close (or a with block) shuts down the threads
+        with async_connector(connector) as connector:
+            ...
+    """
+
+    def __init__(self, connector, max_concurrency=8, rate_limit=None):
+        self.connector = connector
+        self.max_concurrency = max_concurrency
+        self.limiter = rate_limiter(rate_limit)
+        self.semaphore = None
+        self.loop = None
+
+        # the default executor of asyncio is sized by the cpu count
+        # but queries are waiting on the provider, not the cpu
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    def get_template(self, query_type, *args):
+        return self.connector.get_template(query_type, *args)
+
+    async def execute(self, q):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self.semaphore:
+            await self.limiter.wait()
+
+            if is_async_connector(self.connector):
+                return await self.connector.execute(q)
+
+            return await loop.run_in_executor(
+                self.executor, self.connector.execute, q
+            )
+
+    def close(self):
+        """
+        Shuts down the threads the sync connector is executed on
+        """
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,51 @@
+import polars as pl
+from pathlib import Path
+from ..partitions import POOL_PARTITIONED_TABLES
+
+# the data shipped with the package (the ovm mapping is in mappings)
+PACKAGE_DATA = str(Path(__file__).parent.parent.parent / "data")
+
+
+def ovm1Addresses(pool):
+    """
+    Returns the OVM1 addresses of the pools, the reverse of the
+    OVM1 -> EVM mapping provided by the Optimism team (see readOVM)
+
+    Notice: the pools that did not exist on OVM1 have no address
+    """
+    pools = [pool] if type(pool) == str else pool
+    return (
+        pl.read_csv(f"{PACKAGE_DATA}/mappings/ovm_mapping.csv")
+        .filter(pl.col("newaddress").is_in([address.lower() for address in pools]))
+        .get_column("oldaddress")
+        .to_list()
+    )
+
+
+def address_filter(table, pool, column="address", chain=None):
+    """
+    Returns the sql filter that pushes the pool down to the remote
+
+    pool is either one address or a list of addresses (multi-pool mode),
+    which becomes an IN (...) list
+
+    Notice: only the tables that are pulled per pool are filtered,
+    the others are pulled for the whole chain
+    Notice: the pools are the current optimism addresses, on the ovm1
+    chain they are filtered by their OVM1 addresses
+    """
+    if pool is None or table not in POOL_PARTITIONED_TABLES:
+        return ""
+
+    if chain == "optimism_legacy_ovm1":
+        pool = ovm1Addresses(pool)
+
+        # the pools did not exist on ovm1
+        if len(pool) == 0:
+            return "and 1 = 0"
+
+    if type(pool) == str:
+        return f"and {column} = '{pool}'"
+
+    pools = ", ".join([f"'{address}'" for address in pool])
+    return f"and {column} in ({pools})"
@@ -1,6 +1,7 @@
 import polars as pl
 import os
 from datetime import date, timedelta, datetime, timezone
+from .filters import address_filter
 
 
 def get_gbq_client(proj_id):
@@ -34,14 +35,17 @@ class gbq:
     def minMax(self, *args):
         """
         We want to find the bounds of the remote database
+
+        Notice: pool is one address or a list of addresses
         """
-        table, chain = args
-        table = self.get_remote_table(table)
+        table_name, pool, chain = args
+        table = self.get_remote_table(table_name)
 
         q = f"""select min(block_number) as min_block,
                    max(block_number) as max_block,
                    FROM `{table}`
                    where chain_name = '{chain}'
+                   {address_filter(table_name, pool, chain=chain)}
              """
 
         return q
@@ -51,8 +55,8 @@ class gbq:
         We want to find the smallest block such that we are pulling
         around the tgt_max_rows number of rows from GBQ
         """
-        table, max_block, min_block, chain, tgt_max_rows = args
-        table = self.get_remote_table(table)
+        table_name, max_block, min_block, pool, chain, tgt_max_rows = args
+        table = self.get_remote_table(table_name)
 
         q = f"""select max(block_number)
                 from (
@@ -61,6 +65,7 @@ class gbq:
                         select block_number
                         FROM `{table}`
                         where chain_name = '{chain}'
+                        {address_filter(table_name, pool, chain=chain)}
                         and block_number >= {min_block}
                         and block_number <= {max_block}
                         order by block_timestamp asc
@@ -73,13 +78,17 @@ class gbq:
     def readRemote(self, *args):
         """
         Pull from internal GBQ data lake
+
+        Notice: with a list of pools the rows of every pool are returned
+        and they are split per pool when written (see writeDataset)
         """
-        table, max_block_of_segment, min_block_of_segment, chain = args
-        table = self.get_remote_table(table)
+        table_name, max_block_of_segment, min_block_of_segment, pool, chain = args
+        table = self.get_remote_table(table_name)
 
         q = f"""select * 
             FROM `{table}`
             WHERE chain_name = '{chain}'
+            {address_filter(table_name, pool, chain=chain)}
             AND block_number <= {max_block_of_segment}
             AND block_number >= {min_block_of_segment}
             """
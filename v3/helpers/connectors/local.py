@@ -0,0 +1,199 @@
+import polars as pl
+import sqlite3
+import threading
+from collections import Counter
+from .filters import address_filter
+
+# the tables that can be stored in the local database
+LOCAL_TABLES = [
+    "factory_pool_created",
+    "pool_swap_events",
+    "pool_mint_burn_events",
+    "pool_initialize_events",
+]
+
+# timestamps are stored as text in sqlite
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S%.6f"
+
+
+class local:
+    """
+    Connector backed by a local sqlite database
+
+    The database holds the same tables (and columns) as data/examples,
+    so updates can be ran (and timed) without credentials or a network
+
+    Notice: use load to fill the database from polars dataframes
+    Notice: queries holds the number of queries of each type that ran
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+        # sqlite connections can not be shared between threads
+        self.local = threading.local()
+        self.queries = Counter()
+
+        # the dtypes of the columns of every created table (see dtypes)
+        self.table_dtypes = {}
+
+    def connection(self):
+        if not hasattr(self.local, "connection"):
+            self.local.connection = sqlite3.connect(self.db_path)
+
+        return self.local.connection
+
+    def dtypes(self):
+        """
+        Returns the polars dtype of every column in the database
+
+        Notice: the dtypes of a table are read once, load drops them
+        as it can create the table
+        """
+        dtypes = {}
+        for table in LOCAL_TABLES:
+            if table not in self.table_dtypes:
+                columns = self.connection().execute(f"pragma table_info({table})")
+                self.table_dtypes[table] = {
+                    name: pl.Int64 if sql_type == "INTEGER" else pl.Utf8
+                    for _, name, sql_type, _, _, _ in columns.fetchall()
+                }
+
+            dtypes.update(self.table_dtypes[table])
+
+        return dtypes
+
+    def load(self, df, table):
+        """
+        Appends the dataframe to the table (creating it if needed)
+        """
+        assert table in LOCAL_TABLES, f"Table {table} not recognized"
+
+        df = df.with_columns(
+            [
+                pl.col(name).dt.strftime(TIMESTAMP_FORMAT)
+                if isinstance(dtype, pl.Datetime)
+                else pl.col(name).cast(pl.Int64)
+                for name, dtype in df.schema.items()
+                if isinstance(dtype, pl.Datetime) or dtype in pl.INTEGER_DTYPES
+            ]
+        )
+
+        columns = ", ".join(
+            [
+                f'"{name}" {"INTEGER" if dtype == pl.Int64 else "TEXT"}'
+                for name, dtype in df.schema.items()
+            ]
+        )
+        values = ", ".join(["?"] * df.width)
+
+        connection = self.connection()
+        connection.execute(f"create table if not exists {table} ({columns})")
+        connection.execute(
+            f"create index if not exists {table}_block on {table} (chain_name, block_number)"
+        )
+        connection.executemany(f"insert into {table} values ({values})", df.rows())
+        connection.commit()
+
+        self.table_dtypes.pop(table, None)
+
+    def get_remote_table(self, table):
+        assert table in LOCAL_TABLES, f"Table {table} not recognized"
+
+        return table
+
+    def minMax(self, *args):
+        """
+        We want to find the bounds of the remote database
+        """
+        table_name, pool, chain = args
+        table = self.get_remote_table(table_name)
+
+        # no rows returns an empty dataframe instead of null bounds
+        q = f"""select min_block, max_block
+                from (
+                    select min(block_number) as min_block,
+                        max(block_number) as max_block,
+                        count(*) as n
+                    FROM {table}
+                    where chain_name = '{chain}'
+                    {address_filter(table_name, pool, chain=chain)}
+                )
+                where n > 0
+             """
+
+        return q
+
+    def findSegment(self, *args):
+        """
+        We want to find the smallest block such that we are pulling
+        around the tgt_max_rows number of rows
+        """
+        table_name, max_block, min_block, pool, chain, tgt_max_rows = args
+        table = self.get_remote_table(table_name)
+
+        q = f"""select max(block_number)
+                from (
+                    select block_number
+                    FROM {table}
+                    where chain_name = '{chain}'
+                    {address_filter(table_name, pool, chain=chain)}
+                    and block_number >= {min_block}
+                    and block_number <= {max_block}
+                    order by block_number asc
+                    limit {tgt_max_rows}
+                )
+            """
+
+        return q
+
+    def readRemote(self, *args):
+        """
+        Pull from the local database
+        """
+        table_name, max_block_of_segment, min_block_of_segment, pool, chain = args
+        table = self.get_remote_table(table_name)
+
+        q = f"""select *
+            FROM {table}
+            WHERE chain_name = '{chain}'
+            {address_filter(table_name, pool, chain=chain)}
+            AND block_number <= {max_block_of_segment}
+            AND block_number >= {min_block_of_segment}
+            """
+
+        return q
+
+    def get_template(self, query_type, *args):
+        self.queries[query_type] += 1
+
+        if query_type == "minMax":
+            return self.minMax(*args)
+        elif query_type == "findSegment":
+            return self.findSegment(*args)
+        elif query_type == "read":
+            return self.readRemote(*args)
+        else:
+            raise ValueError("Missing table definition")
+
+    def execute(self, q):
+        cursor = self.connection().execute(q)
+        rows = cursor.fetchall()
+
+        if len(rows) == 0:
+            return pl.DataFrame()
+
+        # columns of the tables get their stored dtype, the rest are inferred
+        dtypes = self.dtypes()
+        schema = [(column[0], dtypes.get(column[0])) for column in cursor.description]
+
+        df = pl.DataFrame(rows, schema=schema, orient="row")
+
+        if "block_timestamp" in df.columns:
+            df = df.with_columns(
+                pl.col("block_timestamp")
+                .str.to_datetime(TIMESTAMP_FORMAT, time_unit="us")
+                .dt.replace_time_zone("UTC")
+            )
+
+        return df
@@ -1,6 +1,7 @@
 import polars as pl
 import os
 from datetime import date, timedelta, datetime, timezone
+from .filters import address_filter
 
 
 class connector_template:
@@ -8,6 +9,9 @@ class connector_template:
     this connector returns the query then executes the query
 
     the return type of the execute needs to be a polars dataframe
+
+    execute can also be a coroutine (async def execute) if the
+    provider has an async client, see async_adapter.py
     """
 
     def __init__(self):
@@ -40,14 +44,19 @@ class connector_template:
 
         # in date_update.py
         return df["max_block"].item(), df["min_block"].item()
+
+        NOTE: pool is one address or a list of addresses (multi-pool mode)
+        filter on it server side for the tables pulled per pool, see
+        filters.address_filter
         """
-        table, chain = args
-        table = self.get_remote_table(table)
+        table_name, pool, chain = args
+        table = self.get_remote_table(table_name)
 
         q = f"""select min(block_number) as min_block,
                    max(block_number) as max_block,
                    FROM `{table}`
                    where chain_name = '{chain}'
+                   {address_filter(table_name, pool, chain=chain)}
              """
 
         return q
@@ -69,8 +78,8 @@ class connector_template:
         # in date_update.py
         return df.item()
         """
-        table, max_block, min_block, chain, tgt_max_rows = args
-        table = self.get_remote_table(table)
+        table_name, max_block, min_block, pool, chain, tgt_max_rows = args
+        table = self.get_remote_table(table_name)
 
         q = f"""select max(block_number)
                 from (
@@ -79,6 +88,7 @@ class connector_template:
                         select block_number
                         FROM `{table}`
                         where chain_name = '{chain}'
+                        {address_filter(table_name, pool, chain=chain)}
                         and block_number >= {min_block}
                         and block_number <= {max_block}
                         order by block_timestamp asc
@@ -102,13 +112,17 @@ class connector_template:
 
         # in date_update.py
         return df
+
+        NOTE: in multi-pool mode the rows of every pool are returned
+        together, they are split per pool when written
         """
-        table, max_block_of_segment, min_block_of_segment, chain = args
-        table = self.get_remote_table(table)
+        table_name, max_block_of_segment, min_block_of_segment, pool, chain = args
+        table = self.get_remote_table(table_name)
 
         q = f"""select * 
             FROM `{table}`
             WHERE chain_name = '{chain}'
+            {address_filter(table_name, pool, chain=chain)}
             AND block_number <= {max_block_of_segment}
             AND block_number >= {min_block_of_segment}
             """
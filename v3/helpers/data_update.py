@@ -1,10 +1,28 @@
 import polars as pl
 import os
 from datetime import date, timedelta, datetime, timezone
-from .connectors import allium, gbq
+from .connectors import allium, gbq, local, async_connector
+from .connectors.filters import PACKAGE_DATA
 from .test_helpers import *
+from .partitions import *
+from .block_index import *
+from .instrumentation import span
+from .schema import *
 from pathlib import Path
 import json
+import shutil
+import threading
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# headers are reserved under a lock when tables are updated concurrently,
+# the next header of every (data_path, table) is kept so the files are only walked once
+WRITE_LOCK = threading.RLock()
+RESERVED_HEADERS = {}
+
+# the ovm1 events are backfilled into optimism at this block (see writeSegment)
+OVM1_BACKFILL_BLOCK = 1
 
 
 # data updating
@@ -35,10 +53,16 @@ def getHeader(table, data_path):
     path = f"{data_path}/{table}"
 
     # this makes the assumption that the files are in the correct directory
-    files = os.listdir(path)
+    # the partitions are nested in chain=/pool= folders so we walk all of them
+    files = [
+        f
+        for _, _, fs in os.walk(path)
+        for f in fs
+        if isDS_Store(f) and f.endswith(".parquet")
+    ]
 
     # split the first index and select the max
-    max_index = [int(f.split("_")[0]) for f in files if isDS_Store(f)]
+    max_index = [int(f.split("_")[0]) for f in files]
 
     # if there is no files or there is nothing in the max_index
     # then we return 0
@@ -48,49 +72,285 @@ def getHeader(table, data_path):
     return max(max_index) + 1
 
 
-def writeDataset(df, table, data_path, max_block_of_segment, min_block_of_segment):
+def reserveHeaders(table, data_path, n):
+    """
+    Reserves n consecutive headers (see getHeader) for files that are
+    about to be written, so concurrent writers never collide on a number
+
+    Notice: only the first reservation of a table walks its files, the next
+    header is then kept in memory (RESERVED_HEADERS)
+    """
+    with WRITE_LOCK:
+        key = (str(data_path), table)
+        if key not in RESERVED_HEADERS:
+            RESERVED_HEADERS[key] = getHeader(table, data_path)
+
+        idx = RESERVED_HEADERS[key]
+        RESERVED_HEADERS[key] = idx + n
+
+    return idx
+
+
+def writeParquet(df, file):
+    """
+    Writes the file under a temporary name and moves it into place, so
+    readers listing the files (e.g. the block index, see buildBlockIndex)
+    never read a file that is still being written
+    """
+    df.write_parquet(f"{file}.tmp")
+    os.replace(f"{file}.tmp", file)
+
+
+def writeDataset(
+    df, table, data_path, max_block_of_segment, min_block_of_segment, partitioned=True
+):
     """
     Writes the given file with the given heuristics to the disk
+
+    Notice: partitioned splits the rows into chain=/pool= folders
+    (see partitions.partitionPath) so readers can prune files
+    Notice: the rows are written in the canonical schema (see schema.canonicalize)
+    unless the table was written before it
     """
-    idx = getHeader(table, data_path)
-    if not df.is_empty():
-        df.write_parquet(
-            f"{data_path}/{table}/{idx}_{min_block_of_segment}_{max_block_of_segment}_{table}.parquet",
+    if df.is_empty():
+        return
+
+    if tableIsCanonical(data_path, table):
+        df = canonicalize(df, table)
+
+    with span("parquet.write", table=table) as s:
+        s.set(df)
+
+        if not partitioned:
+            idx = reserveHeaders(table, data_path, 1)
+            writeParquet(
+                df,
+                f"{data_path}/{table}/{idx}_{min_block_of_segment}_{max_block_of_segment}_{table}.parquet",
+            )
+            return
+
+        columns = partitionColumns(table)
+        partitions = df.partition_by(columns, as_dict=True)
+
+        # every partition gets the next number
+        idx = reserveHeaders(table, data_path, len(partitions))
+
+        for keys, partition in partitions.items():
+            if type(keys) != tuple:
+                keys = (keys,)
+
+            path = partitionPath(data_path, table, *keys)
+            os.makedirs(path, exist_ok=True)
+
+            writeParquet(
+                partition,
+                f"{path}/{idx}_{min_block_of_segment}_{max_block_of_segment}_{table}.parquet",
+            )
+            idx += 1
+
+
+def migrate_tables(data_path, tables):
+    """
+    Moves the flat {table}/*.parquet files into the chain=/pool= partitioned
+    layout that writeDataset writes
+
+    Each file is removed only after its rows were written to the partitions
+    """
+    # support both strings and lists
+    if type(tables) != list:
+        tables = [tables]
+
+    for table in tables:
+        path = f"{data_path}/{table}"
+        if not os.path.exists(path):
+            continue
+
+        for file in sorted(os.listdir(path)):
+            if not file.endswith(".parquet") or not isDS_Store(file):
+                continue
+
+            print(f"Migrating {table}/{file}")
+            df = pl.read_parquet(f"{path}/{file}")
+
+            # keep the segment bounds of the file name
+            _, min_block_of_segment, max_block_of_segment = file.split("_")[:3]
+            writeDataset(df, table, data_path, max_block_of_segment, min_block_of_segment)
+
+            os.remove(f"{path}/{file}")
+
+
+def writeCompactionJournal(path, add, remove, committed):
+    """
+    Writes the journal of a compaction in the partition folder (see
+    partitions.visibleFiles) under a temporary name and moves it into
+    place, so it is replaced in one step
+    """
+    journal = f"{path}/{COMPACTION_JOURNAL}"
+
+    with open(f"{journal}.tmp", "w") as f:
+        json.dump({"committed": committed, "add": add, "remove": remove}, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(f"{journal}.tmp", journal)
+
+
+def recoverCompaction(path):
+    """
+    Finishes or rolls back a compaction of the partition folder that was
+    interrupted, using its journal (see compactPartition)
+
+    A committed compaction removes the files it replaced,
+    otherwise the files it was adding are removed
+
+    Returns True if there was a compaction to recover
+    """
+    journal = readCompactionJournal(path)
+    if journal is None:
+        return False
+
+    names = journal["remove"] if journal["committed"] else journal["add"]
+    for name in names:
+        if os.path.exists(f"{path}/{name}"):
+            os.remove(f"{path}/{name}")
+
+    os.remove(f"{path}/{COMPACTION_JOURNAL}")
+
+    return True
+
+
+def compactPartition(path, table, data_path, target_rows, row_group_size):
+    """
+    Merges the small segment files in one partition folder into files of
+    about target_rows rows, sorted by chain/address/block/transaction/log
+
+    The swap is journaled (see partitions.visibleFiles), readers do not see
+    the merged files until the journal is committed and do not see the
+    segments after, so the rows are never missing or duplicated.
+    A compaction that was interrupted is finished or rolled back first
+    (see recoverCompaction)
+    """
+    if recoverCompaction(path):
+        print(f"Recovered an interrupted compaction of {path}")
+
+    files = sorted(
+        f"{path}/{f}"
+        for f in os.listdir(path)
+        if f.endswith(".parquet") and isDS_Store(f)
+    )
+
+    # the large files are already compacted
+    rows = {
+        f: pl.scan_parquet(f, hive_partitioning=False).select(pl.count()).collect().item()
+        for f in files
+    }
+    small = [f for f in files if rows[f] < target_rows]
+
+    if len(small) <= 1:
+        return 0
+
+    ordering = ["chain_name", "address", "block_number", "transaction_index", "log_index"]
+
+    df = pl.scan_parquet(small, hive_partitioning=False).collect()
+    df = df.sort([c for c in ordering if c in df.columns])
+
+    # numbering continues after every existing file
+    n_files = (df.shape[0] + target_rows - 1) // target_rows
+    idx = reserveHeaders(table, data_path, n_files)
+
+    chunks = {}
+    for offset in range(0, df.shape[0], target_rows):
+        chunk = df.slice(offset, target_rows)
+
+        min_block = chunk["block_number"].min()
+        max_block = chunk["block_number"].max()
+        chunks[f"{idx}_{min_block}_{max_block}_{table}.parquet"] = chunk
+        idx += 1
+
+    add = list(chunks.keys())
+    remove = [os.path.basename(f) for f in small]
+
+    # hide the merged files while they are written
+    writeCompactionJournal(path, add, remove, committed=False)
+
+    for name, chunk in chunks.items():
+        chunk.write_parquet(
+            f"{path}/{name}", row_group_size=row_group_size, statistics=True
+        )
+
+        # the files are on disk before the journal commits them
+        fd = os.open(f"{path}/{name}", os.O_RDONLY)
+        os.fsync(fd)
+        os.close(fd)
+
+    # the commit, from here the segments are hidden instead
+    writeCompactionJournal(path, add, remove, committed=True)
+
+    recoverCompaction(path)
+
+    return len(small)
+
+
+def compact_tables(pool, tables, target_rows=2_000_000, row_group_size=100_000):
+    """
+    Compacts the many small segment files that incremental updates write
+    for the pool into large sorted files (see compactPartition)
+
+    Notice: tables that are partitioned by pool are compacted for the pool,
+    the other tables are compacted for the whole chain
+    """
+    # support both strings and lists
+    if type(tables) != list:
+        tables = [tables]
+
+    for table in tables:
+        path = partitionPath(pool.data_path, table, pool.chain, pool.pool)
+        if not os.path.exists(path):
+            print(f"No partitioned data for {table} - see migrate_tables")
+            continue
+
+        merged = compactPartition(
+            path, table, pool.data_path, target_rows, row_group_size
         )
+        print(f"Compacted {merged} files of {table}")
 
 
-def readRemote(
+async def readRemote(
     table, connector, max_block_of_segment, min_block_of_segment, pool, chain
 ):
     """
     Read the raw dataframe from remote
+
+    Notice: connector is an async connector (see async_connector)
     """
 
     q = connector.get_template(
         "read", table, max_block_of_segment, min_block_of_segment, pool, chain
     )
-    df = connector.execute(q)
+    with span("connector.read", table=table) as s:
+        df = await connector.execute(q)
+        s.set(df)
 
     return df
 
 
-def checkGlobalMinMaxBlock(table, connector, pool, chain):
+async def checkGlobalMinMaxBlock(table, connector, pool, chain):
     """
     Find the max and min row in the database to pull over
     """
 
     # read the first entry
     q = connector.get_template("minMax", table, pool, chain)
-    df = connector.execute(q)
+    with span("connector.minMax", table=table):
+        df = await connector.execute(q)
 
-    print(df)
     if not df.is_empty():
         return df["max_block"].item(), df["min_block"].item()
     else:
         return -1, -1
 
 
-def findSegment(table, connector, max_block, min_block, pool, chain, tgt_max_rows):
+async def findSegment(table, connector, max_block, min_block, pool, chain, tgt_max_rows):
     """
     We want to find the smallest block such that we are pulling
     around the tgt_max_rows number of rows from GBQ
@@ -99,7 +359,8 @@ def findSegment(table, connector, max_block, min_block, pool, chain, tgt_max_row
     q = connector.get_template(
         "findSegment", table, max_block, min_block, pool, chain, tgt_max_rows
     )
-    df = connector.execute(q)
+    with span("connector.findSegment", table=table):
+        df = await connector.execute(q)
 
     return df.item() - 1
 
@@ -121,181 +382,490 @@ def readOVM(path, data_type):
     return mappings
 
 
-def _update_tables(pool, tables=[], test_mode=False):
-    if test_mode:
-        check_test_mode(pool)
-        pool.data_path = f"{pool.data_path}/test"
-        checkPath("", pool.data_path)
+def writeSegment(df, table, data_path, chain, max_block_of_segment, min_block_of_segment):
+    """
+    Saves down a segment pulled from remote and keeps the block index updated
+    """
+    writeDataset(
+        df,
+        table,
+        data_path,
+        max_block_of_segment,
+        min_block_of_segment,
+    )
+    if table in BLOCK_INDEX_TABLES:
+        with WRITE_LOCK:
+            updateBlockIndex(df, data_path)
+
+    # we need the ovm1 state for the current optimism
+    # so we read that state in and then we dump it as it happened
+    # in the genesis block
+    if chain == "optimism_legacy_ovm1":
+        # back fill and block_timestamp, block_number, and chain
+        mapping = readOVM(PACKAGE_DATA, "mappings")
+
+        df = (
+            df.with_columns(
+                block_number=OVM1_BACKFILL_BLOCK,
+                # https://optimistic.etherscan.io/block/1
+                block_timestamp=datetime(
+                    year=2021,
+                    month=11,
+                    day=11,
+                    hour=21,
+                    minute=16,
+                    second=39,
+                    tzinfo=timezone.utc,
+                ),
+                chain_name=pl.lit("optimism"),
+            )
+            # it defaults to int32 and we want 64
+            .cast({"block_number": pl.Int64})
+        )
 
-        for p in Path(pool.data_path).iterdir():
-            if not p.is_dir():
-                continue
-            for x in p.iterdir():
-                x.unlink(missing_ok=True)
+        if table in [
+            "pool_swap_events",
+            "pool_mint_burn_events",
+            "pool_initialize_events",
+        ]:
+            df = df.with_columns(
+                # ovm changed contract addresses from ovm1 to ovm2
+                # we map this back for us
+                address=pl.col("address").map_dict(mapping, default=None)
+            )
 
-        # 1000th swap on mainnet happened at this block
-        max_block = 12376625
+        elif table in ["factory_pool_created"]:
+            df = df.with_columns(
+                # ovm changed contract addresses from ovm1 to ovm2
+                # we map this back for us
+                pool=pl.col("pool").map_dict(mapping, default=None)
+            )
 
-    if tables == [] or test_mode:
-        tables = pool.tables
+        # we index the optimism chain by backloading all the ovm1 data as optimism at block 0
+        writeDataset(df, table, data_path, 0, 0)
 
-    for table in tables:
-        print(f"Starting table {table}")
-        checkPath(table, pool.data_path)
 
-        # max row in gbq and min row in remote
-        max_block, min_block_of_segment = checkGlobalMinMaxBlock(
-            table, pool.connector, pool.pool, pool.chain
+def resumeBlock(data_path, table, chain, address, min_block_of_segment, test_mode=False):
+    """
+    Returns the block to start pulling from
+
+    If we already have data for the chain (and pool when address is given),
+    we only append the blocks after the last block we have
+
+    Notice: address is None for the tables we pull for the whole chain
+    """
+    # check if we already have data
+    header = getHeader(table, data_path)
+    if header == 0:
+        return min_block_of_segment
+
+    # we pull all data on factory_pool_created - so we override the filter to be true
+    optimistic_address_filter = True
+    if address is not None:
+        optimistic_address_filter = pl.col("address") == address
+
+    # the ovm1 backfill is not optimism data, optimism resumes after its own blocks
+    if chain == "optimism":
+        optimistic_address_filter = optimistic_address_filter & (
+            pl.col("block_number") > OVM1_BACKFILL_BLOCK
         )
 
-        if max_block == -1:
-            print(f"Failed to find table for {table}")
-            continue
+    found_min_block_of_segment = None
+    if len(tableFiles(data_path, table, chain, address)) != 0:
+        found_min_block_of_segment = (
+            scanTable(data_path, table, chain, address)
+            .filter((pl.col("chain_name") == chain) & (optimistic_address_filter))
+            .select("block_number")
+            .max()
+            .collect()
+            .item()
+        )
+    # we may have data but it is for a diff chain
+    if found_min_block_of_segment != None:
+        assert not test_mode, "Found loaded test folder"
+        min_block_of_segment = found_min_block_of_segment + 1
 
-        print(f"Found {min_block_of_segment} to {max_block}")
+        print(f"Found data - Updated {table} on {chain} to start at {min_block_of_segment}")
 
-        if test_mode:
-            check_min_segment(min_block_of_segment, table)
-            print(f"Check remote max for table {table} is {max_block}")
-            max_block = 12376625
+    return min_block_of_segment
 
-        # check if we already have data
-        header = getHeader(table, pool.data_path)
-        # we already have existing data, so lets get the bn to only append new stuff
-        if header != 0:
 
-            # we pull all data on factory_pool_created - so we override the filter to be true
-            optimistic_address_filter = True
-            if table in ["pool_swap_events", "pool_mint_burn_events"]:
-                optimistic_address_filter = pl.col("address") == pool.pool
+def ovm1Backfilled(data_path, table, address):
+    """
+    Returns whether the ovm1 events of the pool (or of the chain, when
+    address is None) are already backfilled into optimism
 
-            found_min_block_of_segment = (
-                pl.scan_parquet(f"{pool.data_path}/{table}/*.parquet")
-                .filter(
-                    (pl.col("chain_name") == pool.chain) & (optimistic_address_filter)
-                )
-                .select("block_number")
-                .max()
-                .collect()
-                .item()
+    Notice: the backfill of a table is written at once (see _update_table),
+    so any backfilled row means the backfill is complete
+    """
+    if len(tableFiles(data_path, table, "optimism", address)) == 0:
+        return False
+
+    backfilled = (pl.col("chain_name") == "optimism") & (
+        pl.col("block_number") == OVM1_BACKFILL_BLOCK
+    )
+    if address is not None:
+        backfilled = backfilled & (pl.col("address") == address)
+
+    return not (
+        scanTable(data_path, table, "optimism", address)
+        .filter(backfilled)
+        .select("block_number")
+        .head(1)
+        .collect()
+        .is_empty()
+    )
+
+
+def jobLanes(jobs):
+    """
+    Groups the update jobs, tuples that end with the chain, into lanes
+    whose jobs run one after the other (the lanes can run concurrently)
+
+    The ovm1 job of a table is in the lane of the optimism job of the
+    same table, and runs first. It backfills the optimism partition at
+    OVM1_BACKFILL_BLOCK, so it never races the optimism writes and resume check
+    """
+    lanes = {}
+    for job in jobs:
+        *rest, chain = job
+        if chain == "optimism_legacy_ovm1":
+            chain = "optimism"
+
+        # multi-pool jobs hold a list of pools
+        key = tuple(tuple(x) if type(x) == list else x for x in rest) + (chain,)
+        lanes.setdefault(key, []).append(job)
+
+    return [
+        sorted(lane, key=lambda job: job[-1] != "optimism_legacy_ovm1")
+        for lane in lanes.values()
+    ]
+
+
+async def _update_table(
+    connector,
+    data_path,
+    table,
+    address,
+    chain,
+    tgt_max_rows,
+    read_ahead,
+    test_mode=False,
+):
+    """
+    Pulls every new segment of one table on one chain as a pipeline
+
+    1. the segment bounds are planned one after the other (see findSegment)
+    2. up to read_ahead segments are read from remote at once
+    3. the finished segments are written in block order
+
+    This overlaps findSegment, readRemote and writeDataset so pulling
+    is bound by the throughput of the connector
+
+    Notice: connector is an async connector, sync connectors are wrapped
+    in an async_connector (see _update_tables and update_pools)
+    Notice: address is a list of pools in multi-pool mode, every pool
+    resumes from its own last block
+    Notice: ovm1 is frozen, its pools are pulled whole until they are
+    backfilled into optimism and the backfill is written at once
+
+    Returns the number of segments that were pulled
+    """
+    if chain == "optimism_legacy_ovm1":
+        # the tables pulled for the whole chain are backfilled as a whole
+        pending = [address] if type(address) == str else address
+        if table not in POOL_PARTITIONED_TABLES:
+            pending = [None]
+
+        pending = [
+            pool
+            for pool in pending
+            if not await asyncio.to_thread(ovm1Backfilled, data_path, table, pool)
+        ]
+        if len(pending) == 0:
+            print(f"Already backfilled {table} from {chain}")
+            return 0
+
+        if table in POOL_PARTITIONED_TABLES and type(address) != str:
+            address = pending
+
+    pools = address if type(address) == str else f"{len(address)} pools"
+    print(f"Starting table {table} on {chain} for {pools}")
+
+    # max row in gbq and min row in remote
+    max_block, min_block_of_segment = await checkGlobalMinMaxBlock(
+        table, connector, address, chain
+    )
+
+    if max_block == -1:
+        print(f"Failed to find table for {table} on {chain}")
+        return 0
+
+    print(f"Found {min_block_of_segment} to {max_block} for {table} on {chain}")
+
+    if test_mode:
+        check_min_segment(min_block_of_segment, table)
+        print(f"Check remote max for table {table} is {max_block}")
+        # 1000th swap on mainnet happened at this block
+        max_block = 12376625
+
+    # the block each pool resumes from
+    resume = {}
+    if chain == "optimism_legacy_ovm1":
+        # the pools left to backfill are pulled from the start
+        pass
+    elif table not in POOL_PARTITIONED_TABLES:
+        min_block_of_segment = await asyncio.to_thread(
+            resumeBlock, data_path, table, chain, None, min_block_of_segment, test_mode
+        )
+    else:
+        for pool in [address] if type(address) == str else address:
+            resume[pool] = await asyncio.to_thread(
+                resumeBlock,
+                data_path,
+                table,
+                chain,
+                pool,
+                min_block_of_segment,
+                test_mode,
             )
-            # we may have data but it is for a diff chain
-            if found_min_block_of_segment == None:
-                pass
-            else:
-                assert not test_mode, "Found loaded test folder"
-                min_block_of_segment = found_min_block_of_segment + 1
+        min_block_of_segment = min(resume.values())
+
+    iterations = 0
+    in_flight = deque()
+    backfill = []
+
+    async def drain():
+        """
+        Waits on the oldest read and writes it
+        Returns False once a segment came back empty
+        """
+        (min_block, max_block), read = in_flight.popleft()
+        df = await read
+
+        # if there was no data, `df` will be empty
+        if df.is_empty():
+            print(f"No data found for {min_block} to {max_block}")
+            return False
+
+        # drop the rows of the pools that already have the blocks
+        if len(resume) > 1:
+            resume_df = pl.DataFrame(
+                {"address": list(resume.keys()), "resume_block": list(resume.values())}
+            )
+            df = (
+                df.join(resume_df, on="address", how="left")
+                .filter(pl.col("block_number") >= pl.col("resume_block"))
+                .drop("resume_block")
+            )
+            if df.is_empty():
+                return True
 
-            print(f"Found data - Updated to {min_block_of_segment} to {max_block}")
+        # a partial backfill would look complete (see ovm1Backfilled)
+        if chain == "optimism_legacy_ovm1":
+            backfill.append((df, min_block, max_block))
+            return True
 
-        iterations = 0
-        while max_block > min_block_of_segment:
-            iterations += 1
+        # save it down
+        await asyncio.to_thread(
+            writeSegment, df, table, data_path, chain, max_block, min_block
+        )
+        return True
 
-            print(f"Starting at {min_block_of_segment}")
+    running = True
+    try:
+        while running and max_block > min_block_of_segment:
             # the finds the max block of the segment
             # which is the max block that returns close to the target amount of rows to pull from gbq
-            max_block_of_segment = findSegment(
+            max_block_of_segment = await findSegment(
                 table,
-                pool.connector,
+                connector,
                 max_block,
                 min_block_of_segment,
-                pool.pool,
-                pool.chain,
-                pool.tgt_max_rows,
+                address,
+                chain,
+                tgt_max_rows,
             )
 
-            print(f"Going from {min_block_of_segment} to {max_block_of_segment}")
+            # keep at most read_ahead reads in flight
+            while running and len(in_flight) >= read_ahead:
+                running = await drain()
+
+            if not running:
+                break
+
+            print(f"Going from {min_block_of_segment} to {max_block_of_segment} for {table} on {chain}")
+            iterations += 1
+
             # read that segment in from remote
-            df = readRemote(
-                table,
-                pool.connector,
-                max_block_of_segment,
-                min_block_of_segment,
-                pool.pool,
-                pool.chain,
+            in_flight.append(
+                (
+                    (min_block_of_segment, max_block_of_segment),
+                    asyncio.create_task(
+                        readRemote(
+                            table,
+                            connector,
+                            max_block_of_segment,
+                            min_block_of_segment,
+                            address,
+                            chain,
+                        )
+                    ),
+                )
             )
 
-            # if there was no data, `df` will be empty
-            if df.is_empty():
-                print(
-                    f"No data found for {min_block_of_segment} to {max_block_of_segment}"
-                )
+            # if the segment is empty, the read is empty and the pipeline stops
+            if test_mode or max_block_of_segment < min_block_of_segment:
                 break
 
-            # save it down
-            writeDataset(
-                df,
+            # this moves the iteration, we pulled all of block n, so we want to start at n+1
+            min_block_of_segment = max_block_of_segment + 1
+
+        while running and len(in_flight) != 0:
+            running = await drain()
+
+        # the last block is left to the next update, but ovm1 is not pulled again
+        if chain == "optimism_legacy_ovm1" and running and max_block >= min_block_of_segment:
+            df = await readRemote(
+                table, connector, max_block, min_block_of_segment, address, chain
+            )
+            if not df.is_empty():
+                backfill.append((df, min_block_of_segment, max_block))
+
+    finally:
+        # the reads after an empty segment (or a failure) are not needed
+        for _, read in in_flight:
+            read.cancel()
+
+    if len(backfill) != 0:
+        await asyncio.to_thread(
+            writeSegment,
+            pl.concat([df for df, _, _ in backfill], how="vertical_relaxed"),
+            table,
+            data_path,
+            chain,
+            backfill[-1][2],
+            backfill[0][1],
+        )
+
+    if iterations == 0:
+        print(f"Nothing to update for {table} on {chain}")
+
+    return iterations
+
+
+async def _update_pools(
+    connector,
+    data_path,
+    jobs,
+    tgt_max_rows,
+    read_ahead,
+    test_mode=False,
+    workers=None,
+):
+    """
+    Runs the (table, address, chain) jobs, the lanes of jobs (see jobLanes)
+    run concurrently and at most workers lanes at once (None is no limit)
+
+    Notice: the connector limits how many queries are in flight
+    """
+    semaphore = asyncio.Semaphore(workers) if workers else None
+
+    async def updateLane(lane):
+        for table, address, chain in lane:
+            await _update_table(
+                connector,
+                data_path,
                 table,
-                pool.data_path,
-                max_block_of_segment,
-                min_block_of_segment,
+                address,
+                chain,
+                tgt_max_rows,
+                read_ahead,
+                test_mode,
             )
 
-            # we need the ovm1 state for the current optimism
-            # so we read that state in and then we dump it as it happened
-            # in the genesis block
-            if pool.chain == "optimism_legacy_ovm1":
-                # back fill and block_timestamp, block_number, and chain
-                mapping = readOVM("data", "mappings")
-
-                df = (
-                    df.with_columns(
-                        block_number=1,
-                        # https://optimistic.etherscan.io/block/1
-                        block_timestamp=datetime(
-                            year=2021,
-                            month=11,
-                            day=11,
-                            hour=21,
-                            minute=16,
-                            second=39,
-                            tzinfo=timezone.utc,
-                        ),
-                        chain_name=pl.lit("optimism"),
-                    )
-                    # it defaults to int32 and we want 64
-                    .cast({"block_number": pl.Int64})
-                )
+    async def limitedLane(lane):
+        if semaphore is None:
+            return await updateLane(lane)
 
-                if table in [
-                    "pool_swap_events",
-                    "pool_mint_burn_events",
-                    "pool_initialize_events",
-                ]:
-                    df = df.with_columns(
-                        # ovm changed contract addresses from ovm1 to ovm2
-                        # we map this back for us
-                        address=pl.col("address").map_dict(mapping, default=None)
-                    )
-
-                elif table in ["factory_pool_created"]:
-                    df = df.with_columns(
-                        # ovm changed contract addresses from ovm1 to ovm2
-                        # we map this back for us
-                        pool=pl.col("pool").map_dict(mapping, default=None)
-                    )
-
-                # we index the optimism chain by backloading all the ovm1 data as optimism at block 0
-                writeDataset(df, table, pool.data_path, 0, 0)
+        async with semaphore:
+            return await updateLane(lane)
 
-            # this moves the iteration, we pulled all of block n, so we want to start at n+1
-            if not df.is_empty():
-                min_block_of_segment = df.select("block_number").max().item() + 1
-            else:
-                # if we didn't pull anything, it may still be fine
-                # this is likely because no data exists in the pulled sample
-                # the failure moat should be captured by the connectors
-                min_block_of_segment = max_block_of_segment + 1
+    await asyncio.gather(*[limitedLane(lane) for lane in jobLanes(jobs)])
 
-            if test_mode:
-                break
 
-        if iterations == 0:
-            print("Nothing to update")
+def runAsync(coroutine):
+    """
+    Runs the coroutine to completion from sync code
+
+    Notice: inside a running event loop (e.g. a notebook) the coroutine
+    is ran on its own event loop on a separate thread
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+def _update_tables(pool, tables=[], test_mode=False, chains=None, workers=1):
+    """
+    Updates every table on every chain
+
+    The tables are pulled by the same pipeline as update_pools (see
+    _update_table), the sync connectors are ran on threads
+
+    Notice: workers > 1 pulls the (table, chain) pairs concurrently,
+    which overlaps the time spent waiting on remote queries
+    """
+    if test_mode:
+        check_test_mode(pool)
+        pool.data_path = f"{pool.data_path}/test"
+        checkPath("", pool.data_path)
+
+        for p in Path(pool.data_path).iterdir():
+            if not p.is_dir():
+                continue
+            for x in p.iterdir():
+                if x.is_dir():
+                    shutil.rmtree(x)
+                else:
+                    x.unlink(missing_ok=True)
+
+    if tables == [] or test_mode:
+        tables = pool.tables
+
+    if chains is None:
+        chains = [pool.chain]
+
+    # create the folders up front so the workers do not race on them
+    for table in tables:
+        checkPath(table, pool.data_path)
+
+    jobs = [(table, pool.pool, chain) for chain in chains for table in tables]
+    workers = max(workers, 1)
+
+    # every worker keeps read_ahead reads in flight
+    with async_connector(pool.connector, workers * pool.read_ahead) as connector:
+        runAsync(
+            _update_pools(
+                connector,
+                pool.data_path,
+                jobs,
+                pool.tgt_max_rows,
+                pool.read_ahead,
+                test_mode,
+                workers,
+            )
+        )
 
 
-def update_tables(pool, update_from, tables=[], test_mode=False):
+def getConnector(update_from, tgt_max_rows):
+    """
+    Creates the connector of the data source
+    """
     if update_from == "gcp":
         gcp_locked = True
         try:
@@ -307,12 +877,11 @@ def update_tables(pool, update_from, tables=[], test_mode=False):
                 "GCP could not be imported. If you want to use another source (such as allium), set update_from to the desired source e.g. 'allium'"
             )
 
-        pool.connector = gbq()
-        _update_tables(pool, tables, test_mode)
+        return gbq()
 
     elif update_from == "allium":
         assert (
-            pool.tgt_max_rows <= 200_000
+            tgt_max_rows <= 200_000
         ), "Attempting to pull too many rows (>200k), set tgt_max_rows to less than 100k rows"
 
         allium_query_id = os.getenv("ALLIUM_POLARSV3_QUERY_ID")
@@ -322,11 +891,106 @@ def update_tables(pool, update_from, tables=[], test_mode=False):
             allium_query_id and allium_api_key
         ), "Please set ALLIUM_POLARSV3_QUERY_ID and ALLIUM_POLARSV3_API_KEY environment variables"
 
-        pool.connector = allium(allium_query_id, allium_api_key)
-        _update_tables(pool, tables, test_mode)
+        return allium(allium_query_id, allium_api_key)
+
+    elif update_from == "local":
+        db_path = os.getenv("POLARSV3_LOCAL_DB")
+
+        assert db_path and os.path.exists(
+            db_path
+        ), "Please set POLARSV3_LOCAL_DB to the path of the local sqlite database"
+
+        return local(db_path)
 
     elif update_from == "cryo":
         raise NotImplementedError("sad")
-        # _update_tables(pool, tables, test_mode)
     else:
         raise NotImplementedError("Data puller not implemented")
+
+
+def update_tables(pool, update_from, tables=[], test_mode=False, chains=None, workers=1):
+    pool.connector = getConnector(update_from, pool.tgt_max_rows)
+    _update_tables(pool, tables, test_mode, chains, workers)
+
+
+def update_pools(
+    pools,
+    update_from,
+    tables=[],
+    data_path=None,
+    tgt_max_rows=200_000,
+    read_ahead=4,
+    max_concurrency=16,
+    rate_limit=None,
+    multi_pool=False,
+):
+    """
+    Updates the tables of many pools at once
+
+    pools is a list of (pool address, chain)
+
+    All the minMax/findSegment/read queries of every pool are run
+    concurrently through an async_connector, so pulling 50 pools
+    is bound by the provider and not by 50 sequential updates
+
+    Notice: max_concurrency is the max number of queries in flight
+    Notice: rate_limit is the max number of queries started per second
+    Notice: factory_pool_created and pool_initialize_events are pulled for
+    the whole chain, so they are pulled once per chain
+    Notice: multi_pool pulls the pools of a chain together in one query
+    per segment (address IN (...)), the rows are split per pool on write
+    Notice: the pools can then be created with v3Pool(..., update=False)
+    """
+    if data_path is None:
+        data_path = str((Path(__file__).parent.parent / "data").resolve())
+
+    if tables == []:
+        tables = [
+            "factory_pool_created",
+            "pool_initialize_events",
+            "pool_swap_events",
+            "pool_mint_burn_events",
+        ]
+
+    connector = getConnector(update_from, tgt_max_rows)
+
+    # create the folders up front so the jobs do not race on them
+    checkPath("", data_path)
+    for table in tables:
+        checkPath(table, data_path)
+
+    jobs = []
+    pulled = set()
+    for address, chain in pools:
+        address = address.lower()
+
+        chains = [chain]
+        if chain == "optimism":
+            # the ovm1 = optimism, but they are in seperate databases
+            chains.append("optimism_legacy_ovm1")
+
+        for chain in chains:
+            for table in tables:
+                # the chain tables are the same for every pool on the chain
+                key = (table, chain)
+                if table in POOL_PARTITIONED_TABLES:
+                    key = (table, chain, address)
+
+                if key not in pulled:
+                    pulled.add(key)
+                    jobs.append((table, address, chain))
+
+    if multi_pool:
+        # one job per table and chain with the list of pools
+        merged = {}
+        for table, address, chain in jobs:
+            if table in POOL_PARTITIONED_TABLES:
+                merged.setdefault((table, chain), []).append(address)
+            else:
+                merged[(table, chain)] = address
+
+        jobs = [(table, address, chain) for (table, chain), address in merged.items()]
+
+    print(f"Updating {len(pools)} pools with {len(jobs)} table pulls")
+    with async_connector(connector, max_concurrency, rate_limit) as connector:
+        runAsync(_update_pools(connector, data_path, jobs, tgt_max_rows, read_ahead))
@@ -0,0 +1,262 @@
+import polars as pl
+import time
+import threading
+import functools
+from collections import deque
+
+# the active collector, None when instrumentation is disabled
+_COLLECTOR = None
+
+
+class spanCollector:
+    """
+    Collects timing spans and aggregates them per span name and labels
+
+    Every span records its duration and, when it produced a dataframe,
+    its rows and (estimated) bytes
+
+    Notice: the last keep_spans spans are kept as is in spans
+    """
+
+    def __init__(self, keep_spans=10_000):
+        self.lock = threading.Lock()
+        self.aggregates = {}
+        self.spans = deque(maxlen=keep_spans)
+
+    def record(self, name, labels, start, seconds, rows, size, error):
+        key = (name, tuple(sorted(labels.items())))
+
+        with self.lock:
+            aggregate = self.aggregates.get(key)
+            if aggregate is None:
+                aggregate = {
+                    "count": 0,
+                    "errors": 0,
+                    "seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "rows": 0,
+                    "bytes": 0,
+                }
+                self.aggregates[key] = aggregate
+
+            aggregate["count"] += 1
+            aggregate["errors"] += int(error)
+            aggregate["seconds"] += seconds
+            aggregate["max_seconds"] = max(aggregate["max_seconds"], seconds)
+            aggregate["rows"] += rows or 0
+            aggregate["bytes"] += size or 0
+
+            self.spans.append(
+                {
+                    "name": name,
+                    **labels,
+                    "start": start,
+                    "seconds": seconds,
+                    "rows": rows,
+                    "bytes": size,
+                    "error": error,
+                }
+            )
+
+    def clear(self):
+        with self.lock:
+            self.aggregates = {}
+            self.spans.clear()
+
+    def stats(self):
+        """
+        Returns the aggregates as a dict keyed by name{label=value,...}
+        """
+        with self.lock:
+            return {
+                spanKey(name, labels): {
+                    **aggregate,
+                    "mean_seconds": aggregate["seconds"] / aggregate["count"],
+                }
+                for (name, labels), aggregate in self.aggregates.items()
+            }
+
+    def prometheus(self, prefix="v3"):
+        """
+        Returns the aggregates in the Prometheus text exposition format
+        """
+        metrics = {
+            "count": ("span_count_total", "counter"),
+            "errors": ("span_errors_total", "counter"),
+            "seconds": ("span_seconds_total", "counter"),
+            "max_seconds": ("span_seconds_max", "gauge"),
+            "rows": ("span_rows_total", "counter"),
+            "bytes": ("span_bytes_total", "counter"),
+        }
+
+        with self.lock:
+            aggregates = list(self.aggregates.items())
+
+        lines = []
+        for field, (metric, metric_type) in metrics.items():
+            lines.append(f"# TYPE {prefix}_{metric} {metric_type}")
+            for (name, labels), aggregate in aggregates:
+                tags = ",".join(
+                    [f'span="{labelValue(name)}"']
+                    + [f'{k}="{labelValue(v)}"' for k, v in labels]
+                )
+                lines.append(f"{prefix}_{metric}{{{tags}}} {aggregate[field]}")
+
+        return "\n".join(lines) + "\n"
+
+    def frame(self):
+        """
+        Returns the kept spans as a polars dataframe
+        """
+        with self.lock:
+            return pl.DataFrame(list(self.spans), infer_schema_length=None)
+
+
+def labelValue(value):
+    """
+    Escapes a label value for the Prometheus text format
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def spanKey(name, labels):
+    if len(labels) == 0:
+        return name
+
+    return f"{name}{{{','.join([f'{k}={v}' for k, v in labels])}}}"
+
+
+class activeSpan:
+    """
+    Times the block and records it in the collector on exit
+    """
+
+    __slots__ = ("collector", "name", "labels", "start", "t", "rows", "size")
+
+    def __init__(self, collector, name, labels):
+        self.collector = collector
+        self.name = name
+        self.labels = labels
+        self.rows = None
+        self.size = None
+
+    def __enter__(self):
+        self.start = time.time()
+        self.t = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.collector.record(
+            self.name,
+            self.labels,
+            self.start,
+            time.perf_counter() - self.t,
+            self.rows,
+            self.size,
+            exc_type is not None,
+        )
+        return False
+
+    def set(self, result=None, rows=None, size=None):
+        """
+        Records the rows/bytes of the result (if it is a dataframe)
+        """
+        if isinstance(result, pl.DataFrame):
+            rows = len(result)
+            size = result.estimated_size()
+
+        if rows is not None:
+            self.rows = rows
+        if size is not None:
+            self.size = size
+
+
+class nullSpan:
+    """
+    The span used when instrumentation is disabled, does nothing
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, result=None, rows=None, size=None):
+        pass
+
+
+NULL_SPAN = nullSpan()
+
+
+def span(name, **labels):
+    """
+    Times a block of code
+
+    with span("connector.read", table=table) as s:
+        df = connector.execute(q)
+        s.set(df)
+
+    Notice: when instrumentation is disabled this returns a shared no-op span
+    """
+    collector = _COLLECTOR
+    if collector is None:
+        return NULL_SPAN
+
+    return activeSpan(collector, name, labels)
+
+
+def instrumented(name):
+    """
+    Decorator that times every call of the function as a span
+    (with the rows/bytes of the result if it is a dataframe)
+
+    Notice: when instrumentation is disabled the function is called directly
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            collector = _COLLECTOR
+            if collector is None:
+                return fn(*args, **kwargs)
+
+            with activeSpan(collector, name, {}) as s:
+                result = fn(*args, **kwargs)
+                s.set(result)
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def enableInstrumentation(keep_spans=10_000):
+    """
+    Starts collecting spans and returns the collector
+
+    Notice: instrumentation is process wide and disabled by default
+    """
+    global _COLLECTOR
+    _COLLECTOR = spanCollector(keep_spans)
+
+    return _COLLECTOR
+
+
+def disableInstrumentation():
+    """
+    Stops collecting spans and returns the last collector
+    """
+    global _COLLECTOR
+    collector, _COLLECTOR = _COLLECTOR, None
+
+    return collector
+
+
+def getCollector():
+    """
+    Returns the active collector (None when disabled)
+    """
+    return _COLLECTOR
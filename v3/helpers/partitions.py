@@ -0,0 +1,126 @@
+import polars as pl
+from glob import glob
+import json
+import os
+
+# these tables are pulled per pool, so they are partitioned by chain and pool
+# everything else is pulled for the whole chain and is only partitioned by chain
+POOL_PARTITIONED_TABLES = ["pool_swap_events", "pool_mint_burn_events"]
+
+# the journal of a compaction in flight in a partition (see data_update.compactPartition)
+COMPACTION_JOURNAL = "_compaction.json"
+
+
+def partitionColumns(table):
+    """
+    Returns the columns that the table is partitioned on
+    """
+    if table in POOL_PARTITIONED_TABLES:
+        return ["chain_name", "address"]
+
+    return ["chain_name"]
+
+
+def partitionPath(data_path, table, chain, pool=None):
+    """
+    Returns the folder of the chain=/pool= partition of the table
+
+    Notice: pool is ignored for tables that are only partitioned by chain
+    """
+    path = f"{data_path}/{table}/chain={chain}"
+
+    if pool is not None and table in POOL_PARTITIONED_TABLES:
+        path = f"{path}/pool={pool}"
+
+    return path
+
+
+def tableFiles(data_path, table, chain=None, pool=None):
+    """
+    Lists the parquet files that can hold rows of the chain/pool
+
+    Files in the partitions of other chains/pools are pruned before reading
+    Notice: flat (not yet migrated) files are always included
+    """
+    files = glob(f"{data_path}/{table}/*.parquet")
+
+    if chain is None:
+        files += glob(f"{data_path}/{table}/chain=*/**/*.parquet", recursive=True)
+    elif pool is None or table not in POOL_PARTITIONED_TABLES:
+        path = partitionPath(data_path, table, chain)
+        files += glob(f"{path}/**/*.parquet", recursive=True)
+    else:
+        path = partitionPath(data_path, table, chain, pool)
+        files += glob(f"{path}/*.parquet")
+
+    return sorted(visibleFiles(files))
+
+
+def readCompactionJournal(path):
+    """
+    Returns the journal of the compaction in flight in the partition
+    folder, or None if there is none
+
+    The journal lists the files the compaction adds and removes, and
+    whether it is committed (see data_update.compactPartition)
+    """
+    journal = f"{path}/{COMPACTION_JOURNAL}"
+    if not os.path.exists(journal):
+        return None
+
+    with open(journal) as f:
+        return json.load(f)
+
+
+def visibleFiles(files):
+    """
+    Drops the files that a compaction in flight hides from readers
+
+    Until the compaction is committed the files it adds are hidden,
+    afterwards the files it replaces are, so the rows are never missing
+    or duplicated whatever step the compaction is at (or crashed at)
+    """
+    hidden = set()
+    for path in set(os.path.dirname(f) for f in files):
+        journal = readCompactionJournal(path)
+        if journal is None:
+            continue
+
+        names = journal["remove"] if journal["committed"] else journal["add"]
+        hidden.update(f"{path}/{name}" for name in names)
+
+    return [f for f in files if f not in hidden]
+
+
+def scanTable(data_path, table, chain=None, pool=None):
+    """
+    Lazily scans only the files that can hold rows of the chain/pool
+
+    Notice: this prunes files, callers still need to filter on chain_name
+    and address for the flat (not yet migrated) files
+    """
+    files = tableFiles(data_path, table, chain, pool)
+
+    if len(files) == 0:
+        raise FileNotFoundError(f"No {table} data found for {chain} in {data_path}")
+
+    # the partition folders are already columns in the data
+    return pl.scan_parquet(files, hive_partitioning=False)
+
+
+def eventsBefore(events, as_of, columns=None):
+    """
+    Filters (lazy) events to the ones before as_of, optionally
+    projected to the given columns
+
+    Notice: the block_number filter lets scans skip row groups
+    using the parquet statistics (as_of is a computed column)
+    """
+    events = events.filter(
+        (pl.col("block_number") <= int(as_of)) & (pl.col("as_of") < as_of)
+    )
+
+    if columns is not None:
+        events = events.select(columns)
+
+    return events
@@ -1,11 +1,49 @@
 # data helpers
 from .swap_math import *
+from .partitions import *
+from .block_index import *
+from .schema import *
+from .instrumentation import instrumented
 import polars as pl
+import numpy as np
 import os
+import shutil
 import time
 
 from datetime import date, timedelta, datetime, timezone
 
+# the columns (and their compact dtypes) that low_memory pools keep
+# None keeps the dtype as is, Utf8 keeps the exact big integer with its mirror
+LOW_MEMORY_SCHEMA = {
+    "pool_swap_events": {
+        "block_timestamp": None,
+        "block_number": pl.Int32,
+        "transaction_index": pl.Int16,
+        "log_index": pl.Int32,
+        "amount0": pl.Float64,
+        "amount1": pl.Float64,
+        "sqrtPriceX96": pl.Utf8,
+        "liquidity": pl.Float64,
+        "tick": pl.Int32,
+        "gas_price": pl.Float64,
+        "gas_used": pl.Float64,
+        "as_of": None,
+    },
+    "pool_mint_burn_events": {
+        "block_timestamp": None,
+        "block_number": pl.Int32,
+        "transaction_index": pl.Int16,
+        "log_index": pl.Int32,
+        "amount": pl.Float64,
+        "amount0": pl.Float64,
+        "amount1": pl.Float64,
+        "tick_lower": pl.Int32,
+        "tick_upper": pl.Int32,
+        "type_of_event": pl.Int8,
+        "as_of": None,
+    },
+}
+
 
 def initializePoolFromFactory(addr, chain, data_path):
     """
@@ -17,7 +55,7 @@ def initializePoolFromFactory(addr, chain, data_path):
     data_type = "factory_pool_created"
 
     factory = (
-        pl.scan_parquet(f"{data_path}/{data_type}/*.parquet")
+        scanTable(data_path, data_type, chain)
         .filter((pl.col("pool") == addr) & (pl.col("chain_name") == chain))
         .collect()
     )
@@ -34,6 +72,41 @@ def initializePoolFromFactory(addr, chain, data_path):
     return ts, fee, token0, token1
 
 
+def compactEvents(events, table):
+    """
+    Projects the (lazy) events to the columns the simulator reads
+    and downcasts them (see LOW_MEMORY_SCHEMA)
+
+    Notice: the big integers that are stored as strings (amounts, liquidity
+    and gas) become Float64, which is what the swap math uses anyway
+    (their mirrors are used for canonical data, see schema.canonicalize)
+    Notice: sqrtPriceX96 is kept as the exact string with its Float64 mirror,
+    so getPriceAt/getPricesAt return the same prices as without low_memory
+    """
+    schema = LOW_MEMORY_SCHEMA[table]
+    exact = [column for column, dtype in schema.items() if dtype == pl.Utf8]
+
+    names = events.columns
+    events = events.with_columns(
+        [
+            pl.col(column).cast(pl.Float64).alias(mirrorColumn(column))
+            for column in exact
+            if mirrorColumn(column) not in names
+        ]
+    )
+    events = floatColumns(
+        events, [column for column, dtype in schema.items() if dtype == pl.Float64]
+    )
+
+    return events.select(
+        [
+            pl.col(column) if dtype is None else pl.col(column).cast(dtype)
+            for column, dtype in schema.items()
+        ]
+        + [pl.col(mirrorColumn(column)) for column in exact]
+    )
+
+
 def ceil_dt(dt, delta):
     """
     Helper for ceiling the datettime
@@ -43,23 +116,39 @@ def ceil_dt(dt, delta):
 
 def dtToBN(dt, pool):
     """
-    For that chain, pulls the data (out of all swap) and gets the closet datetime
+    For that chain, binary searches the block index (see block_index)
+    for the last block at or before the datetime
+
+    Returns None if the datetime is before the first indexed block
     """
-    bn_as_of = (
-        pl.scan_parquet(f"{pool.data_path}/pool_swap_events/*.parquet")
-        .filter(
-            (pl.col("chain_name") == pool.chain)
-            & (pl.col("block_timestamp") >= dt.replace(tzinfo=timezone.utc))
-        )
-        .select(pl.col("block_number"))
-        .max()
-        .collect()
-        .item()
-    )
+    index = getBlockIndex(pool.data_path, pool.chain)
+
+    idx = np.searchsorted(index[:, 1], toEpochUs(dt), side="right")
+
+    if idx == 0:
+        return None
+
+    return int(index[idx - 1, 0])
+
+
+def bnToDt(bn, pool):
+    """
+    For that chain, binary searches the block index (see block_index)
+    for the timestamp of the last indexed block at or before bn
+
+    Returns None if bn is before the first indexed block
+    """
+    index = getBlockIndex(pool.data_path, pool.chain)
+
+    idx = np.searchsorted(index[:, 0], bn, side="right")
 
-    return bn_as_of
+    if idx == 0:
+        return None
 
+    return datetime.fromtimestamp(index[idx - 1, 1] / 1e6, tz=timezone.utc)
 
+
+@instrumented("createSwapDF")
 def createSwapDF(as_of, pool):
     """
     This creates the swap data from that pre-computes most of the values
@@ -70,6 +159,9 @@ def createSwapDF(as_of, pool):
 
     it then pre-computes the amounts needed to escape out of the current
     range as well
+
+    Notice: the cumulative amounts needed to swap through every tick outside
+    of the current range are built from swap_df by createSwapArrays
     """
     price = pool.getPriceAt(as_of)
     assert price != None, "Pool not initialized"
@@ -78,10 +170,12 @@ def createSwapDF(as_of, pool):
     liq = createLiq(as_of, pool, "pool_mint_burn_events", pool.data_path)
 
     swap_df = (
-        liq.filter(pl.col("liquidity") > 0)  # numerical error
-        .with_columns(tick_b=pl.col("tick").shift(-1), tick_a=pl.col("tick"))
+        liq.with_columns(tick_b=pl.col("tick").shift(-1), tick_a=pl.col("tick"))
+        # ranges without liquidity (and numerical error) are dropped after
+        # the upper ticks are set, so no range extends over a gap.
+        # the last tick closes every position, so it does not start a range
+        .filter((pl.col("liquidity") > 0) & pl.col("tick_b").is_not_null())
         .select(["liquidity", "tick_a", "tick_b"])
-        .fill_null((pool.MAX_TICK // pool.ts) * pool.ts)
         .with_columns(
             p_a=(1.0001 ** pl.col("tick_a")) ** (1 / 2),
             p_b=(1.0001 ** pl.col("tick_b")) ** (1 / 2),
@@ -131,40 +225,66 @@ def createSwapDF(as_of, pool):
     )
 
 
+def createSwapArrays(swap_df, tick_in_range):
+    """
+    Splits the swap data into the ticks below (zeroForOne = True) and above
+    (zeroForOne = False) the current range, sorted in the direction of the swap,
+    alongside the cumulative amounts needed to swap through them
+
+    These are stored as contiguous numpy arrays so that the tick that
+    completes a swap can be found with a binary search
+    """
+    swapArrays = {}
+    for zeroForOne in [True, False]:
+        oor = swap_df.filter(
+            pl.col("tick_a") < tick_in_range
+            if zeroForOne
+            else pl.col("tick_a") > tick_in_range
+        ).sort(pl.col("tick_a"), descending=zeroForOne)
+
+        arrays = {
+            column: np.ascontiguousarray(oor[column].to_numpy(), dtype=np.float64)
+            for column in ["liquidity", "p_a", "p_b", "xInTick", "yInTick"]
+        }
+        arrays["tick_a"] = np.ascontiguousarray(
+            oor["tick_a"].to_numpy(), dtype=np.int64
+        )
+        arrays["cumulativeX"] = np.cumsum(arrays["xInTick"])
+        arrays["cumulativeY"] = np.cumsum(arrays["yInTick"])
+
+        swapArrays[zeroForOne] = arrays
+
+    return swapArrays
+
+
 def getPriceSeries(pool, start_time, frequency, gas=False):
+    """
+    Resamples the last tick (and median gas) of every frequency window
+    onto the last block of that window
+
+    Notice: the swaps are read lazily, so only the needed columns
+    after start_time are read (from memory or disk)
+    """
     # precompute a dataframe that has the latest block number
     bn_as_of = (
-        pl.scan_parquet(f"{pool.data_path}/pool_swap_events/*.parquet")
-        .filter(
-            (pl.col("chain_name") == pool.chain)
-            & (pl.col("block_timestamp") >= start_time.replace(tzinfo=timezone.utc))
-        )
-        .select(["block_timestamp", "block_number"])
-        .unique()
-        .sort("block_timestamp")
-        .group_by("block_timestamp")
-        .last()
-        .sort("block_timestamp")
+        blockIndexFrame(pool.data_path, pool.chain)
+        .filter(pl.col("block_timestamp") >= start_time.replace(tzinfo=timezone.utc))
         .group_by_dynamic("block_timestamp", every=frequency)
         .agg(pl.col("block_number").max())
-        .collect()
     )
 
     if gas:
         tick_as_of = (
-            pl.scan_parquet(f"{pool.data_path}/pool_swap_events/*.parquet")
-            .filter(
-                (pl.col("chain_name") == pool.chain)
-                & (pl.col("address") == pool.pool)
-                & (pl.col("block_timestamp") >= start_time.replace(tzinfo=timezone.utc))
-            )
+            pool.readFromMemoryOrDisk("pool_swap_events", pool.data_path, lazy=True)
+            .filter(pl.col("block_timestamp") >= start_time.replace(tzinfo=timezone.utc))
+            .pipe(floatColumns, ["gas_price", "gas_used"])
             .select(["block_timestamp", "tick", "gas_price", "gas_used"])
             .unique()
             .sort("block_timestamp")
             .group_by("block_timestamp")
             .last()
             .sort("block_timestamp")
-            .cast({"tick": pl.Int64, "gas_price": pl.UInt64, "gas_used": pl.UInt64})
+            .cast({"tick": pl.Int64})
             .group_by_dynamic("block_timestamp", every=frequency)
             .agg(
                 [
@@ -182,12 +302,8 @@ def getPriceSeries(pool, start_time, frequency, gas=False):
         )
     else:
         tick_as_of = (
-            pl.scan_parquet(f"{pool.data_path}/pool_swap_events/*.parquet")
-            .filter(
-                (pl.col("chain_name") == pool.chain)
-                & (pl.col("address") == pool.pool)
-                & (pl.col("block_timestamp") >= start_time.replace(tzinfo=timezone.utc))
-            )
+            pool.readFromMemoryOrDisk("pool_swap_events", pool.data_path, lazy=True)
+            .filter(pl.col("block_timestamp") >= start_time.replace(tzinfo=timezone.utc))
             .select(["block_timestamp", "tick"])
             .unique()
             .sort("block_timestamp")
@@ -215,6 +331,12 @@ def drop_tables(pool, tables):
 
     for data_table in tables:
         print(f"Deleting table {data_table}")
+
+        # the partitioned data only needs the folder of the chain removed
+        path = partitionPath(pool.data_path, data_table, pool.chain)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+
         for file in os.listdir(f"{pool.data_path}/{data_table}"):
             if ".parquet" not in file:
                 continue
@@ -229,3 +351,16 @@ def drop_tables(pool, tables):
             if not data.is_empty():
                 # rip
                 os.remove(f"{pool.data_path}/{data_table}/{file}")
+
+        # the refilled table is written in the schema of what is left
+        with CANONICAL_LOCK:
+            CANONICAL_TABLES.pop((str(pool.data_path), data_table), None)
+
+    # the index of the chain holds the blocks of the dropped events,
+    # it is rebuilt from what is left when it is needed (see getBlockIndex)
+    index = blockIndexPath(pool.data_path, pool.chain)
+    if os.path.exists(index):
+        os.remove(index)
+
+    # the cached states were built from the dropped events
+    pool.clearCaches()
@@ -0,0 +1,427 @@
+from .swap_math import *
+from .schema import floatColumns
+from .partitions import eventsBefore
+from .session import simulationSession
+import polars as pl
+import bisect
+import math
+
+
+def replayStream(pool, start=None, end=None):
+    """
+    Merges the swaps and mints/burns of the pool with start <= as_of < end
+    into one stream of events sorted on as_of and log_index
+
+    Every row is (event, as_of, block_number, log_index, tick, sqrtPriceX96,
+    amount0, amount1, amount, tick_lower, tick_upper)
+    with event being "swap", "mint" or "burn"
+    """
+    columns = [
+        "event",
+        "as_of",
+        "block_number",
+        "log_index",
+        "tick",
+        "sqrtPriceX96",
+        "amount0",
+        "amount1",
+        "amount",
+        "tick_lower",
+        "tick_upper",
+    ]
+
+    swaps = (
+        pool.readFromMemoryOrDisk("pool_swap_events", pool.data_path, lazy=True)
+        .pipe(floatColumns, ["sqrtPriceX96", "amount0", "amount1"])
+        .with_columns(
+            event=pl.lit("swap"),
+            tick=pl.col("tick").cast(pl.Int64),
+            amount=pl.lit(None, dtype=pl.Float64),
+            tick_lower=pl.lit(None, dtype=pl.Int64),
+            tick_upper=pl.lit(None, dtype=pl.Int64),
+        )
+    )
+
+    mb = (
+        pool.readFromMemoryOrDisk("pool_mint_burn_events", pool.data_path, lazy=True)
+        .pipe(floatColumns, ["amount0", "amount1"])
+        .with_columns(
+            event=pl.when(pl.col("type_of_event") > 0)
+            .then(pl.lit("mint"))
+            .otherwise(pl.lit("burn")),
+            tick=pl.lit(None, dtype=pl.Int64),
+            sqrtPriceX96=pl.lit(None, dtype=pl.Float64),
+            tick_lower=pl.col("tick_lower").cast(pl.Int64),
+            tick_upper=pl.col("tick_upper").cast(pl.Int64),
+        )
+    )
+
+    stream = []
+    for events in [swaps, mb]:
+        if start is not None:
+            events = events.filter(
+                (pl.col("block_number") >= int(start)) & (pl.col("as_of") >= start)
+            )
+        if end is not None:
+            events = eventsBefore(events, end)
+
+        stream.append(
+            events.select(columns).cast(
+                {"block_number": pl.Int64, "log_index": pl.Int64}
+            )
+        )
+
+    return (
+        pl.concat(stream)
+        .sort(["as_of", "log_index"])
+        .collect(streaming=pool.low_memory)
+    )
+
+
+class replayState:
+    """
+    The state of the pool while it is replayed (see replay)
+
+    The liquidity net of every initialized tick is kept in a dict
+    (with the ticks sorted alongside), so mints/burns only touch their two
+    ticks and swaps only touch the ticks they cross
+
+    Notice: the state is updated in place as the replay moves forward,
+    copy the values (or call liquidityDistribution) that need to be kept
+    """
+
+    def __init__(self, pool, start=None):
+        self.pool = pool
+
+        # tick -> liquidity net and the sorted initialized ticks
+        self.net = {}
+        self.ticks = []
+
+        # the in-range liquidity, price and tick
+        self.liquidity = 0.0
+        self.tick = None
+        self.sqrtPriceX96 = None
+
+        # the last event that was applied
+        self.event = None
+        self.as_of = start
+        self.block_number = None
+        self.log_index = None
+        self.amount0 = None
+        self.amount1 = None
+        self.amount = None
+        self.tick_lower = None
+        self.tick_upper = None
+        self.events = 0
+
+        if start is not None:
+            # everything before start is aggregated at once (see createLiq)
+            deltas = liqDeltas(
+                eventsBefore(
+                    pool.readFromMemoryOrDisk(
+                        "pool_mint_burn_events", pool.data_path, lazy=True
+                    ),
+                    start,
+                    ["tick_lower", "tick_upper", "amount", "type_of_event"],
+                )
+            ).collect()
+
+            for tick, liquidity_lower, liquidity_upper in deltas.select(
+                ["tick", "liquidity_lower", "liquidity_upper"]
+            ).iter_rows():
+                self.updateTick(tick, liquidity_lower + liquidity_upper)
+
+            self.tick = pool.getTickAt(start)
+            price = pool.getPriceAt(start)
+            if price is not None:
+                self.sqrtPriceX96 = float(price)
+
+            if self.tick is not None:
+                self.liquidity = self.activeLiquidity()
+
+    def updateTick(self, tick, delta):
+        if tick not in self.net:
+            bisect.insort(self.ticks, tick)
+            self.net[tick] = 0.0
+
+        self.net[tick] += delta
+
+    def activeLiquidity(self):
+        """
+        Sums the liquidity net of every tick at or below the current tick
+        """
+        idx = bisect.bisect_right(self.ticks, self.tick)
+
+        return sum([self.net[tick] for tick in self.ticks[:idx]])
+
+    def applyMintBurn(self, tick_lower, tick_upper, delta):
+        self.updateTick(tick_lower, delta)
+        self.updateTick(tick_upper, -delta)
+
+        if self.tick is not None and tick_lower <= self.tick < tick_upper:
+            self.liquidity += delta
+
+    def applySwap(self, tick, sqrtPriceX96):
+        if self.tick is None:
+            self.tick = tick
+            self.liquidity = self.activeLiquidity()
+
+        elif tick > self.tick:
+            # crossing up adds the net of the ticks in (old tick, new tick]
+            lo = bisect.bisect_right(self.ticks, self.tick)
+            hi = bisect.bisect_right(self.ticks, tick)
+            for crossed in self.ticks[lo:hi]:
+                self.liquidity += self.net[crossed]
+
+        elif tick < self.tick:
+            # crossing down removes the net of the ticks in (new tick, old tick]
+            lo = bisect.bisect_right(self.ticks, tick)
+            hi = bisect.bisect_right(self.ticks, self.tick)
+            for crossed in self.ticks[lo:hi]:
+                self.liquidity -= self.net[crossed]
+
+        self.tick = tick
+        self.sqrtPriceX96 = sqrtPriceX96
+
+    def swapSegments(self, tick, sqrtPriceX96):
+        """
+        Returns the price ranges a swap to tick/sqrtPriceX96 goes through,
+        as (lower, upper, liquidity) with the sqrt prices (not X96) of the
+        range and the liquidity in it
+
+        Notice: this is called before the swap is applied
+        Notice: there are none when the price before the swap is unknown
+        """
+        if self.tick is None or self.sqrtPriceX96 is None:
+            return []
+
+        price, end = self.sqrtPriceX96 / 2**96, sqrtPriceX96 / 2**96
+        liquidity = self.liquidity
+
+        segments = []
+        if end < price:
+            # crossing down removes the net of the ticks in (new tick, old tick]
+            lo = bisect.bisect_right(self.ticks, tick)
+            hi = bisect.bisect_right(self.ticks, self.tick)
+            for crossed in reversed(self.ticks[lo:hi]):
+                boundary = min(max(1.0001 ** (crossed / 2), end), price)
+                segments.append((boundary, price, liquidity))
+                liquidity -= self.net[crossed]
+                price = boundary
+
+            segments.append((end, price, liquidity))
+
+        elif end > price:
+            # crossing up adds the net of the ticks in (old tick, new tick]
+            lo = bisect.bisect_right(self.ticks, self.tick)
+            hi = bisect.bisect_right(self.ticks, tick)
+            for crossed in self.ticks[lo:hi]:
+                boundary = max(min(1.0001 ** (crossed / 2), end), price)
+                segments.append((price, boundary, liquidity))
+                liquidity += self.net[crossed]
+                price = boundary
+
+            segments.append((price, end, liquidity))
+
+        return segments
+
+    def apply(
+        self,
+        event,
+        as_of,
+        block_number,
+        log_index,
+        tick,
+        sqrtPriceX96,
+        amount0,
+        amount1,
+        amount,
+        tick_lower,
+        tick_upper,
+    ):
+        """
+        Applies one row of the stream (see replayStream)
+        """
+        if event == "swap":
+            self.applySwap(tick, sqrtPriceX96)
+        elif event == "mint":
+            self.applyMintBurn(tick_lower, tick_upper, amount)
+        else:
+            self.applyMintBurn(tick_lower, tick_upper, -amount)
+
+        self.event = event
+        self.as_of = as_of
+        self.block_number = block_number
+        self.log_index = log_index
+        self.amount0 = amount0
+        self.amount1 = amount1
+        self.amount = amount
+        self.tick_lower = tick_lower
+        self.tick_upper = tick_upper
+        self.events += 1
+
+    def session(self):
+        """
+        Returns a simulation session (see session.simulationSession)
+        starting from the current state
+        """
+        assert self.sqrtPriceX96 is not None, "Pool not initialized"
+
+        return simulationSession(
+            self.pool,
+            self.ticks,
+            [self.net[tick] for tick in self.ticks],
+            self.sqrtPriceX96 / 2**96,
+            self.tick,
+            self.as_of,
+        )
+
+    def liquidityDistribution(self):
+        """
+        Returns the current liquidity distribution in the format of createLiq
+        """
+        return (
+            pl.DataFrame(
+                {
+                    "tick": self.ticks,
+                    "liquidity": [self.net[tick] for tick in self.ticks],
+                },
+                schema={"tick": pl.Int64, "liquidity": pl.Float64},
+            )
+            .filter(pl.col("liquidity") != 0)
+            .with_columns(liquidity=pl.col("liquidity").cumsum())
+        )
+
+
+def replay(pool, start=None, end=None):
+    """
+    Replays the swaps and mints/burns of the pool between start and end
+    in one pass, yielding the state after every event
+
+    Mints/burns update the liquidity of their ticks and swaps move the
+    price/tick (and the in-range liquidity by the ticks crossed), so a full
+    history is linear in the number of events instead of rebuilding
+    the liquidity (see createLiq) at every as_of
+
+    for state in replay(pool):
+        if state.event == "swap":
+            print(state.as_of, state.tick, state.liquidity)
+
+    Notice: start and end are as_ofs (start <= as_of < end)
+    Notice: the same state is yielded every time, see replayState
+    """
+    state = replayState(pool, start)
+
+    for row in replayStream(pool, start, end).iter_rows():
+        state.apply(*row)
+        yield state
+
+
+def runReplay(pool, callbacks, start=None, end=None):
+    """
+    Replays the pool (see replay) and calls callbacks[event](state)
+    after every "swap", "mint" or "burn"
+
+    Returns the final state
+    """
+    state = replayState(pool, start)
+
+    for row in replayStream(pool, start, end).iter_rows():
+        state.apply(*row)
+
+        callback = callbacks.get(state.event)
+        if callback is not None:
+            callback(state)
+
+    return state
+
+
+def feeGrowth(pool, start=None, end=None):
+    """
+    Aggregates the fees that the historical swaps of the pool paid to every
+    tick (tick spacing range), replayed against the liquidity at the time
+
+    The replay (see replay) collects the price ranges every swap went through
+    with their liquidity, then the amounts in and fees of every tick are
+    computed and aggregated at once
+
+    Returns a dataframe with the columns tick, swaps, volume0, volume1 (amounts
+    in, with the fee), fees0, fees1, feeGrowth0 and feeGrowth1
+    Notice: feeGrowth is the fees per unit of liquidity (like v3's feeGrowthGlobal
+    without X128), so liquidity l in range over the tick earned l * feeGrowth
+    Notice: start and end are as_ofs (start <= as_of < end)
+    Notice: the first swap is skipped when the price before it is unknown
+    """
+    state = replayState(pool, start)
+
+    segments = []
+    for row in replayStream(pool, start, end).iter_rows():
+        if row[0] == "swap":
+            zeroForOne = state.sqrtPriceX96 is not None and row[5] < state.sqrtPriceX96
+            for lower, upper, liquidity in state.swapSegments(row[4], row[5]):
+                segments.append((state.events, lower, upper, liquidity, zeroForOne))
+
+        state.apply(*row)
+
+    feeRate = pool.fee / 1e6
+    ts = pool.ts
+
+    def tickSqrtPrice(tick):
+        return (pl.lit(1.0001) ** tick) ** (1 / 2)
+
+    def tickFloor(sqrtPrice):
+        return (
+            ((sqrtPrice**2).log() / math.log(1.0001) / ts).floor().cast(pl.Int64) * ts
+        )
+
+    return (
+        pl.DataFrame(
+            segments,
+            schema={
+                "swap": pl.Int64,
+                "lower": pl.Float64,
+                "upper": pl.Float64,
+                "liquidity": pl.Float64,
+                "zeroForOne": pl.Boolean,
+            },
+            orient="row",
+        )
+        .filter((pl.col("upper") > pl.col("lower")) & (pl.col("liquidity") > 0))
+        # the tick spacing ranges of every segment
+        # (one range below to not lose any to float error)
+        .with_columns(
+            tick=pl.int_ranges(
+                tickFloor(pl.col("lower")) - ts, tickFloor(pl.col("upper")) + ts, ts
+            )
+        )
+        .explode("tick")
+        .with_columns(
+            lower=pl.max_horizontal("lower", tickSqrtPrice(pl.col("tick"))),
+            upper=pl.min_horizontal("upper", tickSqrtPrice(pl.col("tick") + ts)),
+        )
+        .filter(pl.col("upper") > pl.col("lower"))
+        # the amounts in minus fee of token0 (price down) or token1 (price up)
+        .with_columns(
+            amountIn=pl.when(pl.col("zeroForOne"))
+            .then(
+                pl.col("liquidity")
+                * (pl.col("upper") - pl.col("lower"))
+                / (pl.col("upper") * pl.col("lower"))
+            )
+            .otherwise(pl.col("liquidity") * (pl.col("upper") - pl.col("lower")))
+            / (1 - feeRate)
+        )
+        .with_columns(fee=pl.col("amountIn") * feeRate)
+        .with_columns(growth=pl.col("fee") / pl.col("liquidity"))
+        .group_by("tick")
+        .agg(
+            swaps=pl.col("swap").n_unique(),
+            volume0=pl.col("amountIn").filter(pl.col("zeroForOne")).sum(),
+            volume1=pl.col("amountIn").filter(~pl.col("zeroForOne")).sum(),
+            fees0=pl.col("fee").filter(pl.col("zeroForOne")).sum(),
+            fees1=pl.col("fee").filter(~pl.col("zeroForOne")).sum(),
+            feeGrowth0=pl.col("growth").filter(pl.col("zeroForOne")).sum(),
+            feeGrowth1=pl.col("growth").filter(~pl.col("zeroForOne")).sum(),
+        )
+        .sort("tick")
+    )
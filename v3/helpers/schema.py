@@ -0,0 +1,223 @@
+import polars as pl
+import numpy as np
+import math
+import os
+import threading
+from .partitions import tableFiles
+
+# columns that are stored as Int64 (ticks, fees and indices)
+CANONICAL_INTS = {
+    "factory_pool_created": ["block_number", "log_index", "fee", "tickSpacing"],
+    "pool_initialize_events": ["block_number", "log_index", "transaction_index", "tick"],
+    "pool_swap_events": ["block_number", "log_index", "transaction_index", "tick"],
+    "pool_mint_burn_events": [
+        "block_number",
+        "log_index",
+        "transaction_index",
+        "tick_lower",
+        "tick_upper",
+        "type_of_event",
+    ],
+}
+
+# uint256/int256 columns, these are kept as exact strings
+# alongside a {column}_f64 Float64 mirror for the math
+BIG_INTS = {
+    "factory_pool_created": [],
+    "pool_initialize_events": ["sqrtPriceX96", "gas_price", "gas_used"],
+    "pool_swap_events": [
+        "amount0",
+        "amount1",
+        "sqrtPriceX96",
+        "liquidity",
+        "gas_price",
+        "gas_used",
+        "l1_fee",
+    ],
+    "pool_mint_burn_events": [
+        "amount",
+        "amount0",
+        "amount1",
+        "gas_price",
+        "gas_used",
+        "l1_fee",
+    ],
+}
+
+# whether writes to a (data_path, table) are canonical, see tableIsCanonical
+CANONICAL_TABLES = {}
+CANONICAL_LOCK = threading.Lock()
+
+
+def mirrorColumn(column):
+    return f"{column}_f64"
+
+
+def canonicalize(df, table):
+    """
+    Applies the canonical schema of the table to the dataframe
+
+    1. ticks, fees and indices are cast to Int64
+    2. big integers are kept as exact strings and get a Float64 mirror
+    (see BIG_INTS), which readers use instead of casting the strings
+
+    Notice: this is idempotent, the mirrors are recomputed from the strings
+    """
+    if table not in CANONICAL_INTS:
+        return df
+
+    ints = [column for column in CANONICAL_INTS[table] if column in df.columns]
+    big_ints = [column for column in BIG_INTS[table] if column in df.columns]
+
+    df = df.with_columns(
+        [pl.col(column).cast(pl.Int64) for column in ints]
+        + [pl.col(column).cast(pl.Utf8) for column in big_ints]
+    ).with_columns(
+        [
+            pl.col(column).cast(pl.Float64, strict=False).alias(mirrorColumn(column))
+            for column in big_ints
+        ]
+    )
+
+    # the mirrors always come last and in the same order
+    mirrors = [mirrorColumn(column) for column in big_ints]
+    columns = [column for column in df.columns if column not in mirrors]
+
+    return df.select(columns + mirrors)
+
+
+def isCanonical(schema, table):
+    """
+    Checks if the schema (of a file or dataframe) is the canonical one
+    """
+    if table not in CANONICAL_INTS:
+        return True
+
+    ints = all(
+        schema[column] == pl.Int64 for column in CANONICAL_INTS[table] if column in schema
+    )
+    mirrors = all(
+        mirrorColumn(column) in schema for column in BIG_INTS[table] if column in schema
+    )
+
+    return ints and mirrors
+
+
+def tableIsCanonical(data_path, table):
+    """
+    Checks if the stored table uses the canonical schema
+
+    Notice: tables without files are canonical, so new data is written
+    canonically while tables written before are kept as is (see migrate_schema)
+    Notice: the answer is cached, so concurrent writers never read a file
+    that is still being written
+    """
+    key = (str(data_path), table)
+
+    with CANONICAL_LOCK:
+        if key not in CANONICAL_TABLES:
+            files = tableFiles(data_path, table)
+            CANONICAL_TABLES[key] = len(files) == 0 or isCanonical(
+                pl.read_parquet_schema(files[0]), table
+            )
+
+        return CANONICAL_TABLES[key]
+
+
+def floatColumns(df, columns):
+    """
+    Returns the (lazy) dataframe with the big integer columns as Float64
+
+    Canonical data uses the mirrors, other data casts the strings
+    """
+    schema = df.schema
+
+    return df.with_columns(
+        [
+            pl.col(mirrorColumn(column)).alias(column)
+            if mirrorColumn(column) in schema
+            else pl.col(column).cast(pl.Float64)
+            for column in columns
+        ]
+    )
+
+
+def intStrings(values):
+    """
+    Returns the Float64 values as the strings of their integers,
+    like str(int(value)) but vectorized (nulls stay null)
+
+    Notice: |value| = mantissa * 2**shift, so the mantissa is shifted
+    in base 1e9 limbs and pairs of limbs are formatted as 18 digits
+    """
+    if isinstance(values, pl.Series):
+        values = values.cast(pl.Float64)
+    else:
+        values = pl.Series(values, dtype=pl.Float64)
+    floats = values.fill_null(0).to_numpy()
+
+    mantissa, exponent = np.frexp(np.abs(floats))
+    mantissa = (mantissa * 2.0**53).astype(np.uint64)
+    # below 2**53 the fraction is dropped, above it the mantissa is shifted up
+    mantissa >>= np.clip(53 - exponent, 0, 63).astype(np.uint64)
+    shift = np.maximum(exponent - 53, 0).astype(np.uint64)
+
+    base = np.uint64(10**9)
+    n_limbs = 2 * math.ceil((16 + int(shift.max(initial=0)) * math.log10(2)) / 18)
+    limbs = [mantissa % base, mantissa // base] + [
+        np.zeros(len(floats), dtype=np.uint64) for _ in range(n_limbs - 2)
+    ]
+    while shift.any():
+        # 2**20 keeps limb * factor + carry in uint64
+        step = np.minimum(shift, np.uint64(20))
+        factor, carry = np.uint64(1) << step, np.uint64(0)
+        for i in range(n_limbs):
+            carry, limbs[i] = np.divmod(limbs[i] * factor + carry, base)
+        shift -= step
+
+    # the leading 1 of 1e18 zero pads the pairs
+    pairs = [
+        pl.lit(pl.Series(limbs[i + 1] * base + limbs[i] + np.uint64(10**18)))
+        .cast(pl.Utf8)
+        .str.slice(1)
+        for i in reversed(range(0, n_limbs, 2))
+    ]
+    digits = pl.lit(
+        pl.select(pl.concat_str(pairs).str.strip_chars_start("0")).to_series()
+    )
+
+    return pl.select(
+        pl.when(pl.lit(values).is_null())
+        .then(None)
+        .when(digits == "")
+        .then(pl.lit("0"))
+        .when(pl.lit(values) < 0)
+        .then("-" + digits)
+        .otherwise(digits)
+        .alias(values.name)
+    ).to_series()
+
+
+def migrate_schema(data_path, tables):
+    """
+    Rewrites the files of the tables that were written before the canonical schema
+
+    Each file is written under a temporary name and moved into place
+    """
+    # support both strings and lists
+    if type(tables) != list:
+        tables = [tables]
+
+    for table in tables:
+        for file in tableFiles(data_path, table):
+            if isCanonical(pl.read_parquet_schema(file), table):
+                continue
+
+            print(f"Migrating the schema of {file}")
+            df = canonicalize(pl.read_parquet(file), table)
+
+            df.write_parquet(f"{file}.tmp")
+            os.replace(f"{file}.tmp", file)
+
+        with CANONICAL_LOCK:
+            CANONICAL_TABLES.pop((str(data_path), table), None)
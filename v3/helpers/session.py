@@ -0,0 +1,288 @@
+from .swap_math import *
+import numpy as np
+import polars as pl
+import math
+
+
+def tickToSqrtPrice(tick):
+    """
+    Helper to convert a tick to its sqrt price (not X96)
+    """
+    return 1.0001 ** (tick / 2)
+
+
+def sqrtPriceToTick(sqrtPrice):
+    """
+    Helper to convert a sqrt price (not X96) to the tick it is in
+    """
+    return int(math.floor(math.log(sqrtPrice**2) / math.log(1.0001)))
+
+
+def amountsForLiquidity(sqrtPrice, tick_lower, tick_upper, liquidity):
+    """
+    Returns the amounts of token0 and token1 that the liquidity
+    between the ticks is worth at the price
+
+    See https://github.com/Uniswap/v3-periphery/blob/main/contracts/libraries/LiquidityAmounts.sol
+    """
+    sqrt_a, sqrt_b = tickToSqrtPrice(tick_lower), tickToSqrtPrice(tick_upper)
+
+    if sqrtPrice <= sqrt_a:
+        return get_amount0_delta(sqrt_a, sqrt_b, liquidity), 0.0
+    elif sqrtPrice < sqrt_b:
+        return (
+            get_amount0_delta(sqrtPrice, sqrt_b, liquidity),
+            get_amount1_delta(sqrt_a, sqrtPrice, liquidity),
+        )
+    else:
+        return 0.0, get_amount1_delta(sqrt_a, sqrt_b, liquidity)
+
+
+class simulationSession:
+    """
+    A mutable pool state to apply hypothetical swaps, mints and burns to
+
+    The liquidity net of the initialized ticks is held in sorted numpy arrays,
+    swaps step through the initialized ticks like the v3 swap loop (moving
+    the price and crossing ticks) and mints/burns only touch their two ticks
+
+    Notice: amounts are in the raw token units (like swapIn)
+    Notice: sqrtPrice is the sqrt price (sqrtPriceX96 / 2**96)
+    """
+
+    def __init__(self, pool, ticks, net, sqrtPrice, tick, as_of=None):
+        self.pool = pool
+        self.as_of = as_of
+
+        self.ticks = np.asarray(ticks, dtype=np.int64)
+        self.net = np.asarray(net, dtype=np.float64)
+
+        order = np.argsort(self.ticks, kind="stable")
+        self.ticks, self.net = self.ticks[order], self.net[order]
+
+        self.sqrtPrice = sqrtPrice
+        self.tick = tick
+        self.liquidity = self.activeLiquidity()
+
+        self.actions = []
+
+    def activeLiquidity(self):
+        """
+        Sums the liquidity net of every tick at or below the current tick
+        """
+        idx = np.searchsorted(self.ticks, self.tick, side="right")
+
+        return float(self.net[:idx].sum())
+
+    def liquidityDistribution(self):
+        """
+        Returns the current liquidity distribution in the format of createLiq
+        """
+        return (
+            pl.DataFrame(
+                {"tick": self.ticks, "liquidity": self.net},
+                schema={"tick": pl.Int64, "liquidity": pl.Float64},
+            )
+            .filter(pl.col("liquidity") != 0)
+            .with_columns(liquidity=pl.col("liquidity").cumsum())
+        )
+
+    def history(self):
+        """
+        Returns every action applied to the session as a dataframe
+        """
+        return pl.DataFrame(self.actions)
+
+    def updateTick(self, tick, delta):
+        idx = int(np.searchsorted(self.ticks, tick, side="left"))
+
+        if idx == self.ticks.shape[0] or self.ticks[idx] != tick:
+            self.ticks = np.insert(self.ticks, idx, tick)
+            self.net = np.insert(self.net, idx, 0.0)
+
+        self.net[idx] += delta
+
+    def modifyPosition(self, action, tick_lower, tick_upper, liquidity):
+        assert tick_lower < tick_upper, "tick_lower must be below tick_upper"
+        assert (
+            tick_lower % self.pool.ts == 0 and tick_upper % self.pool.ts == 0
+        ), f"Ticks must be multiples of the tick spacing {self.pool.ts}"
+
+        delta = liquidity if action == "mint" else -liquidity
+
+        self.updateTick(tick_lower, delta)
+        self.updateTick(tick_upper, -delta)
+
+        if tick_lower <= self.tick < tick_upper:
+            self.liquidity += delta
+
+        amount0, amount1 = amountsForLiquidity(
+            self.sqrtPrice, tick_lower, tick_upper, liquidity
+        )
+
+        self.actions.append(
+            {
+                "action": action,
+                "tokenIn": None,
+                "amountIn": None,
+                "amountOut": None,
+                "amount0": amount0,
+                "amount1": amount1,
+                "liquidity": liquidity,
+                "tick_lower": tick_lower,
+                "tick_upper": tick_upper,
+                "fees": 0.0,
+                "ticksCrossed": 0,
+                "sqrtPrice": self.sqrtPrice,
+                "tick": self.tick,
+            }
+        )
+
+        return amount0, amount1
+
+    def mint(self, tick_lower, tick_upper, liquidity):
+        """
+        Adds liquidity between the ticks
+
+        Returns the amounts of token0 and token1 deposited
+        """
+        return self.modifyPosition("mint", tick_lower, tick_upper, liquidity)
+
+    def burn(self, tick_lower, tick_upper, liquidity):
+        """
+        Removes liquidity between the ticks
+
+        Returns the amounts of token0 and token1 withdrawn
+        """
+        return self.modifyPosition("burn", tick_lower, tick_upper, liquidity)
+
+    def swap(self, tokenIn, swapIn):
+        """
+        Swaps swapIn of tokenIn against the session, moving its price,
+        tick and in-range liquidity
+
+        Returns the amount out
+
+        Notice: nothing is applied if there is not enough liquidity
+        """
+        if type(swapIn) == str:
+            swapIn = float(swapIn)
+
+        # stops us from hitting annoying bugs
+        assert swapIn > 0, "We do not support swaps of 0"
+
+        zeroForOne = tokenIn.lower() != self.pool.token1
+        feeRate = self.pool.fee / 1e6
+
+        # the swap runs on copies so a failed swap does not change the session
+        sqrtPrice, tick, liquidity = self.sqrtPrice, self.tick, self.liquidity
+        remaining, amtOut, fees, ticksCrossed = swapIn, 0.0, 0.0, 0
+
+        while remaining > 0:
+            # the next initialized tick in the direction of the swap
+            if zeroForOne:
+                idx = int(np.searchsorted(self.ticks, tick, side="right")) - 1
+                assert idx >= 0, "Not enough liquidity in pool"
+            else:
+                idx = int(np.searchsorted(self.ticks, tick, side="right"))
+                assert idx < self.ticks.shape[0], "Not enough liquidity in pool"
+
+            tick_next = int(self.ticks[idx])
+            sqrtPrice_next = tickToSqrtPrice(tick_next)
+
+            # the amount in (minus fee) needed to reach the next tick
+            capacity = 0.0
+            if liquidity > 0:
+                if zeroForOne:
+                    capacity = get_amount0_delta(sqrtPrice_next, sqrtPrice, liquidity)
+                else:
+                    capacity = get_amount1_delta(sqrtPrice, sqrtPrice_next, liquidity)
+
+            remainingMinusFee = remaining * (1 - feeRate)
+
+            if remainingMinusFee < capacity:
+                # the swap ends in this range
+                sqrtPrice_last = get_next_sqrtPrice(
+                    sqrtPrice, liquidity, remainingMinusFee, zeroForOne
+                )
+
+                if zeroForOne:
+                    amtOut += get_amount1_delta(sqrtPrice_last, sqrtPrice, liquidity)
+                else:
+                    amtOut += get_amount0_delta(sqrtPrice, sqrtPrice_last, liquidity)
+
+                fees += remaining - remainingMinusFee
+                remaining = 0
+
+                sqrtPrice = sqrtPrice_last
+                # float error can not push the tick out of the range
+                tick = sqrtPriceToTick(sqrtPrice)
+                tick = max(tick, tick_next) if zeroForOne else min(tick, tick_next - 1)
+
+            else:
+                # swap through the whole range and cross the tick
+                if zeroForOne:
+                    amtOut += get_amount1_delta(sqrtPrice_next, sqrtPrice, liquidity)
+                    liquidity -= self.net[idx]
+                    tick = tick_next - 1
+                else:
+                    amtOut += get_amount0_delta(sqrtPrice, sqrtPrice_next, liquidity)
+                    liquidity += self.net[idx]
+                    tick = tick_next
+
+                if capacity > 0:
+                    fees += capacity / (1 - feeRate) - capacity
+                    remaining -= capacity / (1 - feeRate)
+
+                sqrtPrice = sqrtPrice_next
+                ticksCrossed += 1
+
+        self.sqrtPrice, self.tick, self.liquidity = sqrtPrice, tick, float(liquidity)
+
+        self.actions.append(
+            {
+                "action": "swap",
+                "tokenIn": tokenIn.lower(),
+                "amountIn": swapIn,
+                "amountOut": amtOut,
+                "amount0": swapIn if zeroForOne else -amtOut,
+                "amount1": -amtOut if zeroForOne else swapIn,
+                "liquidity": self.liquidity,
+                "tick_lower": None,
+                "tick_upper": None,
+                "fees": fees,
+                "ticksCrossed": ticksCrossed,
+                "sqrtPrice": self.sqrtPrice,
+                "tick": self.tick,
+            }
+        )
+
+        return amtOut
+
+
+def createSession(as_of, pool):
+    """
+    Creates a simulation session from the pool state as_of
+    (the liquidity distribution is built once, see createLiq)
+
+    Notice: as_of is the block + transaction index / 1e4.
+    Notice: Returns the state before the transaction at that index was done
+    """
+    price = pool.getPriceAt(as_of)
+    assert price != None, "Pool not initialized"
+
+    liq = createLiq(as_of, pool, "pool_mint_burn_events", pool.data_path)
+
+    # the distribution is cumulative, the session holds the net per tick
+    net = liq.select(
+        "tick", net=pl.col("liquidity").diff().fill_null(pl.col("liquidity"))
+    )
+
+    return simulationSession(
+        pool,
+        net["tick"].to_numpy(),
+        net["net"].to_numpy(),
+        price / 2**96,
+        pool.getTickAt(as_of),
+        as_of,
+    )
@@ -1,4 +1,7 @@
 from .swap_math import *
+from .instrumentation import instrumented
+import numpy as np
+import polars as pl
 
 
 def parseEntry(calldata, field, default=False, required=True):
@@ -28,6 +31,38 @@ def parseCalldata(calldata):
     return (as_of, tokenIn, swapIn, findMax, fees)
 
 
+def parseCalldataOut(calldata):
+    """
+    Parse the calldata of an exact output swap (see swapOut)
+
+    swapOut is only optional when there is a sqrtPriceLimitX96
+    """
+    as_of = parseEntry(calldata, "as_of")
+    tokenIn = parseEntry(calldata, "tokenIn")
+    sqrtPriceLimitX96 = parseEntry(
+        calldata, "sqrtPriceLimitX96", default=None, required=False
+    )
+    swapOut = parseEntry(
+        calldata, "swapOut", default=None, required=sqrtPriceLimitX96 == None
+    )
+
+    return (as_of, tokenIn, swapOut, sqrtPriceLimitX96)
+
+
+def feeFrame(ticks, fees, liquidity):
+    """
+    The fees paid to every tick a swap went through (see swapIn)
+    as a dataframe with the columns tick, fee and liquidity
+    """
+    return pl.DataFrame(
+        [
+            pl.Series("tick", ticks, dtype=pl.Int64),
+            pl.Series("fee", fees, dtype=pl.Float64),
+            pl.Series("liquidity", liquidity, dtype=pl.Float64),
+        ]
+    )
+
+
 def inRangeTesting(zeroForOne, inRange0, inRangeToSwap0, inRange1, inRangeToSwap1):
     # is there enough liquidity in the current tick?
     if zeroForOne:
@@ -38,6 +73,7 @@ def inRangeTesting(zeroForOne, inRange0, inRangeToSwap0, inRange1, inRangeToSwap
     return inRangeTest, inRangeToSwap
 
 
+@instrumented("swapIn")
 def swapIn(calldata, pool, warn=True):
     """
     Impliments https://github.com/Uniswap/v3-core/blob/main/contracts/interfaces/IUniswapV3Pool.sol
@@ -49,6 +85,10 @@ def swapIn(calldata, pool, warn=True):
 
 
     amtIn, _ = swapIn(calldata, pool)
+
+    With 'fees': True the fees paid to every tick are returned as a dataframe
+    amtOut, (sqrtPriceLast, sqrt_P, feeDF) = swapIn(calldata, pool)
+    Notice: feeDF is None without fees
     """
     (as_of, tokenIn, swapIn, findMax, fees) = parseCalldata(calldata)
 
@@ -66,15 +106,13 @@ def swapIn(calldata, pool, warn=True):
     # stops us from hitting annoying bugs
     assert swapIn != 0, "We do not support swaps of 0"
 
-    if as_of != pool.cache["as_of"]:
-        pool.calcSwapDF(as_of)
-
-    swap_df, inRangeValues = pool.cache["swapDF"], pool.cache["inRangeValues"]
+    swap_df, inRangeValues = pool.calcSwapDF(as_of)
+    swapArrays = pool.calcSwapArrays(as_of)
 
     zeroForOne = True
     assetIn, assetOut = "x", "y"
 
-    feeDict = {}
+    feeDF = None
 
     if tokenIn.lower() == pool.token1:
         zeroForOne = False
@@ -118,7 +156,7 @@ def swapIn(calldata, pool, warn=True):
             amtOut = get_amount1_delta(sqrtPriceLast, sqrt_P, liquidity)
 
         if fees:
-            feeDict[tick_in_range] = (swapIn * (pool.fee / 1e6), liquidity)
+            feeDF = feeFrame([tick_in_range], [swapIn * (pool.fee / 1e6)], [liquidity])
 
     # we gotta shift tick(s) lol
     else:
@@ -131,82 +169,613 @@ def swapIn(calldata, pool, warn=True):
         however here, we vectorize precompute every single tick possible to move over and then find the tick
         cumulatively that has enough for us to swap into
         """
-        leftToSwap = swapIn - inRangeTest
-        leftToSwapMinusFee = leftToSwap * (1 - pool.fee / 1e6)
+        # the fee is taken from the amount in of every range, so the
+        # amounts (minus fee) to swap through a range are compared
+        # against what is left of swapIn minus fee
+        leftToSwapMinusFee = swapInMinusFee - inRangeTest
+
+        # all possible ticks are precomputed in createSwapDF
+        arrays = swapArrays[zeroForOne]
+        cumulativeIn = arrays["cumulativeX" if zeroForOne else "cumulativeY"]
+        cumulativeOut = arrays["cumulativeY" if zeroForOne else "cumulativeX"]
+
+        maxAmountOut = cumulativeIn[-1] if cumulativeIn.shape[0] != 0 else 0
+
+        assert maxAmountOut > leftToSwapMinusFee, "Not enough liquidity in pool"
+
+        # this is the tick that has cumulatively enough liquidity to support
+        # our entire trade
+        liquidTickIdx = int(
+            np.searchsorted(cumulativeIn, leftToSwapMinusFee, side="left")
+        )
+
+        liquidTick = int(arrays["tick_a"][liquidTickIdx])
+
+        sqrt_P_last_top, sqrt_P_last_bottom = (
+            arrays["p_b"][liquidTickIdx],
+            arrays["p_a"][liquidTickIdx],
+        )
+
+        liquidity = arrays["liquidity"][liquidTickIdx]
+
+        # the previous ticks are all fully swapped through
+        previousIn, previousOut = 0, 0
+        if liquidTickIdx > 0:
+            previousIn = cumulativeIn[liquidTickIdx - 1]
+            previousOut = cumulativeOut[liquidTickIdx - 1]
+
+        amtInSwappedLeftMinusFee = leftToSwapMinusFee - previousIn
+        amtInToSwapLeft = amtInSwappedLeftMinusFee / (1 - pool.fee / 1e6)
+        amtOutPrevTicks = inRangeToSwap + previousOut
 
-        # calculate the current in-range liquidity
         if fees:
-            feeDict[tick_in_range] = (
-                inRangeTest * (pool.fee / 1e6),
-                liquidity_in_range,
+            # the current range, the ticks fully swapped through
+            # (their amounts in are minus fee) and the last tick
+            feeRate = pool.fee / 1e6
+            feeDF = feeFrame(
+                np.concatenate(
+                    [[tick_in_range], arrays["tick_a"][:liquidTickIdx], [liquidTick]]
+                ),
+                np.concatenate(
+                    [
+                        [inRangeTest / (1 - feeRate) * feeRate],
+                        arrays[f"{assetIn}InTick"][:liquidTickIdx]
+                        / (1 - feeRate)
+                        * feeRate,
+                        [amtInToSwapLeft * feeRate],
+                    ]
+                ),
+                np.concatenate(
+                    [
+                        [liquidity_in_range],
+                        arrays["liquidity"][:liquidTickIdx],
+                        [liquidity],
+                    ]
+                ),
             )
 
-        # we precompute all possible ticks
-        oor = (
-            swap_df.filter(
-                (
-                    pl.col("tick_a") < tick_in_range
-                    if zeroForOne
-                    else pl.col("tick_a") > tick_in_range
-                )
-            )
-            .sort(pl.col("tick_a"), descending=zeroForOne)
-            .with_columns(
-                cumulativeX=pl.col("xInTick").cumsum(),
-                cumulativeY=pl.col("yInTick").cumsum(),
-            )
+        amtOutLastTick, sqrtPriceLast = finalAmtOutFromTick(
+            zeroForOne,
+            sqrt_P_last_top,
+            sqrt_P_last_bottom,
+            amtInSwappedLeftMinusFee,
+            liquidity,
+        )
+
+        amtOut = amtOutLastTick + amtOutPrevTicks
+
+    return amtOut, (sqrtPriceLast, sqrt_P, feeDF)
+
+
+def amountOutToPrice(zeroForOne, sqrtPriceLimit, sqrt_P, p_a, p_b, liquidity, arrays):
+    """
+    Returns the amount out of swapping from sqrt_P until the price
+    reaches sqrtPriceLimit (see swapOut)
+
+    p_a, p_b and liquidity are the current range and arrays the ranges
+    outside of it in the direction of the swap (see createSwapArrays)
+    """
+    if zeroForOne:
+        # the price moves down and token1 goes out
+        amtOut = liquidity * (sqrt_P - max(p_a, sqrtPriceLimit))
+
+        bottom = np.maximum(arrays["p_a"], sqrtPriceLimit)
+        amtOut += (arrays["liquidity"] * np.clip(arrays["p_b"] - bottom, 0, None)).sum()
+    else:
+        # the price moves up and token0 goes out
+        top = min(p_b, sqrtPriceLimit)
+        amtOut = liquidity * ((top - sqrt_P) / (top * sqrt_P))
+
+        top = np.maximum(np.minimum(arrays["p_b"], sqrtPriceLimit), arrays["p_a"])
+        amtOut += (
+            arrays["liquidity"] * ((top - arrays["p_a"]) / (top * arrays["p_a"]))
+        ).sum()
+
+    return float(amtOut)
+
+
+@instrumented("swapOut")
+def swapOut(calldata, pool, warn=True):
+    """
+    Simulates an exact output swap, the inverse of swapIn
+
+    calldata = {'as_of': 104043220,
+            'tokenIn': pool.token1,
+            'swapOut': 1e18,
+            'sqrtPriceLimitX96': None}
+
+    amtIn, (amtOut, sqrtPriceLast, sqrt_P, fees) = swapOut(calldata, pool)
+
+    The amount out is found in the cumulative amounts out of every tick
+    (see pool_helpers.createSwapArrays) with one binary search, and the
+    amount in is the cumulative amount in up to there plus the fee
+
+    With a sqrtPriceLimitX96 the swap stops once the price reaches the limit
+    (like sqrtPriceLimitX96 in v3), and without a swapOut it swaps until the limit
+    Notice: amtOut is less than swapOut when the limit is reached first
+    """
+    (as_of, tokenIn, swapOut, sqrtPriceLimitX96) = parseCalldataOut(calldata)
+
+    # there can be a desync between mints/burns and swap pulls
+    # which causes incorrect data
+    if warn:
+        if pool.max_supported < as_of:
+            print("Mint/burn and swap data are not updated at this date")
+
+    # i use strings in default polars bc big ints
+    if type(swapOut) == str:
+        swapOut = float(swapOut)
+
+    if type(sqrtPriceLimitX96) == str:
+        sqrtPriceLimitX96 = float(sqrtPriceLimitX96)
+
+    # stops us from hitting annoying bugs
+    assert swapOut != 0, "We do not support swaps of 0"
+
+    swap_df, inRangeValues = pool.calcSwapDF(as_of)
+    swapArrays = pool.calcSwapArrays(as_of)
+
+    zeroForOne = tokenIn.lower() != pool.token1
+
+    # unpack these values
+    (
+        sqrt_P,
+        inRange0,
+        inRangeToSwap0,
+        inRange1,
+        inRangeToSwap1,
+        liquidity_in_range,
+        tick_in_range,
+    ) = inRangeValues
+
+    inRangeTest, inRangeToSwap = inRangeTesting(
+        zeroForOne, inRange0, inRangeToSwap0, inRange1, inRangeToSwap1
+    )
+
+    arrays = swapArrays[zeroForOne]
+    cumulativeIn = arrays["cumulativeX" if zeroForOne else "cumulativeY"]
+    cumulativeOut = arrays["cumulativeY" if zeroForOne else "cumulativeX"]
+
+    maxAmountOut = inRangeToSwap + (
+        cumulativeOut[-1] if cumulativeOut.shape[0] != 0 else 0
+    )
+
+    limited = False
+    if sqrtPriceLimitX96 != None:
+        sqrtPriceLimit = sqrtPriceLimitX96 / 2**96
+
+        assert (
+            sqrtPriceLimit < sqrt_P if zeroForOne else sqrtPriceLimit > sqrt_P
+        ), "Price limit already reached"
+
+        current_range = swap_df.filter(pl.col("tick_a") == tick_in_range)
+        limitOut = amountOutToPrice(
+            zeroForOne,
+            sqrtPriceLimit,
+            sqrt_P,
+            current_range["p_a"].item(),
+            current_range["p_b"].item(),
+            liquidity_in_range,
+            arrays,
         )
+        # a limit past every tick swaps through all of the liquidity
+        limitOut = min(limitOut, maxAmountOut)
 
-        assetColumn = pl.col("cumulativeX") if zeroForOne else pl.col("cumulativeY")
+        if swapOut == None or limitOut < swapOut:
+            swapOut, limited = limitOut, True
 
-        maxAmountOut = oor.select(assetColumn).max().item()
+    assert swapOut <= maxAmountOut, "Not enough liquidity in pool"
 
-        assert maxAmountOut > leftToSwap, "Not enough liquidity in pool"
+    if swapOut <= inRangeToSwap:
+        # enough liquidity in range
+        liquidity = liquidity_in_range
+        sqrt_P_start, amtInMinusFee = sqrt_P, 0
+        amtOutLeft = swapOut
 
+    else:
         # this is the tick that has cumulatively enough liquidity to support
         # our entire trade
-        liquidTickRow = oor.filter(assetColumn >= leftToSwapMinusFee).head(1)
+        leftOut = swapOut - inRangeToSwap
+        liquidTickIdx = min(
+            int(np.searchsorted(cumulativeOut, leftOut, side="left")),
+            cumulativeOut.shape[0] - 1,
+        )
 
-        liquidTick = liquidTickRow["tick_a"].item()
+        # the previous ticks are all fully swapped through
+        previousIn, previousOut = 0, 0
+        if liquidTickIdx > 0:
+            previousIn = cumulativeIn[liquidTickIdx - 1]
+            previousOut = cumulativeOut[liquidTickIdx - 1]
 
-        # find the previous ticks
-        previousTicks = oor.filter(
-            pl.col("tick_a") > liquidTick
-            if zeroForOne
-            else pl.col("tick_a") < liquidTick
+        liquidity = arrays["liquidity"][liquidTickIdx]
+        sqrt_P_start = arrays["p_b" if zeroForOne else "p_a"][liquidTickIdx]
+        amtInMinusFee = inRangeTest + previousIn
+        amtOutLeft = leftOut - previousOut
+
+    # see SqrtPriceMath.getNextSqrtPriceFromOutput
+    # the amount in is written in terms of the amount out, as the difference
+    # of the prices loses the precision of small swaps
+    if zeroForOne:
+        sqrtPriceLast = get_next_price_amount1(sqrt_P_start, liquidity, amtOutLeft, True)
+        amtInMinusFee += amtOutLeft / (sqrt_P_start * sqrtPriceLast)
+    else:
+        sqrtPriceLast = get_next_price_amount0(
+            sqrt_P_start, liquidity, amtOutLeft, False
         )
+        amtInMinusFee += amtOutLeft * sqrt_P_start * sqrtPriceLast
 
-        sqrt_P_last_top, sqrt_P_last_bottom = (
-            liquidTickRow["p_b"].item(),
-            liquidTickRow["p_a"].item(),
+    # the limit can be in a range without liquidity
+    if limited:
+        sqrtPriceLast = sqrtPriceLimit
+
+    amtIn = amtInMinusFee / (1 - pool.fee / 1e6)
+
+    return amtIn, (swapOut, sqrtPriceLast, sqrt_P, amtIn - amtInMinusFee)
+
+
+def swapInArrays(zeroForOne, amounts, fee, inRangeValues, swapArrays):
+    """
+    Vectorized version of swapIn for an array of amounts at one pool state
+
+    Mirrors the math of swapIn and binary searches the cumulative amounts
+    of swapArrays (see pool_helpers.createSwapArrays)
+
+    Returns (amtOut, sqrtPriceLast, ticksCrossed) as arrays
+    Notice: swaps without enough liquidity in the pool return nan
+    (and cross no ticks)
+    """
+    amounts = np.asarray(amounts, dtype=np.float64)
+    feeRate = fee / 1e6
+
+    (
+        sqrt_P,
+        inRange0,
+        inRangeToSwap0,
+        inRange1,
+        inRangeToSwap1,
+        liquidity_in_range,
+        tick_in_range,
+    ) = inRangeValues
+
+    inRangeTest, inRangeToSwap = inRangeTesting(
+        zeroForOne, inRange0, inRangeToSwap0, inRange1, inRangeToSwap1
+    )
+
+    amtOut = np.full(amounts.shape, np.nan)
+    sqrtPriceLast = np.full(amounts.shape, np.nan)
+    ticksCrossed = np.zeros(amounts.shape, dtype=np.int64)
+
+    swapInMinusFee = amounts * (1 - feeRate)
+    inRange = inRangeTest > swapInMinusFee
+
+    # enough liquidity in range
+    liquidity = liquidity_in_range
+    amtInRange = swapInMinusFee[inRange]
+    if not zeroForOne:
+        sqrtPriceLast[inRange] = get_next_price_amount1(
+            sqrt_P, liquidity, amtInRange, zeroForOne
         )
+        amtOut[inRange] = get_amount0_delta(sqrtPriceLast[inRange], sqrt_P, liquidity)
+    else:
+        sqrtPriceLast[inRange] = get_next_price_amount0(
+            sqrt_P, liquidity, amtInRange, zeroForOne
+        )
+        amtOut[inRange] = get_amount1_delta(sqrtPriceLast[inRange], sqrt_P, liquidity)
 
-        liquidity = liquidTickRow["liquidity"].item()
+    # we gotta shift tick(s)
+    arrays = swapArrays[zeroForOne]
+    assetIn, assetOut = ("X", "Y") if zeroForOne else ("Y", "X")
+    cumulativeIn = arrays[f"cumulative{assetIn}"]
+    cumulativeOut = arrays[f"cumulative{assetOut}"]
 
-        amtInToSwapLeft = leftToSwap - previousTicks[f"{assetIn}InTick"].sum()
+    leftToSwapMinusFee = swapInMinusFee[~inRange] - inRangeTest
 
-        # fee support goes here
-        amtInSwappedLeftMinusFee = amtInToSwapLeft * (1 - pool.fee / 1e6)
-        amtOutPrevTicks = inRangeToSwap + previousTicks[f"{assetOut}InTick"].sum()
+    # this is the tick that has cumulatively enough liquidity to support
+    # the entire trade
+    liquidTick = np.searchsorted(cumulativeIn, leftToSwapMinusFee, side="left")
 
-        if fees:
-            # calculate the previous ticks
-            for tickValue, liquidityInTick, assetInAmts in previousTicks.select(
-                ["tick_a", "liquidity", f"{assetIn}InTick"]
-            ).iter_rows():
-                feeDict[tickValue] = (assetInAmts * (pool.fee / 1e6), liquidityInTick)
+    maxAmountOut = cumulativeIn[-1] if cumulativeIn.shape[0] != 0 else 0
+    enough = (maxAmountOut > leftToSwapMinusFee) & (
+        liquidTick < cumulativeIn.shape[0]
+    )
+    liquidTick = np.minimum(liquidTick, max(cumulativeIn.shape[0] - 1, 0))
 
-            # calculate the last tick
-            feeDict[liquidTick] = (amtInToSwapLeft * (pool.fee / 1e6), liquidity)
+    if cumulativeIn.shape[0] != 0:
+        previousIn = np.where(liquidTick > 0, cumulativeIn[liquidTick - 1], 0)
+        previousOut = np.where(liquidTick > 0, cumulativeOut[liquidTick - 1], 0)
 
-        amtOutLastTick, sqrtPriceLast = finalAmtOutFromTick(
+        liquidity = arrays["liquidity"][liquidTick]
+        amtInSwappedLeftMinusFee = leftToSwapMinusFee - previousIn
+
+        amtOutLastTick, sqrtP_next = finalAmtOutFromTick(
             zeroForOne,
-            sqrt_P_last_top,
-            sqrt_P_last_bottom,
+            arrays["p_b"][liquidTick],
+            arrays["p_a"][liquidTick],
             amtInSwappedLeftMinusFee,
             liquidity,
         )
 
-        amtOut = amtOutLastTick + amtOutPrevTicks
+        outOfRange = np.flatnonzero(~inRange)
+        amtOut[outOfRange] = np.where(
+            enough, amtOutLastTick + inRangeToSwap + previousOut, np.nan
+        )
+        sqrtPriceLast[outOfRange] = np.where(enough, sqrtP_next, np.nan)
+        # the current range plus every range fully swapped through
+        ticksCrossed[outOfRange] = np.where(enough, liquidTick + 1, 0)
+
+    return amtOut, sqrtPriceLast, ticksCrossed
+
+
+def feeArrays(zeroForOne, amounts, fee, inRangeValues, swapArrays):
+    """
+    Vectorized fee breakdown of swapInArrays, the fees paid to every tick
+    each swap went through (like swapIn with fees)
+
+    Returns (swap, tick, fee, liquidity) as arrays with one entry per swap and tick,
+    swap being the index of the swap in amounts
+    Notice: swaps without enough liquidity in the pool have no entries
+    """
+    amounts = np.asarray(amounts, dtype=np.float64)
+    feeRate = fee / 1e6
+
+    (
+        sqrt_P,
+        inRange0,
+        inRangeToSwap0,
+        inRange1,
+        inRangeToSwap1,
+        liquidity_in_range,
+        tick_in_range,
+    ) = inRangeValues
+
+    inRangeTest, inRangeToSwap = inRangeTesting(
+        zeroForOne, inRange0, inRangeToSwap0, inRange1, inRangeToSwap1
+    )
+
+    arrays = swapArrays[zeroForOne]
+    cumulativeIn = arrays["cumulativeX" if zeroForOne else "cumulativeY"]
+    inTick = arrays["xInTick" if zeroForOne else "yInTick"]
+
+    swapInMinusFee = amounts * (1 - feeRate)
+    inRange = inRangeTest > swapInMinusFee
+    leftToSwapMinusFee = np.where(inRange, 0, swapInMinusFee - inRangeTest)
+
+    liquidTick = np.searchsorted(cumulativeIn, leftToSwapMinusFee, side="left")
+    maxAmountOut = cumulativeIn[-1] if cumulativeIn.shape[0] != 0 else 0
+    swaps = np.flatnonzero(inRange | (maxAmountOut > leftToSwapMinusFee))
+
+    # the current range pays the fee of everything swapped in it
+    inRangeFee = np.where(inRange, amounts, inRangeTest / (1 - feeRate))[swaps] * feeRate
+
+    # every swap that shifts ticks goes through the ranges 0..liquidTick
+    counts = np.where(inRange, 0, liquidTick + 1)[swaps]
+    swap = np.repeat(swaps, counts)
+    idx = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    # the ranges fully swapped through, their amounts in are minus fee
+    fees = inTick[idx] / (1 - feeRate) * feeRate
+
+    # and the last tick
+    last = idx == liquidTick[swap]
+    previousIn = np.where(idx > 0, cumulativeIn[idx - 1], 0)
+    fees[last] = ((leftToSwapMinusFee[swap] - previousIn) / (1 - feeRate) * feeRate)[
+        last
+    ]
+
+    swap = np.concatenate([swaps, swap])
+    order = np.argsort(swap, kind="stable")
+
+    return (
+        swap[order],
+        np.concatenate(
+            [np.full(swaps.shape, tick_in_range), arrays["tick_a"][idx]]
+        )[order],
+        np.concatenate([inRangeFee, fees])[order],
+        np.concatenate(
+            [np.full(swaps.shape, liquidity_in_range), arrays["liquidity"][idx]]
+        )[order],
+    )
+
+
+def swapInBatch(calldata, pool, warn=True, fees=False):
+    """
+    Simulates a batch of swaps given as a polars dataframe of "calldata"
+    with the columns as_of, tokenIn and swapIn
+
+    The swaps are grouped by as_of so every pool state is built once,
+    and then every swap at that state is computed in one vectorized pass
+    (see swapInArrays)
+
+    Returns the calldata with the amountOut, sqrtPriceLast and ticksCrossed columns
+    Notice: swaps without enough liquidity in the pool return null
+
+    With fees=True the fees paid to every tick (see feeArrays) are returned too
+    result, feeDF = swapInBatch(calldata, pool, fees=True)
+    with the columns row (the row of the swap in calldata), tick, fee and liquidity
+    """
+    for field in ["as_of", "tokenIn", "swapIn"]:
+        assert field in calldata.columns, f"Missing {field}"
+
+    # i use strings in default polars bc big ints
+    # so we cast them just like swapIn
+    df = calldata.with_row_count("_row").with_columns(
+        swapIn=pl.col("swapIn").cast(pl.Float64),
+        zeroForOne=pl.col("tokenIn").str.to_lowercase() != pool.token1,
+    )
+
+    # stops us from hitting annoying bugs
+    assert (df["swapIn"] != 0).all(), "We do not support swaps of 0"
+
+    # there can be a desync between mints/burns and swap pulls
+    # which causes incorrect data
+    if warn:
+        if pool.max_supported < df["as_of"].max():
+            print("Mint/burn and swap data are not updated at this date")
+
+    results, feeResults = [], []
+    for state in df.partition_by("as_of", maintain_order=True):
+        as_of = state["as_of"][0]
+
+        swap_df, inRangeValues = pool.calcSwapDF(as_of)
+        swapArrays = pool.calcSwapArrays(as_of)
+
+        for direction in state.partition_by("zeroForOne", maintain_order=True):
+            amtOut, sqrtPriceLast, ticksCrossed = swapInArrays(
+                direction["zeroForOne"][0],
+                direction["swapIn"].to_numpy(),
+                pool.fee,
+                inRangeValues,
+                swapArrays,
+            )
+
+            results.append(
+                direction.select("_row").with_columns(
+                    amountOut=pl.Series(amtOut).fill_nan(None),
+                    sqrtPriceLast=pl.Series(sqrtPriceLast).fill_nan(None),
+                    ticksCrossed=pl.Series(ticksCrossed),
+                )
+                # the swaps that do not fit in the pool are null
+                .with_columns(
+                    ticksCrossed=pl.when(pl.col("amountOut").is_not_null()).then(
+                        pl.col("ticksCrossed")
+                    )
+                )
+            )
+
+            if fees:
+                swap, ticks, feesPaid, liquidity = feeArrays(
+                    direction["zeroForOne"][0],
+                    direction["swapIn"].to_numpy(),
+                    pool.fee,
+                    inRangeValues,
+                    swapArrays,
+                )
+
+                feeResults.append(
+                    feeFrame(ticks, feesPaid, liquidity).select(
+                        row=pl.Series(direction["_row"].to_numpy()[swap]),
+                        tick=pl.col("tick"),
+                        fee=pl.col("fee"),
+                        liquidity=pl.col("liquidity"),
+                    )
+                )
+
+    out = pl.concat(results).sort("_row")
+
+    result = (
+        calldata.with_row_count("_row")
+        .join(out, on="_row", how="left")
+        .drop("_row")
+    )
+
+    if fees:
+        # the ticks of a swap are kept in the order they were swapped through
+        feeDF = (
+            pl.concat(feeResults)
+            .with_row_count("_order")
+            .sort(["row", "_order"])
+            .drop("_order")
+        )
+
+        return result, feeDF
+
+    return result
+
+
+def depthCurve(as_of, pool, tokenIn, sizes, warn=True):
+    """
+    Computes the price impact of a grid of trade sizes at one pool state
+
+    The pool state is built once and every size is swapped in one
+    vectorized pass over the cumulative amounts (see swapInArrays)
+
+    depth = depthCurve(as_of, pool, pool.token1, np.geomspace(1e6, 1e12, 100))
+
+    Returns a dataframe with the columns swapIn, amountOut, effectivePrice,
+    priceImpact, sqrtPriceLast, tick and ticksCrossed
+    Notice: prices are token1 per token0 in raw token units (like sqrtPriceX96)
+    and priceImpact is effectivePrice relative to the price before the swap
+    Notice: sizes without enough liquidity in the pool return null
+    """
+    sizes = np.atleast_1d(np.asarray(sizes, dtype=np.float64))
+
+    # stops us from hitting annoying bugs
+    assert (sizes > 0).all(), "We do not support swaps of 0"
+
+    # there can be a desync between mints/burns and swap pulls
+    # which causes incorrect data
+    if warn:
+        if pool.max_supported < as_of:
+            print("Mint/burn and swap data are not updated at this date")
+
+    zeroForOne = tokenIn.lower() != pool.token1
+
+    swap_df, inRangeValues = pool.calcSwapDF(as_of)
+    swapArrays = pool.calcSwapArrays(as_of)
+
+    amtOut, sqrtPriceLast, ticksCrossed = swapInArrays(
+        zeroForOne, sizes, pool.fee, inRangeValues, swapArrays
+    )
+
+    price = inRangeValues[0] ** 2
+    effectivePrice = amtOut / sizes if zeroForOne else sizes / amtOut
+    tick = np.floor(np.log(sqrtPriceLast**2) / np.log(1.0001))
+
+    return pl.DataFrame(
+        {
+            "swapIn": sizes,
+            "amountOut": pl.Series(amtOut).fill_nan(None),
+            "effectivePrice": pl.Series(effectivePrice).fill_nan(None),
+            "priceImpact": pl.Series(effectivePrice / price - 1).fill_nan(None),
+            "sqrtPriceLast": pl.Series(sqrtPriceLast).fill_nan(None),
+            "tick": pl.Series(tick).fill_nan(None).cast(pl.Int64),
+            "ticksCrossed": ticksCrossed,
+        }
+    ).with_columns(
+        # the sizes that do not fit in the pool are null
+        ticksCrossed=pl.when(pl.col("amountOut").is_not_null()).then(
+            pl.col("ticksCrossed")
+        )
+    )
+
+
+def depthAt(as_of, pool, pct):
+    """
+    Returns the liquidity within pct percent of the price as_of
+
+    token0 is the amount of token0 between the price and price * (1 + pct / 100)
+    (what buying token0 until the price moved pct takes out of the pool)
+    and token1 the amount of token1 between price * (1 - pct / 100) and the price
+
+    pct can be a number or a list/array, every pct is one row of the dataframe
+    Notice: the amounts exclude the fee paid to move the price
+    """
+    pcts = np.atleast_1d(np.asarray(pct, dtype=np.float64))
+    assert ((pcts > 0) & (pcts < 100)).all(), "pct must be between 0 and 100"
+
+    price = pool.getPriceAt(as_of)
+    assert price != None, "Pool not initialized"
+
+    sqrt_P = price / 2**96
+    liq = createLiq(as_of, pool, "pool_mint_burn_events", pool.data_path)
+
+    # every row of the distribution is the range [tick, next tick)
+    ticks = liq["tick"].to_numpy().astype(np.float64)
+    p_a = 1.0001 ** (ticks / 2)
+    p_b = np.append(p_a[1:], p_a[-1:])
+    # numerical error
+    liquidity = np.clip(liq["liquidity"].to_numpy(), 0, None)
+
+    # one row per pct, one column per range
+    upper = (sqrt_P * np.sqrt(1 + pcts / 100))[:, None]
+    lower = (sqrt_P * np.sqrt(1 - pcts / 100))[:, None]
+
+    top = np.minimum(p_b, upper)
+    bottom = np.minimum(np.maximum(p_a, sqrt_P), top)
+    token0 = (liquidity * (top - bottom) / (top * bottom)).sum(axis=1)
+
+    bottom = np.maximum(p_a, lower)
+    top = np.maximum(np.minimum(p_b, sqrt_P), bottom)
+    token1 = (liquidity * (top - bottom)).sum(axis=1)
 
-    return amtOut, (sqrtPriceLast, sqrt_P, feeDict)
+    return pl.DataFrame({"pct": pcts, "token0": token0, "token1": token1})
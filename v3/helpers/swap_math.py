@@ -1,6 +1,9 @@
 import numpy as np
 import math
+import bisect
 import polars as pl
+from .partitions import eventsBefore
+from .instrumentation import instrumented
 
 
 # math functions
@@ -22,52 +25,180 @@ def priceX96ToTickFloor(price, ts):
     return (int(math.floor(tick)) // ts) * ts
 
 
-def createLiq(bn, pool, data, data_path):
+def liqDeltas(mb):
     """
-    This is very complicated but
+    Aggregates a slice of mints/burns into the liquidity that is added
+    at every lower tick and removed at every upper tick
 
-    1. it groups all the mints/burns on the same lower tick
-    2. groups all the mints/burns on the same upper tick
-    and inverts the liquidity price
-    3. combines the liquidity at the same tick
-    4. the cumsums
+    These are the un-cumsummed building blocks of the liquidity distribution
+    so they can be summed across slices of the mint/burn history
 
+    Notice: mb can be a DataFrame or a LazyFrame
     """
     tl = (
-        pool.readFromMemoryOrDisk(data, data_path)
-        .with_columns(
+        mb.with_columns(
             liquidity_lower=(pl.col("amount") * pl.col("type_of_event")),
-            as_of=pl.col("block_number") + pl.col("transaction_index") / 1e4,
         )
-        .filter(pl.col("as_of") < bn)
         .group_by("tick_lower")
         .agg(pl.col("liquidity_lower").sum())
-        .filter(pl.col("liquidity_lower") != 0)
         .rename({"tick_lower": "tick"})
     )
 
     tu = (
-        pool.readFromMemoryOrDisk(data, data_path)
-        .with_columns(
+        mb.with_columns(
             liquidity_upper=(-1 * (pl.col.amount * pl.col.type_of_event)),
-            as_of=pl.col("block_number") + pl.col("transaction_index") / 1e4,
         )
-        .filter(pl.col("as_of") < bn)
         .group_by("tick_upper")
         .agg(pl.col("liquidity_upper").sum())
-        .filter(pl.col("liquidity_upper") != 0)
         .rename({"tick_upper": "tick"})
     )
 
+    return combineLiqDeltas([tl.join(tu, on="tick", how="outer").fill_null(0)])
+
+
+def combineLiqDeltas(deltas):
+    """
+    Sums multiple liquidity deltas (see liqDeltas) into one
+    and drops the ticks that do not hold any liquidity changes
+    """
+    return (
+        pl.concat(deltas)
+        .group_by("tick")
+        .agg(pl.col("liquidity_lower").sum(), pl.col("liquidity_upper").sum())
+        .filter((pl.col("liquidity_lower") != 0) | (pl.col("liquidity_upper") != 0))
+    )
+
+
+def snapshotBoundaries(pool, mb):
+    """
+    Returns the number of mint/burn events that each snapshot covers
+
+    Snapshots are taken every pool.snapshot_every events or blocks
+    depending on pool.snapshot_unit
+    """
+    if mb.is_empty():
+        return []
+
+    if pool.snapshot_unit == "events":
+        return list(range(pool.snapshot_every, mb.shape[0] + 1, pool.snapshot_every))
+
+    elif pool.snapshot_unit == "blocks":
+        first = mb["block_number"].min() // pool.snapshot_every + 1
+        last = mb["block_number"].max()
+        blocks = pl.Series(
+            range(first * pool.snapshot_every, last + 1, pool.snapshot_every)
+        )
+        # the events before the first transaction at each block boundary
+        boundaries = mb["block_number"].search_sorted(blocks, side="left")
+        return sorted(set(b for b in boundaries.to_list() if b > 0))
+
+    else:
+        raise ValueError(f"Snapshot unit {pool.snapshot_unit} not supported")
+
+
+def getLiqSnapshot(pool, mb, n_events):
+    """
+    Returns the closest materialized snapshot covering at most n_events
+    of mint/burn history as (events covered, liquidity deltas)
+
+    Snapshots are built lazily and incrementally from the previous snapshot
+    and are cached on the pool
+    """
+    store = pool.cache.get("liq_snapshots")
+
+    # rebuild the snapshot store if the history changed underneath us
+    if store is None or store["rows"] != mb.shape[0]:
+        store = {
+            "rows": mb.shape[0],
+            "boundaries": snapshotBoundaries(pool, mb),
+            "snapshots": {},
+        }
+        pool.cache["liq_snapshots"] = store
+
+    boundaries = store["boundaries"]
+    idx = bisect.bisect_right(boundaries, n_events) - 1
+    if idx < 0:
+        return 0, None
+
+    # walk back to the closest snapshot that was already materialized
+    start = idx
+    while start >= 0 and boundaries[start] not in store["snapshots"]:
+        start -= 1
+
+    if start >= 0:
+        covered, snapshot = boundaries[start], store["snapshots"][boundaries[start]]
+    else:
+        covered, snapshot = 0, None
+
+    # and then roll forward until we hit the desired snapshot
+    for boundary in boundaries[start + 1 : idx + 1]:
+        deltas = liqDeltas(mb.slice(covered, boundary - covered))
+        if snapshot is not None:
+            deltas = combineLiqDeltas([snapshot, deltas])
+
+        covered, snapshot = boundary, deltas
+        store["snapshots"][boundary] = snapshot
+
+    return covered, snapshot
+
+
+@instrumented("createLiq")
+def createLiq(bn, pool, data, data_path):
+    """
+    This is very complicated but
+
+    1. it groups all the mints/burns on the same lower tick
+    2. groups all the mints/burns on the same upper tick
+    and inverts the liquidity price
+    3. combines the liquidity at the same tick
+    4. the cumsums
+
+    To avoid rescanning the whole history, 1-3 start from the closest
+    snapshot (see getLiqSnapshot) and only replay the events since it
+
+    Lazy pools (pull=False) aggregate the scan of the mints/burns before bn
+    instead, so only the tick/amount columns are read and never held in memory
+
+    The distributions are cached in the pool's LRU keyed by bn
+    """
+    cache = pool.cache.get("liquidity")
+    if cache is not None:
+        liquidity_distribution = cache.get((data, bn))
+        if liquidity_distribution is not None:
+            return liquidity_distribution
+
+    if not pool.pull:
+        mb = eventsBefore(
+            pool.readFromMemoryOrDisk(data, data_path, lazy=True),
+            bn,
+            ["tick_lower", "tick_upper", "amount", "type_of_event"],
+        )
+
+        deltas = liqDeltas(mb).collect(streaming=pool.low_memory)
+    else:
+        mb = pool.readFromMemoryOrDisk(data, data_path)
+
+        # mb is sorted on as_of, so this is the number of events before bn
+        n_events = mb["as_of"].search_sorted(bn, side="left")
+
+        covered, snapshot = getLiqSnapshot(pool, mb, n_events)
+
+        deltas = liqDeltas(mb.slice(covered, n_events - covered))
+        if snapshot is not None:
+            deltas = combineLiqDeltas([snapshot, deltas])
+
     liquidity_distribution = (
-        tl.join(tu, on="tick", how="outer")
-        .fill_null(0)
-        .with_columns(liquidity=(pl.col("liquidity_lower") + pl.col("liquidity_upper")))
+        deltas.with_columns(
+            liquidity=(pl.col("liquidity_lower") + pl.col("liquidity_upper"))
+        )
         .sort(pl.col("tick"))
         .select(["tick", "liquidity"])
         .with_columns(liquidity=(pl.col("liquidity").cumsum()))
     )
 
+    if cache is not None:
+        cache.put((data, bn), liquidity_distribution)
+
     return liquidity_distribution
 
 
@@ -102,19 +233,16 @@ def get_amount0_delta(ratioA, ratioB, liq):
     """
     See https://github.com/Uniswap/v3-core/blob/main/contracts/libraries/SqrtPriceMath.sol
     """
-    if ratioA > ratioB:
-        ratioA, ratioB = ratioB, ratioA
-
-    return liq * ((ratioB - ratioA) / (ratioB * ratioA))
+    # abs orders the ratios, also element-wise on numpy arrays
+    return liq * (abs(ratioB - ratioA) / (ratioB * ratioA))
 
 
 def get_amount1_delta(ratioA, ratioB, liq):
     """
     See https://github.com/Uniswap/v3-core/blob/main/contracts/libraries/SqrtPriceMath.sol
     """
-    if ratioA > ratioB:
-        ratioA, ratioB = ratioB, ratioA
-    return liq * (ratioB - ratioA)
+    # abs orders the ratios, also element-wise on numpy arrays
+    return liq * abs(ratioB - ratioA)
 
 
 def get_next_price_amount0(ratioA, liq, amount, add):
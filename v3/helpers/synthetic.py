@@ -0,0 +1,482 @@
+import numpy as np
+import polars as pl
+from bisect import bisect_right, insort
+from datetime import datetime, timezone
+from .data_update import checkPath, writeDataset, WRITE_LOCK
+from .block_index import updateBlockIndex, BLOCK_INDEX_TABLES
+
+# fee -> tick spacing of the v3 factory
+SYNTHETIC_FEE_TIERS = {100: 1, 500: 10, 3000: 60, 10000: 200}
+
+SYNTHETIC_MAX_TICK = 887272
+
+# events are placed in (block, transaction_index) slots
+SYNTHETIC_TX_PER_BLOCK = 100
+SYNTHETIC_BLOCK_TIME = 12
+
+# the nonfungible position manager mints and burns the positions
+SYNTHETIC_NFP = "0xc36442b4a4522e871399cd717abdd847ab11fe88"
+SYNTHETIC_ROUTER = "0xe592427a0aece92de3edee1f18e0157c05861564"
+
+
+def hexId(column, width):
+    """
+    Turns an integer id column into a unique 0x-prefixed hex-looking string
+    (the decimal digits are zero padded to width)
+    """
+    return pl.concat_str([pl.lit("0x"), pl.col(column).cast(pl.Utf8).str.zfill(width)])
+
+
+def amountStrings(amounts):
+    """
+    Rounds float amounts to ints and returns them as strings
+
+    Notice: the (rare) amounts past int64 are formatted one by one
+    """
+    amounts = np.round(np.asarray(amounts, dtype=np.float64))
+    big = np.abs(amounts) >= 2.0**63
+
+    strings = pl.Series(np.where(big, 0, amounts).astype(np.int64)).cast(pl.Utf8)
+    if big.any():
+        idx = np.flatnonzero(big)
+        strings = strings.scatter(idx, [str(int(amount)) for amount in amounts[idx]])
+
+    return strings
+
+
+def sqrtPriceX96Strings(ticks):
+    """
+    Returns the sqrtPriceX96 in the middle of every tick as strings
+
+    The exact ints are only computed once per unique tick (a lookup table)
+    and the middle of the tick keeps the rounding from crossing into the next tick
+    """
+    unique, inverse = np.unique(ticks, return_inverse=True)
+    table = pl.Series(
+        [str(int(1.0001 ** ((int(tick) + 0.5) / 2) * 2**96)) for tick in unique]
+    )
+
+    return table.gather(inverse)
+
+
+def sqrtPriceAt(ticks, mid=True):
+    """
+    The (float) sqrt price at the boundary (or the middle) of the ticks
+    """
+    return 1.0001 ** ((ticks + (0.5 if mid else 0)) / 2)
+
+
+def positionAmounts(liquidity, sqrt_price, tick_lower, tick_upper):
+    """
+    The token amounts of the positions at the sqrt price
+    """
+    sqrt_a = sqrtPriceAt(tick_lower, mid=False)
+    sqrt_b = sqrtPriceAt(tick_upper, mid=False)
+    sqrt_p = np.clip(sqrt_price, sqrt_a, sqrt_b)
+
+    amount0 = liquidity * (1 / sqrt_p - 1 / sqrt_b)
+    amount1 = liquidity * (sqrt_p - sqrt_a)
+
+    return amount0, amount1
+
+
+def swapAmounts(kind, swap_ticks, mb_lower, mb_upper, mb_delta, tick0, fee):
+    """
+    Walks the mints/burns and swaps in order like the pool does and returns
+    the amount0, amount1 and liquidity (after the swap) of every swap
+
+    Mints/burns add their liquidity to the net of their two ticks (and to
+    the active liquidity when the tick is in their range), swaps cross the
+    initialized ticks between their start and end tick and the amounts
+    are the sum over the ranges they swapped through
+
+    Notice: kind holds 0 for swaps and ±1 for mints/burns (the mints/burns
+    in the order of mb_lower/mb_upper/mb_delta), the amount in includes the fee
+    """
+    feeRate = fee / 1e6
+    n_swaps = swap_ticks.shape[0]
+    amount0 = np.empty(n_swaps)
+    amount1 = np.empty(n_swaps)
+    swap_liquidity = np.empty(n_swaps)
+
+    # tick -> liquidity net and the sorted initialized ticks
+    net = {}
+    initialized = []
+
+    liquidity = 0.0
+    tick = int(tick0)
+    i_swap, i_mb = 0, 0
+    for event in kind.tolist():
+        if event != 0:
+            lower, upper = int(mb_lower[i_mb]), int(mb_upper[i_mb])
+            delta = float(mb_delta[i_mb])
+            for boundary, boundary_delta in [(lower, delta), (upper, -delta)]:
+                if boundary not in net:
+                    net[boundary] = 0.0
+                    insort(initialized, boundary)
+                net[boundary] += boundary_delta
+
+            if lower <= tick < upper:
+                liquidity += delta
+            i_mb += 1
+            continue
+
+        target = int(swap_ticks[i_swap])
+        sqrt_price = float(sqrtPriceAt(tick))
+        delta0, delta1 = 0.0, 0.0
+
+        # the initialized ticks crossed, in the order they are crossed
+        if target > tick:
+            lo, hi = bisect_right(initialized, tick), bisect_right(initialized, target)
+            crossed, sign = initialized[lo:hi], 1
+        else:
+            lo, hi = bisect_right(initialized, target), bisect_right(initialized, tick)
+            crossed, sign = initialized[lo:hi][::-1], -1
+
+        for boundary in crossed:
+            sqrt_next = 1.0001 ** (boundary / 2)
+            delta0 += liquidity * (1 / sqrt_next - 1 / sqrt_price)
+            delta1 += liquidity * (sqrt_next - sqrt_price)
+            liquidity += sign * net[boundary]
+            sqrt_price = sqrt_next
+
+        sqrt_next = float(sqrtPriceAt(target))
+        delta0 += liquidity * (1 / sqrt_next - 1 / sqrt_price)
+        delta1 += liquidity * (sqrt_next - sqrt_price)
+
+        # the token paid in (the price moves up when token1 is paid in) pays the fee
+        if sign == 1:
+            delta1 = delta1 / (1 - feeRate)
+        else:
+            delta0 = delta0 / (1 - feeRate)
+
+        amount0[i_swap], amount1[i_swap] = delta0, delta1
+        swap_liquidity[i_swap] = liquidity
+        tick = target
+        i_swap += 1
+
+    return amount0, amount1, swap_liquidity
+
+
+def syntheticPool(
+    rng,
+    pool_id,
+    chain,
+    swaps,
+    positions,
+    burn_ratio,
+    n_blocks,
+    start_block,
+    volatility,
+    genesis_us,
+):
+    """
+    Generates the factory, initialize, mint/burn and swap events of one pool
+
+    1. the pool is created and initialized at a random tick
+    2. a full range position is minted right after
+    3. swaps move the tick in a random walk (never 0 ticks)
+    4. positions are minted around the current tick and a burn_ratio
+    of them are burned in full at a later time
+
+    Notice: the swap amounts and liquidity follow the active liquidity
+    of the positions (see swapAmounts), so they match swapIn and createLiq
+    """
+    fee = int(rng.choice(list(SYNTHETIC_FEE_TIERS.keys())))
+    ts = SYNTHETIC_FEE_TIERS[fee]
+    min_tick = -(SYNTHETIC_MAX_TICK // ts) * ts
+    max_tick = (SYNTHETIC_MAX_TICK // ts) * ts
+
+    address = f"0x{(1 << 156) + pool_id:040x}"
+    token0 = f"0x{(2 << 156) + 2 * pool_id:040x}"
+    token1 = f"0x{(2 << 156) + 2 * pool_id + 1:040x}"
+
+    # order the events in time, burns always come after their mint
+    burned = np.flatnonzero(rng.random(positions) < burn_ratio)
+    t_mint = rng.random(positions)
+    t_burn = t_mint[burned] + rng.random(burned.shape[0]) * (1 - t_mint[burned])
+
+    kind = np.concatenate(
+        [
+            np.zeros(swaps, dtype=np.int64),
+            np.ones(positions, dtype=np.int64),
+            -np.ones(burned.shape[0], dtype=np.int64),
+        ]
+    )
+    position = np.concatenate(
+        [-np.ones(swaps, dtype=np.int64), np.arange(positions), burned]
+    )
+    order = np.argsort(
+        np.concatenate([rng.random(swaps), t_mint, t_burn]), kind="stable"
+    )
+    kind, position = kind[order], position[order]
+
+    # initialize + full range mint + the events, in increasing unique slots
+    n = kind.shape[0] + 2
+    gap = max(n_blocks * SYNTHETIC_TX_PER_BLOCK // n - 1, 0)
+    slots = np.cumsum(1 + rng.integers(0, 2 * gap + 1, n)) - 1
+    blocks = start_block + slots // SYNTHETIC_TX_PER_BLOCK
+    tx_index = slots % SYNTHETIC_TX_PER_BLOCK
+    timestamps = genesis_us + (blocks - start_block) * SYNTHETIC_BLOCK_TIME * 1_000_000
+
+    # the tick random walk of the swaps
+    tick0 = int(rng.integers(-50_000, 50_000))
+    steps = np.rint(rng.normal(0, volatility, swaps)).astype(np.int64)
+    steps[steps == 0] = rng.choice([-1, 1], int((steps == 0).sum()))
+    swap_ticks = np.clip(tick0 + np.cumsum(steps), min_tick + 1, max_tick - 1)
+
+    # the tick after every event (swaps move it, mints/burns do not)
+    ticks = np.concatenate([[tick0], swap_ticks])[np.cumsum(kind == 0)]
+    sqrt_price = sqrtPriceAt(ticks)
+
+    # full range position
+    full_liquidity = float(np.round(10 ** rng.uniform(15, 17)))
+
+    # the positions around the tick they are minted at
+    mint_ticks = np.empty(positions, dtype=np.int64)
+    mint_ticks[position[kind == 1]] = ticks[kind == 1]
+    width = ts * (1 + rng.geometric(0.05, positions))
+    tick_lower = (
+        np.floor((mint_ticks - rng.random(positions) * width) / ts).astype(np.int64) * ts
+    )
+    tick_upper = np.maximum(tick_lower + width, (mint_ticks // ts + 1) * ts)
+    tick_lower = np.clip(tick_lower, min_tick, max_tick - ts)
+    tick_upper = np.clip(tick_upper, tick_lower + ts, max_tick)
+    liquidity = np.clip(rng.lognormal(np.log(1e15), 1.5, positions), 1e9, 1e17).round()
+
+    # mints and burns (the full range mint goes first)
+    mb = kind != 0
+    mb_position = position[mb]
+    mb_lower = np.concatenate([[min_tick], tick_lower[mb_position]])
+    mb_upper = np.concatenate([[max_tick], tick_upper[mb_position]])
+    mb_liquidity = np.concatenate([[full_liquidity], liquidity[mb_position]])
+    mb_amount0, mb_amount1 = positionAmounts(
+        mb_liquidity,
+        np.concatenate([[sqrtPriceAt(tick0)], sqrt_price[mb]]),
+        mb_lower,
+        mb_upper,
+    )
+    mb_slot = np.concatenate([[1], np.flatnonzero(mb) + 2])
+
+    # swaps pay in one token and are paid out in the other
+    swap_amount0, swap_amount1, swap_liquidity = swapAmounts(
+        np.concatenate([[1], kind]),
+        swap_ticks,
+        mb_lower,
+        mb_upper,
+        mb_liquidity * np.concatenate([[1], kind[mb]]),
+        tick0,
+        fee,
+    )
+    swap_slot = np.flatnonzero(kind == 0) + 2
+
+    def events(slot):
+        """
+        The block/transaction columns of the events at the slots
+        """
+        return pl.DataFrame(
+            {
+                "block_timestamp": pl.Series(timestamps[slot])
+                .cast(pl.Datetime("us"))
+                .dt.replace_time_zone("UTC"),
+                "block_number": blocks[slot],
+                "tx": pool_id * 10**10 + slot,
+                "log_index": tx_index[slot] * 4,
+                "transaction_index": tx_index[slot],
+                "sender_id": rng.integers(0, 10_000, slot.shape[0]),
+                "gas_price": pl.Series(
+                    rng.integers(10**9, 2 * 10**11, slot.shape[0])
+                ).cast(pl.Utf8),
+            }
+        ).with_columns(
+            chain_name=pl.lit(chain),
+            address=pl.lit(address),
+            transaction_hash=hexId("tx", 64),
+            from_address=hexId("sender_id", 40),
+            l1_fee=pl.lit(None, dtype=pl.Utf8),
+        )
+
+    first = events(np.array([0]))
+
+    factory = first.select(
+        "chain_name",
+        "block_timestamp",
+        "block_number",
+        "transaction_hash",
+        "log_index",
+        token0=pl.lit(token0),
+        token1=pl.lit(token1),
+        fee=pl.lit(str(fee)),
+        tickSpacing=pl.lit(str(ts)),
+        pool=pl.lit(address),
+    )
+
+    initialize = first.select(
+        "chain_name",
+        "address",
+        "block_timestamp",
+        "block_number",
+        "transaction_hash",
+        (pl.col("log_index") + 1).alias("log_index"),
+        sqrtPriceX96=sqrtPriceX96Strings(np.array([tick0])),
+        tick=pl.lit(str(tick0)),
+        to_address=pl.lit(SYNTHETIC_NFP),
+        from_address="from_address",
+        transaction_index="transaction_index",
+        gas_price="gas_price",
+        gas_used=pl.lit("5000000"),
+    )
+
+    mint_burn = events(mb_slot).select(
+        "chain_name",
+        "address",
+        "block_timestamp",
+        "block_number",
+        "transaction_hash",
+        "log_index",
+        amount=pl.Series(mb_liquidity.astype(np.int64)).cast(pl.Utf8),
+        amount0=amountStrings(mb_amount0),
+        amount1=amountStrings(mb_amount1),
+        owner=pl.lit(SYNTHETIC_NFP),
+        tick_lower=pl.Series(mb_lower).cast(pl.Utf8),
+        tick_upper=pl.Series(mb_upper).cast(pl.Utf8),
+        type_of_event=pl.Series(np.concatenate([[1], kind[mb]])),
+        to_address=pl.lit(SYNTHETIC_NFP),
+        from_address="from_address",
+        transaction_index="transaction_index",
+        gas_price="gas_price",
+        gas_used=pl.Series(rng.integers(150_000, 400_000, mb_slot.shape[0])).cast(
+            pl.Utf8
+        ),
+        l1_fee="l1_fee",
+    )
+
+    swap = events(swap_slot).select(
+        "chain_name",
+        "address",
+        "block_timestamp",
+        "block_number",
+        "transaction_hash",
+        "log_index",
+        sender=pl.lit(SYNTHETIC_ROUTER),
+        recipient="from_address",
+        amount0=amountStrings(swap_amount0),
+        amount1=amountStrings(swap_amount1),
+        sqrtPriceX96=sqrtPriceX96Strings(swap_ticks),
+        liquidity=amountStrings(np.round(swap_liquidity)),
+        tick=pl.Series(swap_ticks).cast(pl.Utf8),
+        from_address="from_address",
+        to_address=pl.lit(SYNTHETIC_ROUTER),
+        transaction_index="transaction_index",
+        gas_price="gas_price",
+        gas_used=pl.Series(rng.integers(100_000, 200_000, swap_slot.shape[0])).cast(
+            pl.Utf8
+        ),
+        l1_fee="l1_fee",
+    )
+
+    return {
+        "factory_pool_created": factory,
+        "pool_initialize_events": initialize,
+        "pool_mint_burn_events": mint_burn,
+        "pool_swap_events": swap,
+    }
+
+
+def generateSynthetic(
+    data_path,
+    n_pools=1,
+    swaps_per_pool=10_000,
+    positions_per_pool=1_000,
+    burn_ratio=0.5,
+    chain="ethereum",
+    n_blocks=1_000_000,
+    start_block=12_369_621,
+    volatility=10,
+    seed=0,
+    rows_per_file=1_000_000,
+):
+    """
+    Writes synthetic Uniswap v3 events in the layout of the pulled data
+    so everything can be tested and benchmarked at production sizes
+
+    Every pool gets a factory and initialize event, a full range mint,
+    swaps_per_pool swaps and positions_per_pool positions of which
+    about burn_ratio are burned. See syntheticPool.
+
+    Returns the addresses of the pools, which can be opened with
+    v3Pool(address, chain, data_path=data_path)
+
+    Notice: the events of a pool are spread over n_blocks blocks
+    starting at start_block (12s blocks)
+    Notice: the events are buffered and written rows_per_file rows at a time
+    """
+    rng = np.random.default_rng(seed)
+    genesis_us = int(
+        datetime(2021, 5, 4, 19, 0, tzinfo=timezone.utc).timestamp() * 1_000_000
+    )
+
+    tables = [
+        "factory_pool_created",
+        "pool_initialize_events",
+        "pool_mint_burn_events",
+        "pool_swap_events",
+    ]
+
+    checkPath("", data_path)
+    for table in tables:
+        checkPath(table, data_path)
+
+    buffers = {table: [] for table in tables}
+    buffered = {table: 0 for table in tables}
+
+    def flush(table):
+        if len(buffers[table]) == 0:
+            return
+
+        df = pl.concat(buffers[table])
+        buffers[table] = []
+        buffered[table] = 0
+
+        writeDataset(
+            df,
+            table,
+            data_path,
+            df["block_number"].max(),
+            df["block_number"].min(),
+        )
+        if table in BLOCK_INDEX_TABLES:
+            with WRITE_LOCK:
+                updateBlockIndex(df, data_path)
+
+    pools = []
+    for pool_id in range(n_pools):
+        events = syntheticPool(
+            rng,
+            pool_id,
+            chain,
+            swaps_per_pool,
+            positions_per_pool,
+            burn_ratio,
+            n_blocks,
+            start_block,
+            volatility,
+            genesis_us,
+        )
+        pools.append(events["factory_pool_created"]["pool"].item())
+
+        for table, df in events.items():
+            buffers[table].append(df)
+            buffered[table] += len(df)
+
+            if buffered[table] >= rows_per_file:
+                flush(table)
+
+    for table in tables:
+        flush(table)
+
+    print(
+        f"Generated {n_pools} pools with {n_pools * swaps_per_pool} swaps on {chain}"
+    )
+
+    return pools
@@ -3,6 +3,8 @@ import os
 from datetime import date, timedelta, datetime, timezone
 from polars.testing import assert_frame_equal
 from pathlib import Path
+from .partitions import scanTable
+from .schema import canonicalize, isCanonical
 
 
 def check_min_segment(value, table):
@@ -39,7 +41,7 @@ def test_assertion(pool):
             ordering = ["block_number", "log_index"]
 
         test = (
-            pl.scan_parquet(f"{pool.data_path}/{table}/*.parquet")
+            scanTable(pool.data_path, table)
             .filter(pl.col("address") == uni_eth)
             .sort(ordering)
             .collect()
@@ -57,6 +59,10 @@ def test_assertion(pool):
             .collect()
         )
 
+        # freshly pulled data is stored in the canonical schema
+        if isCanonical(test.schema, table):
+            examples = canonicalize(examples, table)
+
         examples = examples.select(sorted(examples.columns))
 
         try:
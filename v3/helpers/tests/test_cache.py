@@ -0,0 +1,65 @@
+import shutil
+
+import numpy as np
+import polars as pl
+
+from v3 import state
+from v3.helpers.cache import lruCache
+from v3.helpers.conftest import EXAMPLE_POOL
+
+
+def test_lruCache_evicts_least_recently_used():
+    cache = lruCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    # a is now more recently used than b
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.get("b") is None
+    assert cache.stats() == {
+        "hits": 3,
+        "misses": 1,
+        "evictions": 1,
+        "entries": 2,
+        "bytes": cache.bytes,
+    }
+
+
+def test_lruCache_evicts_over_max_bytes():
+    cache = lruCache(max_entries=None, max_bytes=3 * 8_000)
+    for key in range(5):
+        cache.put(key, np.zeros(1_000))
+
+    assert list(cache.entries) == [2, 3, 4]
+    assert cache.bytes == 3 * 8_000
+
+    # the newest entry is kept even if it is over the budget alone
+    cache.put("big", np.zeros(10_000))
+    assert list(cache.entries) == ["big"]
+
+
+def test_caches_are_cleared_when_events_are_replaced(example_path, tmp_path):
+    pool = state.v3Pool(EXAMPLE_POOL, "ethereum", data_path=example_path)
+    as_of = pool.swaps["as_of"][-1]
+
+    full = pool.createLiq(as_of)
+    pool.calcSwapDF(as_of)
+    assert len(pool.cache["liquidity"]) > 0 and len(pool.cache["swapStates"]) > 0
+
+    # reload the mints/burns from a copy that only has the first half
+    shutil.copytree(example_path, tmp_path, dirs_exist_ok=True)
+    table = tmp_path / "pool_mint_burn_events"
+    file = next(table.glob("*.parquet"))
+    mb = pl.read_parquet(file)
+    mb.head(mb.shape[0] // 2).write_parquet(file)
+
+    pool.cache.pop("mb")
+    pool.readFromMemoryOrDisk("pool_mint_burn_events", str(tmp_path), save=True)
+
+    assert len(pool.cache["liquidity"]) == 0 and len(pool.cache["swapStates"]) == 0
+    half = pool.createLiq(as_of)
+    assert not half.equals(full)
+    assert half.equals(pool.createLiq(as_of))
@@ -0,0 +1,123 @@
+import json
+
+import polars as pl
+from polars.testing import assert_frame_equal
+
+from v3.helpers.connectors import LOCAL_TABLES, address_filter, local
+from v3.helpers.connectors.allium import ALLIUM_SCHEMA, allium, allium_query
+from v3.helpers.connectors.template import connector_template
+
+NEW = "0x03af20bdaaffb4cc0a521796a223f7d85e2aac31"
+OLD = "0x2e9c575206288f2219409289035facac0b670c2f"
+
+
+class recordedSession:
+    # answers every query with the same rows, like the allium api
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        self.queries.append(json["query_text"])
+        return recordedResponse(self.rows)
+
+
+class recordedResponse:
+    def __init__(self, rows):
+        self.content = json.dumps({"data": rows}).encode()
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def test_allium_read_carries_its_schema():
+    connector = allium("query_id", "api_key")
+    args = ("factory_pool_created", 100, 0, None, "ethereum")
+
+    q = connector.get_template("read", *args)
+    same = connector.get_template("read", *args)
+
+    assert isinstance(q, allium_query) and q == same
+    assert q.schema == ALLIUM_SCHEMA["factory_pool_created"]
+    # nothing is kept on the connector between template and execute
+    assert not hasattr(connector, "schemas")
+
+
+def test_allium_execute_decodes_with_the_query_schema():
+    connector = allium("query_id", "api_key")
+    connector.session = recordedSession([{"tick_lower": "1", "tick_upper": "2"}])
+
+    schema = {"tick_lower": pl.Utf8, "tick_upper": pl.Utf8}
+    typed = connector.execute(allium_query("select 1", schema))
+    assert typed.schema == schema
+
+    # the same sql without a schema is decoded from the json
+    untyped = connector.execute("select 1")
+    assert untyped.rows() == typed.rows()
+    assert connector.session.queries == ["select 1", "select 1"]
+
+
+def test_address_filter_per_chain():
+    table = "pool_swap_events"
+    assert address_filter(table, NEW, chain="optimism") == f"and address = '{NEW}'"
+    assert address_filter(table, [NEW, "0xb"], chain="ethereum") == (
+        f"and address in ('{NEW}', '0xb')"
+    )
+    # the tables of the whole chain are not filtered
+    assert address_filter("factory_pool_created", NEW, chain="optimism") == ""
+
+    # ovm1 is filtered on the ovm1 addresses of the pools
+    ovm1 = "optimism_legacy_ovm1"
+    assert address_filter(table, NEW, chain=ovm1) == f"and address in ('{OLD}')"
+    assert address_filter(table, [NEW.upper(), "0xb"], chain=ovm1) == (
+        f"and address in ('{OLD}')"
+    )
+    assert address_filter(table, "0xb", chain=ovm1) == "and 1 = 0"
+
+
+def test_connectors_push_the_ovm1_address_down(tmp_path):
+    args = ("pool_swap_events", 100, 0, NEW, "optimism_legacy_ovm1")
+
+    for connector in [local(str(tmp_path / "local.db")), connector_template()]:
+        for query_type, query_args in [
+            ("minMax", (args[0], NEW, args[-1])),
+            ("findSegment", args + (20,)),
+            ("read", args),
+        ]:
+            q = connector.get_template(query_type, *query_args)
+            assert f"address in ('{OLD}')" in q and NEW not in q
+
+
+def test_local_reads_the_table_dtypes_once(tmp_path):
+    db = local(str(tmp_path / "local.db"))
+    swaps = pl.DataFrame(
+        {"chain_name": ["ethereum"], "address": [NEW], "block_number": [1], "amount0": ["-1"]}
+    )
+    db.load(swaps, "pool_swap_events")
+
+    statements = []
+    db.connection().set_trace_callback(statements.append)
+    q = db.get_template("read", "pool_swap_events", 1, 1, NEW, "ethereum")
+    for _ in range(3):
+        assert_frame_equal(db.execute(q), swaps)
+    # one per table, on the first execute
+    assert len([s for s in statements if s.startswith("pragma")]) == len(LOCAL_TABLES)
+
+    # a created table is picked up
+    db.load(swaps.rename({"address": "pool"}).drop("amount0"), "factory_pool_created")
+    assert db.dtypes()["pool"] == pl.Utf8
+
+
+def test_allium_nfp_query_filters_every_pool():
+    connector = allium("query_id", "api_key")
+
+    q = connector.get_remote_table("nfp", NEW, "ethereum")
+    assert f"and t2.liquidity_pool_address = '{NEW}'" in q
+
+    # multi-pool mode pulls the positions of all the pools
+    q = connector.get_remote_table("nfp", [NEW, "0xb"], "ethereum")
+    assert f"and t2.liquidity_pool_address in ('{NEW}', '0xb')" in q
+    assert str([NEW, "0xb"]) not in q
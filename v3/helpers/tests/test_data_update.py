@@ -0,0 +1,418 @@
+import asyncio
+import os
+import shutil
+from datetime import timedelta
+from types import SimpleNamespace
+
+import polars as pl
+from polars.testing import assert_frame_equal
+
+from v3 import state
+from v3.helpers import data_update, pool_helpers
+from v3.helpers.benchmark import BENCHMARK_TABLES, loadLocalDatabase
+from v3.helpers.block_index import BLOCK_INDEX_TABLES, blockIndexPath
+from v3.helpers.conftest import EXAMPLE_POOL, EXAMPLES, TABLES
+from v3.helpers.connectors import local, ovm1Addresses
+from v3.helpers.data_update import (
+    OVM1_BACKFILL_BLOCK,
+    _update_tables,
+    compactPartition,
+    jobLanes,
+    migrate_tables,
+    recoverCompaction,
+    resumeBlock,
+    update_pools,
+    writeCompactionJournal,
+    writeDataset,
+    writeSegment,
+)
+from v3.helpers.pool_helpers import dtToBN
+from v3.helpers.partitions import (
+    COMPACTION_JOURNAL,
+    POOL_PARTITIONED_TABLES,
+    partitionPath,
+    scanTable,
+)
+
+TABLE = "pool_swap_events"
+ORDERING = ["block_number", "transaction_index", "log_index"]
+
+
+def writeSegments(data_path, n_segments):
+    """
+    Writes the swaps of the example pool as n_segments incremental
+    segments and returns the folder of their partition
+    """
+    os.makedirs(f"{data_path}/{TABLE}")
+    swaps = pl.read_parquet(EXAMPLES / TABLE / "example.parquet").filter(
+        pl.col("address") == EXAMPLE_POOL.lower()
+    )
+
+    size = (swaps.shape[0] + n_segments - 1) // n_segments
+    for offset in range(0, swaps.shape[0], size):
+        segment = swaps.slice(offset, size)
+        writeDataset(
+            segment,
+            TABLE,
+            data_path,
+            segment["block_number"].max(),
+            segment["block_number"].min(),
+        )
+
+    return partitionPath(data_path, TABLE, "ethereum", EXAMPLE_POOL.lower())
+
+
+def readPartition(data_path):
+    return scanTable(data_path, TABLE).collect().sort(ORDERING)
+
+
+def test_compactPartition_preserves_rows(tmp_path):
+    path = writeSegments(tmp_path, 6)
+    before = readPartition(tmp_path)
+
+    assert compactPartition(path, TABLE, tmp_path, 20, 10) == 6
+
+    files = sorted(os.listdir(path))
+    assert len(files) == (before.shape[0] + 19) // 20
+    assert_frame_equal(readPartition(tmp_path), before)
+
+    # files of target_rows rows are left alone
+    assert compactPartition(path, TABLE, tmp_path, 20, 10) == 0
+    assert sorted(os.listdir(path)) == files
+
+
+def test_interrupted_compaction_is_never_visible(tmp_path):
+    path = writeSegments(tmp_path, 3)
+    before = readPartition(tmp_path)
+    segments = sorted(os.listdir(path))
+
+    # crashed while writing the merged file
+    merged = pl.read_parquet(f"{path}/{segments[0]}")
+    writeCompactionJournal(path, ["9_0_0_merged.parquet"], segments, committed=False)
+    merged.write_parquet(f"{path}/9_0_0_merged.parquet")
+
+    assert_frame_equal(readPartition(tmp_path), before)
+    assert recoverCompaction(path)
+    assert sorted(os.listdir(path)) == segments
+
+    # crashed after the commit, before the segments were removed
+    pl.concat([pl.read_parquet(f"{path}/{f}") for f in segments]).write_parquet(
+        f"{path}/9_0_0_merged.parquet"
+    )
+    writeCompactionJournal(path, ["9_0_0_merged.parquet"], segments, committed=True)
+
+    assert_frame_equal(readPartition(tmp_path), before)
+    assert recoverCompaction(path)
+    assert os.listdir(path) == ["9_0_0_merged.parquet"]
+    assert not os.path.exists(f"{path}/{COMPACTION_JOURNAL}")
+    assert_frame_equal(readPartition(tmp_path), before)
+
+
+def indexedBlocks(data_path, tables):
+    """
+    The (block_number, block_timestamp) of every event of the tables on disk
+    """
+    return (
+        pl.concat(
+            [
+                scanTable(data_path, table, "ethereum")
+                .select(["block_number", "block_timestamp"])
+                .collect()
+                for table in tables
+            ]
+        )
+        .unique()
+        .sort("block_number")
+    )
+
+
+def lastBlockAt(blocks, dt):
+    """
+    Brute force version of dtToBN
+    """
+    before = blocks.filter(pl.col("block_timestamp") <= dt)
+    return None if before.is_empty() else before["block_number"].max()
+
+
+def test_dtToBN_after_incremental_index_updates(example_path, tmp_path, monkeypatch):
+    shutil.copytree(example_path, tmp_path, dirs_exist_ok=True)
+    pool = SimpleNamespace(
+        data_path=str(tmp_path), chain="ethereum", clearCaches=lambda: None
+    )
+
+    swaps = pl.read_parquet(EXAMPLES / TABLE / "example.parquet").filter(
+        pl.col("address") == EXAMPLE_POOL.lower()
+    )
+    # the first segment builds the index (from what was already on disk),
+    # the next ones are appended to it
+    for shift in [1, 2, 3]:
+        segment = swaps.with_columns(
+            block_number=pl.col("block_number") + shift * 1_000_000,
+            block_timestamp=pl.col("block_timestamp") + pl.duration(days=200 * shift),
+        )
+        writeSegment(
+            segment,
+            TABLE,
+            str(tmp_path),
+            "ethereum",
+            segment["block_number"].max(),
+            segment["block_number"].min(),
+        )
+        assert os.path.exists(blockIndexPath(str(tmp_path), "ethereum"))
+
+    blocks = indexedBlocks(tmp_path, BLOCK_INDEX_TABLES)
+    timestamps = blocks["block_timestamp"]
+    dts = timestamps.to_list() + (timestamps - timedelta(seconds=1)).to_list()
+    for dt in dts:
+        assert dtToBN(dt, pool) == lastBlockAt(blocks, dt)
+
+    # the index is rebuilt without the blocks of dropped tables
+    monkeypatch.setattr(pool_helpers.time, "sleep", lambda seconds: None)
+    pool_helpers.drop_tables(pool, TABLE)
+    assert not os.path.exists(blockIndexPath(str(tmp_path), "ethereum"))
+
+    blocks = indexedBlocks(tmp_path, [t for t in BLOCK_INDEX_TABLES if t != TABLE])
+    for dt in dts:
+        assert dtToBN(dt, pool) == lastBlockAt(blocks, dt)
+
+
+def test_ovm1_jobs_run_before_their_optimism_job():
+    jobs = [
+        (table, chain)
+        for chain in ["optimism", "optimism_legacy_ovm1"]
+        for table in ["pool_swap_events", "factory_pool_created"]
+    ]
+    assert jobLanes(jobs) == [
+        [
+            ("pool_swap_events", "optimism_legacy_ovm1"),
+            ("pool_swap_events", "optimism"),
+        ],
+        [
+            ("factory_pool_created", "optimism_legacy_ovm1"),
+            ("factory_pool_created", "optimism"),
+        ],
+    ]
+
+    # the pools of multi-pool jobs are lists, other chains get their own lanes
+    pools = ["0xa", "0xb"]
+    jobs = [
+        (TABLE, pools, "optimism"),
+        (TABLE, pools, "optimism_legacy_ovm1"),
+        (TABLE, pools, "ethereum"),
+        (TABLE, "0xa", "optimism_legacy_ovm1"),
+    ]
+    assert jobLanes(jobs) == [
+        [(TABLE, pools, "optimism_legacy_ovm1"), (TABLE, pools, "optimism")],
+        [(TABLE, pools, "ethereum")],
+        [(TABLE, "0xa", "optimism_legacy_ovm1")],
+    ]
+
+
+def test_optimism_resumes_after_its_own_blocks(tmp_path):
+    os.makedirs(f"{tmp_path}/{TABLE}")
+    address = EXAMPLE_POOL.lower()
+    swaps = pl.read_parquet(EXAMPLES / TABLE / "example.parquet").filter(
+        pl.col("address") == address
+    )
+
+    # only the ovm1 backfill
+    backfill = swaps.with_columns(
+        chain_name=pl.lit("optimism"), block_number=pl.lit(OVM1_BACKFILL_BLOCK)
+    )
+    writeDataset(backfill, TABLE, tmp_path, 0, 0)
+    assert resumeBlock(tmp_path, TABLE, "optimism", address, 100) == 100
+
+    optimism = swaps.with_columns(chain_name=pl.lit("optimism"))
+    writeDataset(optimism, TABLE, tmp_path, 0, 0)
+    expected = optimism["block_number"].max() + 1
+    assert resumeBlock(tmp_path, TABLE, "optimism", address, 100) == expected
+
+
+class asyncLocal:
+    """
+    The local connector with an async execute (see async_connector)
+    """
+
+    def __init__(self, connector):
+        self.connector = connector
+
+    def get_template(self, query_type, *args):
+        return self.connector.get_template(query_type, *args)
+
+    async def execute(self, q):
+        return self.connector.execute(q)
+
+
+def localPool(data_path, connector):
+    """
+    The attributes of a v3Pool that _update_tables reads
+    """
+    os.makedirs(data_path, exist_ok=True)
+    return SimpleNamespace(
+        pool=EXAMPLE_POOL.lower(),
+        chain="ethereum",
+        data_path=str(data_path),
+        tables=BENCHMARK_TABLES,
+        connector=connector,
+        tgt_max_rows=20,
+        read_ahead=2,
+    )
+
+
+def storedRows(data_path):
+    tables = {table: scanTable(str(data_path), table).collect() for table in BENCHMARK_TABLES}
+    return {table: df.sort(df.columns) for table, df in tables.items()}
+
+
+def test_sync_and_async_connectors_pull_the_same_rows(
+    example_path, tmp_path, monkeypatch
+):
+    address = EXAMPLE_POOL.lower()
+    db = local(str(tmp_path / "local.db"))
+    loadLocalDatabase(db, example_path, BENCHMARK_TABLES, "ethereum", address)
+
+    _update_tables(localPool(tmp_path / "sync", db), BENCHMARK_TABLES)
+    expected = storedRows(tmp_path / "sync")
+    for table, df in expected.items():
+        source = scanTable(example_path, table).filter(pl.col("chain_name") == "ethereum")
+        if table in POOL_PARTITIONED_TABLES:
+            source = source.filter(pl.col("address") == address)
+        # the last remote block is left for the next update
+        source = source.filter(pl.col("block_number") < pl.col("block_number").max())
+        assert df.shape[0] == source.select(pl.count()).collect().item() > 0
+
+    # an async connector, concurrent workers, from inside an event loop
+    async def updateInLoop():
+        pool = localPool(tmp_path / "async", asyncLocal(db))
+        _update_tables(pool, BENCHMARK_TABLES, workers=4)
+
+    asyncio.run(updateInLoop())
+
+    monkeypatch.setenv("POLARSV3_LOCAL_DB", str(tmp_path / "local.db"))
+    update_pools([(EXAMPLE_POOL, "ethereum")], "local", data_path=str(tmp_path / "pools"))
+
+    for path in ["async", "pools"]:
+        for table, df in storedRows(tmp_path / path).items():
+            assert_frame_equal(df, expected[table])
+
+
+def test_update_resumes_after_the_stored_blocks(example_path, tmp_path):
+    address = EXAMPLE_POOL.lower()
+    split = 12376000
+
+    db = local(str(tmp_path / "local.db"))
+    loadLocalDatabase(
+        db, example_path, BENCHMARK_TABLES, "ethereum", address, max_block=split
+    )
+    pool = localPool(tmp_path / "data", db)
+    _update_tables(pool, BENCHMARK_TABLES)
+
+    loadLocalDatabase(
+        db, example_path, BENCHMARK_TABLES, "ethereum", address, min_block=split + 1
+    )
+    db.queries.clear()
+    _update_tables(pool, BENCHMARK_TABLES, workers=2)
+    assert db.queries["read"] > 0
+
+    full = local(str(tmp_path / "full.db"))
+    loadLocalDatabase(full, example_path, BENCHMARK_TABLES, "ethereum", address)
+    _update_tables(localPool(tmp_path / "full", full), BENCHMARK_TABLES)
+
+    expected = storedRows(tmp_path / "full")
+    for table, df in storedRows(tmp_path / "data").items():
+        assert_frame_equal(df, expected[table])
+
+
+def test_ovm1_is_backfilled_once(tmp_path):
+    new = "0x03af20bdaaffb4cc0a521796a223f7d85e2aac31"
+    (old,) = ovm1Addresses(new)
+    tables = ["factory_pool_created", TABLE]
+    address = EXAMPLE_POOL.lower()
+
+    # the example pool as an ovm1 pool, and its swaps again on optimism
+    ovm1 = {
+        "factory_pool_created": pl.read_parquet(
+            EXAMPLES / "factory_pool_created" / "example.parquet"
+        )
+        .filter(pl.col("pool") == address)
+        .with_columns(pool=pl.lit(old)),
+        TABLE: pl.read_parquet(EXAMPLES / TABLE / "example.parquet")
+        .filter(pl.col("address") == address)
+        .with_columns(address=pl.lit(old)),
+    }
+    db = local(str(tmp_path / "local.db"))
+    for table, df in ovm1.items():
+        db.load(df.with_columns(chain_name=pl.lit("optimism_legacy_ovm1")), table)
+    db.load(
+        ovm1[TABLE].with_columns(chain_name=pl.lit("optimism"), address=pl.lit(new)),
+        TABLE,
+    )
+
+    pool = localPool(tmp_path / "data", db)
+    pool.pool, pool.chain = new, "optimism"
+    chains = ["optimism_legacy_ovm1", "optimism"]
+    _update_tables(pool, tables, chains=chains)
+
+    def backfilled():
+        return {
+            table: scanTable(pool.data_path, table, "optimism")
+            .filter(pl.col("block_number") == OVM1_BACKFILL_BLOCK)
+            .collect()
+            for table in tables
+        }
+
+    # every ovm1 event (the last block too) is backfilled with the new address
+    backfill = backfilled()
+    assert backfill["factory_pool_created"]["pool"].to_list() == [new]
+    assert backfill[TABLE].shape[0] == ovm1[TABLE].shape[0]
+    assert backfill[TABLE]["address"].unique().to_list() == [new]
+
+    # ovm1 is not pulled again, only the optimism tables are checked
+    db.queries.clear()
+    _update_tables(pool, tables, chains=chains)
+    assert db.queries["minMax"] == len(tables)
+    for table, df in backfilled().items():
+        assert_frame_equal(df, backfill[table])
+
+
+def test_migrate_tables_moves_flat_files_into_partitions(example_path, tmp_path, monkeypatch):
+    shutil.copytree(example_path, tmp_path, dirs_exist_ok=True)
+
+    # two flat segments of the swaps
+    swaps = pl.read_parquet(f"{tmp_path}/{TABLE}/0_0_0_{TABLE}.parquet")
+    os.remove(f"{tmp_path}/{TABLE}/0_0_0_{TABLE}.parquet")
+    for i, segment in enumerate([swaps.head(30), swaps.slice(30)]):
+        blocks = segment["block_number"]
+        segment.write_parquet(
+            f"{tmp_path}/{TABLE}/{i}_{blocks.min()}_{blocks.max()}_{TABLE}.parquet"
+        )
+
+    walks = []
+    getHeader = data_update.getHeader
+    monkeypatch.setattr(
+        data_update, "getHeader", lambda *args: walks.append(args) or getHeader(*args)
+    )
+
+    before = {table: scanTable(tmp_path, table).collect() for table in TABLES}
+    migrate_tables(str(tmp_path), TABLES)
+
+    # the files are only walked once per table, the headers stay unique
+    assert len(walks) == len(TABLES)
+    for table in TABLES:
+        assert not [f for f in os.listdir(f"{tmp_path}/{table}") if f.endswith(".parquet")]
+
+        files = [f for _, _, fs in os.walk(f"{tmp_path}/{table}") for f in fs]
+        headers = [int(f.split("_")[0]) for f in files]
+        assert len(set(headers)) == len(headers)
+
+        columns = before[table].columns
+        after = scanTable(tmp_path, table).collect().select(columns)
+        assert_frame_equal(after.sort(columns), before[table].sort(columns))
+
+    pool = state.v3Pool(EXAMPLE_POOL, "ethereum", data_path=example_path)
+    migrated = state.v3Pool(EXAMPLE_POOL, "ethereum", data_path=str(tmp_path))
+    as_of = pool.swaps["as_of"][-1]
+    assert migrated.createLiq(as_of).equals(pool.createLiq(as_of))
+
+    calldata = {"as_of": as_of, "tokenIn": pool.token0, "swapIn": 1e18}
+    assert migrated.swapIn(calldata) == pool.swapIn(calldata)
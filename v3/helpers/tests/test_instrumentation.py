@@ -0,0 +1,104 @@
+import polars as pl
+import pytest
+
+from v3.helpers.instrumentation import (
+    NULL_SPAN,
+    disableInstrumentation,
+    enableInstrumentation,
+    getCollector,
+    instrumented,
+    span,
+    spanCollector,
+)
+
+
+@pytest.fixture
+def collector():
+    collector = enableInstrumentation()
+    yield collector
+    disableInstrumentation()
+
+
+@instrumented("double")
+def double(df):
+    return pl.concat([df, df])
+
+
+def test_spans_are_only_recorded_while_enabled(collector):
+    df = pl.DataFrame({"a": [1, 2, 3]})
+    with span("connector.read", table="pool_swap_events") as s:
+        s.set(df)
+    double(df)
+
+    assert disableInstrumentation() is collector and getCollector() is None
+    assert span("connector.read", table="pool_swap_events") is NULL_SPAN
+    double(df)
+
+    spans = collector.frame()
+    assert spans["name"].to_list() == ["connector.read", "double"]
+    assert spans["rows"].to_list() == [3, 6]
+    assert spans["table"].to_list() == ["pool_swap_events", None]
+    assert set(collector.stats()) == {"connector.read{table=pool_swap_events}", "double"}
+
+
+def test_stats_aggregate_per_name_and_labels():
+    collector = spanCollector()
+    collector.record("read", {"table": "a"}, 0, 1.0, 10, 100, False)
+    collector.record("read", {"table": "a"}, 0, 3.0, None, None, False)
+    collector.record("read", {"table": "b"}, 0, 2.0, 5, 50, False)
+
+    assert collector.stats() == {
+        "read{table=a}": {
+            "count": 2,
+            "errors": 0,
+            "seconds": 4.0,
+            "max_seconds": 3.0,
+            "rows": 10,
+            "bytes": 100,
+            "mean_seconds": 2.0,
+        },
+        "read{table=b}": {
+            "count": 1,
+            "errors": 0,
+            "seconds": 2.0,
+            "max_seconds": 2.0,
+            "rows": 5,
+            "bytes": 50,
+            "mean_seconds": 2.0,
+        },
+    }
+
+    collector.clear()
+    assert collector.stats() == {} and collector.frame().is_empty()
+
+
+def test_errors_are_counted(collector):
+    with pytest.raises(ValueError):
+        with span("swapIn"):
+            raise ValueError("Not enough liquidity in pool")
+    with span("swapIn"):
+        pass
+
+    assert collector.stats()["swapIn"]["count"] == 2
+    assert collector.stats()["swapIn"]["errors"] == 1
+    assert collector.frame()["error"].to_list() == [True, False]
+
+
+def test_prometheus_format():
+    collector = spanCollector()
+    collector.record("read", {"table": 'a"b\\c'}, 0, 1.5, 10, 100, True)
+
+    assert collector.prometheus().splitlines() == [
+        "# TYPE v3_span_count_total counter",
+        'v3_span_count_total{span="read",table="a\\"b\\\\c"} 1',
+        "# TYPE v3_span_errors_total counter",
+        'v3_span_errors_total{span="read",table="a\\"b\\\\c"} 1',
+        "# TYPE v3_span_seconds_total counter",
+        'v3_span_seconds_total{span="read",table="a\\"b\\\\c"} 1.5',
+        "# TYPE v3_span_seconds_max gauge",
+        'v3_span_seconds_max{span="read",table="a\\"b\\\\c"} 1.5',
+        "# TYPE v3_span_rows_total counter",
+        'v3_span_rows_total{span="read",table="a\\"b\\\\c"} 10',
+        "# TYPE v3_span_bytes_total counter",
+        'v3_span_bytes_total{span="read",table="a\\"b\\\\c"} 100',
+    ]
@@ -0,0 +1,73 @@
+import shutil
+
+import numpy as np
+import polars as pl
+from polars.testing import assert_frame_equal
+
+from v3 import state
+from v3.helpers import pool_helpers
+from v3.helpers.conftest import EXAMPLE_POOL, EXAMPLES, TABLES
+from v3.helpers.schema import (
+    canonicalize,
+    intStrings,
+    isCanonical,
+    migrate_schema,
+    tableIsCanonical,
+)
+
+MB = "pool_mint_burn_events"
+
+
+def test_canonicalize_is_idempotent():
+    for table in TABLES:
+        once = canonicalize(pl.read_parquet(EXAMPLES / table / "example.parquet"), table)
+
+        assert isCanonical(once.schema, table)
+        assert_frame_equal(canonicalize(once, table), once)
+
+
+def test_canonical_mints_burns_are_read_as_stored(example_path, tmp_path):
+    shutil.copytree(example_path, tmp_path, dirs_exist_ok=True)
+    migrate_schema(str(tmp_path), TABLES)
+
+    pool = state.v3Pool(EXAMPLE_POOL, "ethereum", data_path=example_path)
+    migrated = state.v3Pool(EXAMPLE_POOL, "ethereum", data_path=str(tmp_path))
+
+    mb = migrated.readFromMemoryOrDisk(MB, migrated.data_path)
+    assert mb.select(["tick_lower", "tick_upper", "type_of_event"]).dtypes == [pl.Int64] * 3
+
+    as_of = pool.swaps["as_of"][-1]
+    assert_frame_equal(migrated.createLiq(as_of), pool.createLiq(as_of))
+
+
+def test_drop_tables_forgets_the_schema(example_path, tmp_path, monkeypatch):
+    shutil.copytree(example_path, tmp_path, dirs_exist_ok=True)
+    pool = state.v3Pool(EXAMPLE_POOL, "ethereum", data_path=str(tmp_path))
+    assert not tableIsCanonical(pool.data_path, MB)
+
+    monkeypatch.setattr(pool_helpers.time, "sleep", lambda seconds: None)
+    pool_helpers.drop_tables(pool, MB)
+
+    # the refilled table is written canonically
+    assert tableIsCanonical(pool.data_path, MB)
+
+
+def test_intStrings_matches_python_ints():
+    rng = np.random.default_rng(0)
+    # every magnitude up to past uint256, with fractions, signs and the edges
+    values = (rng.uniform(-1, 1, 5000) * 10 ** rng.uniform(0, 80, 5000)).tolist() + [
+        0.0,
+        -0.0,
+        0.7,
+        -3.9,
+        2.0**53 + 2,
+        2.0**64 - 2048,
+        2.0**160,
+        8784980508312966299743087290.0,
+        None,
+    ]
+
+    strings = intStrings(pl.Series("sqrtPriceX96", values))
+    assert strings.name == "sqrtPriceX96" and strings.dtype == pl.Utf8
+    assert strings.to_list() == [None if v is None else str(int(v)) for v in values]
+    assert intStrings([]).len() == 0
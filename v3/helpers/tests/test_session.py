@@ -0,0 +1,40 @@
+import pytest
+
+
+def test_two_swaps_equal_one_combined_swap(example_pool):
+    as_of = example_pool.swaps["as_of"][-1]
+
+    crossed = 0
+    for tokenIn, sizes in [
+        (example_pool.token0, [1e17, 3e18]),
+        (example_pool.token1, [1e16, 2e17]),
+        # these cross ticks
+        (example_pool.token0, [1e22, 3e22]),
+        (example_pool.token1, [5e19, 2e20]),
+    ]:
+        split = example_pool.session(as_of)
+        amtOut = sum(split.swap(tokenIn, size) for size in sizes)
+
+        combined = example_pool.session(as_of)
+        assert amtOut == pytest.approx(combined.swap(tokenIn, sum(sizes)), rel=1e-9)
+
+        assert split.tick == combined.tick
+        assert split.sqrtPrice == pytest.approx(combined.sqrtPrice, rel=1e-12)
+        assert split.liquidity == pytest.approx(combined.liquidity, rel=1e-12)
+        assert split.history()["fees"].sum() == pytest.approx(
+            combined.history()["fees"].sum(), rel=1e-9
+        )
+        crossed += combined.history()["ticksCrossed"].item()
+
+    assert crossed > 0
+
+
+def test_session_swap_matches_swapIn(example_pool):
+    as_of = example_pool.swaps["as_of"][-1]
+    for tokenIn in [example_pool.token0, example_pool.token1]:
+        for size in [1e16, 1e18, 1e20, 1e22]:
+            calldata = {"as_of": as_of, "tokenIn": tokenIn, "swapIn": size}
+            amt, _ = example_pool.swapIn(calldata)
+            assert example_pool.session(as_of).swap(tokenIn, size) == pytest.approx(
+                amt, rel=1e-9
+            )
@@ -0,0 +1,112 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from v3 import state
+from v3.helpers.conftest import EXAMPLE_POOL
+from v3.helpers.pool_helpers import createSwapArrays, createSwapDF
+
+
+def test_calcSwapDF_keeps_its_signature(example_pool):
+    as_of = example_pool.swaps["as_of"][-1]
+
+    _, df, inRangeValues = createSwapDF(as_of, example_pool)
+    swap_df, cachedValues = example_pool.calcSwapDF(as_of)
+    assert cachedValues == inRangeValues
+    assert swap_df.equals(df)
+
+    swapArrays = example_pool.calcSwapArrays(as_of)
+    assert example_pool.calcSwapArrays(as_of) is swapArrays
+
+    expected = createSwapArrays(df, inRangeValues[-1])
+    for zeroForOne in [True, False]:
+        for column, values in expected[zeroForOne].items():
+            np.testing.assert_array_equal(swapArrays[zeroForOne][column], values)
+
+
+def test_getTicksAt_and_getPricesAt_match_scalar_lookups(example_path):
+    for low_memory in [False, True]:
+        pool = state.v3Pool(
+            EXAMPLE_POOL, "ethereum", data_path=example_path, low_memory=low_memory
+        )
+        swaps = pool.swaps["as_of"]
+        # before the first swap, at every swap, between swaps and after the last
+        as_of = (
+            [swaps[0] - 1]
+            + swaps.to_list()
+            + (swaps.head(-1) + swaps.diff().drop_nulls() / 2).to_list()
+            + [swaps[-1] + 1]
+        )
+
+        ticks = pool.getTicksAt(as_of)
+        prices = pool.getPricesAt(as_of)
+        pricesF64 = pool.getPricesAtF64(as_of)
+        assert ticks.dtype == pl.Int64 and prices.dtype == pl.Utf8
+
+        for i, point in enumerate(as_of):
+            assert ticks[i] == pool.getTickAt(point)
+
+            price = pool.getPriceAt(point)
+            if price is None:
+                assert prices[i] is None and pricesF64[i] is None
+                continue
+
+            # the strings are exact, the floats are not
+            assert int(prices[i]) == price
+            assert pricesF64[i] == pytest.approx(price, rel=1e-15)
+
+
+def test_lazy_pool_matches_eager_pool(example_path):
+    eager = state.v3Pool(EXAMPLE_POOL, "ethereum", data_path=example_path)
+    lazy = state.v3Pool(EXAMPLE_POOL, "ethereum", data_path=example_path, pull=False)
+    assert isinstance(lazy.swaps, pl.LazyFrame) and isinstance(lazy.mb, pl.LazyFrame)
+
+    as_ofs = eager.swaps["as_of"].to_list()[::5] + [eager.swaps["as_of"][-1] + 1]
+    for as_of in as_ofs:
+        assert lazy.createLiq(as_of).equals(eager.createLiq(as_of))
+        assert lazy.getTickAt(as_of) == eager.getTickAt(as_of)
+        assert lazy.getPriceAt(as_of) == eager.getPriceAt(as_of)
+
+        if eager.getPriceAt(as_of) is None:
+            continue
+
+        for tokenIn in [eager.token0, eager.token1]:
+            calldata = {"as_of": as_of, "tokenIn": tokenIn, "swapIn": 1e18}
+            assert lazy.swapIn(calldata) == eager.swapIn(calldata)
+
+    start = eager.swaps["block_timestamp"][0].replace(tzinfo=None)
+    for gas in [False, True]:
+        expected = eager.getPriceSeries(start, frequency="1h", gas=gas)
+        assert expected.shape[0] > 0
+        assert lazy.getPriceSeries(start, frequency="1h", gas=gas).equals(expected)
+
+
+def test_low_memory_pool_matches_eager_pool(example_path):
+    eager = state.v3Pool(EXAMPLE_POOL, "ethereum", data_path=example_path)
+    compact = state.v3Pool(
+        EXAMPLE_POOL, "ethereum", data_path=example_path, low_memory=True
+    )
+    assert compact.swaps["liquidity"].dtype == pl.Float64
+    assert compact.swaps["sqrtPriceX96"].dtype == pl.Utf8
+
+    as_ofs = eager.swaps["as_of"].to_list()[::5] + [eager.swaps["as_of"][-1] + 1]
+    for as_of in as_ofs:
+        assert compact.createLiq(as_of).equals(eager.createLiq(as_of))
+        assert compact.getTickAt(as_of) == eager.getTickAt(as_of)
+        # the prices are exact, not the integer of a float
+        assert compact.getPriceAt(as_of) == eager.getPriceAt(as_of)
+
+        if eager.getPriceAt(as_of) is None:
+            continue
+
+        for tokenIn in [eager.token0, eager.token1]:
+            # within the first range and across ticks
+            for size in [1e18, 1e22]:
+                calldata = {"as_of": as_of, "tokenIn": tokenIn, "swapIn": size}
+                try:
+                    expected = eager.swapIn(calldata)
+                except AssertionError:
+                    continue
+                assert compact.swapIn(calldata) == expected
+
+    assert compact.getPricesAt(as_ofs).equals(eager.getPricesAt(as_ofs))
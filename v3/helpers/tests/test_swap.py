@@ -0,0 +1,229 @@
+import numpy as np
+import polars as pl
+import pytest
+
+
+def onchainSwaps(pool):
+    """
+    The example swaps as swapIn calldata with the amount out they received
+    Notice: the first swap is before the pool is initialized
+    """
+    swaps = []
+    for row in pool.swaps.slice(1).iter_rows(named=True):
+        amount0, amount1 = float(row["amount0"]), float(row["amount1"])
+        if amount0 > 0:
+            calldata = {"as_of": row["as_of"], "tokenIn": pool.token0, "swapIn": amount0}
+            swaps.append((calldata, -amount1))
+        else:
+            calldata = {"as_of": row["as_of"], "tokenIn": pool.token1, "swapIn": amount1}
+            swaps.append((calldata, -amount0))
+    return swaps
+
+
+def test_swapIn_matches_onchain_swaps(example_pool):
+    swaps = onchainSwaps(example_pool)
+    assert len(swaps) == 56
+
+    for calldata, amountOut in swaps:
+        amt, _ = example_pool.swapIn(calldata)
+        assert amt == pytest.approx(amountOut, rel=1e-8), calldata
+
+
+def test_swapIn_fee_frame_sums_to_fee_rate(example_pool):
+    feeRate = example_pool.fee / 1e6
+    for calldata, _ in onchainSwaps(example_pool):
+        _, (_, _, fees) = example_pool.swapIn({**calldata, "fees": True})
+        assert fees.columns == ["tick", "fee", "liquidity"]
+        assert fees["fee"].sum() == pytest.approx(calldata["swapIn"] * feeRate, rel=1e-9)
+
+
+def test_swapInBatch_matches_swapIn(example_pool):
+    as_ofs = [calldata["as_of"] for calldata, _ in onchainSwaps(example_pool)][::5]
+    sizes = [1e12, 1e16, 1e18, 1e20, 1e22, 1e26]
+
+    calldata = pl.DataFrame(
+        [
+            {"as_of": as_of, "tokenIn": token, "swapIn": size}
+            for as_of in as_ofs
+            for token in [example_pool.token0, example_pool.token1]
+            for size in sizes
+        ]
+    )
+    result = example_pool.swapInBatch(calldata)
+    assert result.shape[0] == calldata.shape[0]
+
+    for row in result.iter_rows(named=True):
+        try:
+            amt, (sqrtPriceLast, _, _) = example_pool.swapIn(row)
+        except AssertionError:
+            # not enough liquidity in the pool
+            assert row["amountOut"] is None
+            continue
+
+        assert row["amountOut"] == pytest.approx(amt, rel=1e-12)
+        assert row["sqrtPriceLast"] == pytest.approx(sqrtPriceLast, rel=1e-12)
+
+    assert result["amountOut"].null_count() > 0
+
+
+def test_swapOut_inverts_swapIn(example_pool):
+    as_ofs = [calldata["as_of"] for calldata, _ in onchainSwaps(example_pool)][::10]
+
+    for as_of in as_ofs:
+        for tokenIn in [example_pool.token0, example_pool.token1]:
+            # within the first range and across ticks
+            for size in [1e16, 1e18, 1e20, 1e22]:
+                calldata = {"as_of": as_of, "tokenIn": tokenIn, "swapIn": size}
+                try:
+                    amt, (sqrtPriceLast, _, _) = example_pool.swapIn(calldata)
+                except AssertionError:
+                    # not enough liquidity in the pool
+                    continue
+
+                amtIn, (amtOut, sqrtPriceOut, _, fees) = example_pool.swapOut(
+                    {"as_of": as_of, "tokenIn": tokenIn, "swapOut": amt}
+                )
+                # small swaps barely move the price, so inverting
+                # the price change loses digits (float cancellation)
+                assert amtIn == pytest.approx(size, rel=1e-8), calldata
+                assert amtOut == pytest.approx(amt, rel=1e-12)
+                assert sqrtPriceOut == pytest.approx(sqrtPriceLast, rel=1e-12)
+                assert fees == pytest.approx(size * example_pool.fee / 1e6, rel=1e-8)
+
+
+def test_swaps_above_pool_depth_are_null(example_pool):
+    as_of = example_pool.swaps["as_of"][-1]
+    sizes = [1e18, 1e24]
+
+    calldata = {"as_of": as_of, "tokenIn": example_pool.token0, "swapIn": sizes[-1]}
+    with pytest.raises(AssertionError, match="Not enough liquidity"):
+        example_pool.swapIn(calldata)
+
+    batch = example_pool.swapInBatch(
+        pl.DataFrame([{**calldata, "swapIn": size} for size in sizes])
+    )
+    curve = example_pool.depthCurve(as_of, example_pool.token0, sizes)
+
+    for result in [batch, curve]:
+        assert result["amountOut"].is_null().to_list() == [False, True]
+        assert result["ticksCrossed"].is_null().to_list() == [False, True]
+
+
+def test_depthCurve_matches_swapIn(example_pool):
+    sizes = np.geomspace(1e12, 1e23, 23)
+    for as_of in [calldata["as_of"] for calldata, _ in onchainSwaps(example_pool)][::10]:
+        for tokenIn in [example_pool.token0, example_pool.token1]:
+            curve = example_pool.depthCurve(as_of, tokenIn, sizes)
+            assert curve["swapIn"].to_list() == sizes.tolist()
+
+            for row in curve.iter_rows(named=True):
+                calldata = {"as_of": as_of, "tokenIn": tokenIn, "swapIn": row["swapIn"]}
+                try:
+                    amt, (sqrtPriceLast, _, _) = example_pool.swapIn(calldata)
+                except AssertionError:
+                    # not enough liquidity in the pool
+                    assert row["amountOut"] is None
+                    continue
+
+                assert row["amountOut"] == pytest.approx(amt, rel=1e-12), calldata
+                assert row["sqrtPriceLast"] == pytest.approx(sqrtPriceLast, rel=1e-12)
+
+
+def test_depthAt_matches_swapOut_to_the_price_limit(example_pool):
+    pcts = [0.5, 1, 2, 5]
+    for as_of in [calldata["as_of"] for calldata, _ in onchainSwaps(example_pool)][::10]:
+        depth = example_pool.depthAt(as_of, pcts)
+        price = example_pool.getPriceAt(as_of)
+
+        for pct, token0, token1 in depth.iter_rows():
+            # buying token0 moves the price up, buying token1 moves it down
+            for tokenIn, sign, expected in [
+                (example_pool.token1, 1, token0),
+                (example_pool.token0, -1, token1),
+            ]:
+                calldata = {
+                    "as_of": as_of,
+                    "tokenIn": tokenIn,
+                    "sqrtPriceLimitX96": float(price) * (1 + sign * pct / 100) ** 0.5,
+                }
+                _, (amtOut, _, _, _) = example_pool.swapOut(calldata)
+                assert amtOut == pytest.approx(expected, rel=1e-9), (calldata, pct)
+
+
+def test_swapInBatch_fees_match_swapIn(example_pool):
+    calldata = pl.DataFrame(
+        [
+            {**calldata, "swapIn": calldata["swapIn"] * scale}
+            for calldata, _ in onchainSwaps(example_pool)[::3]
+            for scale in [1, 1e3]
+        ]
+    )
+    result, feeDF = example_pool.swapInBatch(calldata, fees=True)
+    assert feeDF.columns == ["row", "tick", "fee", "liquidity"]
+    # some swaps pay fees to several ticks
+    assert feeDF.group_by("row").count()["count"].max() > 1
+
+    for row, swap in enumerate(calldata.iter_rows(named=True)):
+        fees = feeDF.filter(pl.col("row") == row).drop("row")
+        if result["amountOut"][row] is None:
+            # not enough liquidity in the pool
+            assert fees.is_empty()
+            continue
+
+        _, (_, _, expected) = example_pool.swapIn({**swap, "fees": True})
+        assert fees["tick"].to_list() == expected["tick"].to_list()
+        assert fees["fee"].to_list() == pytest.approx(expected["fee"].to_list(), rel=1e-9)
+        assert fees["liquidity"].to_list() == pytest.approx(
+            expected["liquidity"].to_list(), rel=1e-12
+        )
+
+
+def test_swapOut_to_a_price_limit(example_pool):
+    for as_of in [calldata["as_of"] for calldata, _ in onchainSwaps(example_pool)][::10]:
+        for tokenIn in [example_pool.token0, example_pool.token1]:
+            # within the first range and across ticks
+            for size in [1e18, 1e20, 1e22]:
+                calldata = {"as_of": as_of, "tokenIn": tokenIn, "swapIn": size}
+                try:
+                    amt, (sqrtPriceLast, _, _) = example_pool.swapIn(calldata)
+                except AssertionError:
+                    # not enough liquidity in the pool
+                    continue
+
+                limit = {
+                    "as_of": as_of,
+                    "tokenIn": tokenIn,
+                    "sqrtPriceLimitX96": sqrtPriceLast * 2**96,
+                }
+
+                # only the limit swaps until the price swapIn ended at
+                amtIn, (amtOut, sqrtPriceOut, _, _) = example_pool.swapOut(limit)
+                assert amtIn == pytest.approx(size, rel=1e-8), calldata
+                assert amtOut == pytest.approx(amt, rel=1e-9)
+                assert sqrtPriceOut == sqrtPriceLast
+
+                # the limit is reached before swapOut, so less comes out
+                amtIn, (amtOut, sqrtPriceOut, _, _) = example_pool.swapOut(
+                    {**limit, "swapOut": 2 * amt}
+                )
+                assert amtIn == pytest.approx(size, rel=1e-8)
+                assert amtOut == pytest.approx(amt, rel=1e-9)
+                assert sqrtPriceOut == sqrtPriceLast
+
+                # swapOut is reached before the limit
+                _, (amtOut, sqrtPriceOut, sqrt_P, _) = example_pool.swapOut(
+                    {**limit, "swapOut": amt / 2}
+                )
+                assert amtOut == amt / 2
+                assert min(sqrt_P, sqrtPriceLast) < sqrtPriceOut < max(sqrt_P, sqrtPriceLast)
+
+
+def test_swapOut_price_limit_already_reached(example_pool):
+    as_of = example_pool.swaps["as_of"][-1]
+    price = float(example_pool.getPriceAt(as_of))
+
+    # selling token0 moves the price down and selling token1 moves it up
+    for tokenIn, limit in [(example_pool.token0, price * 1.01), (example_pool.token1, price * 0.99)]:
+        calldata = {"as_of": as_of, "tokenIn": tokenIn, "sqrtPriceLimitX96": limit}
+        with pytest.raises(AssertionError, match="Price limit already reached"):
+            example_pool.swapOut(calldata)
@@ -0,0 +1,48 @@
+import polars as pl
+from polars.testing import assert_frame_equal
+
+from v3 import state
+from v3.helpers.conftest import EXAMPLE_POOL
+from v3.helpers.swap_math import createLiq, liqDeltas
+
+
+def fullRebuild(mb, as_of):
+    """
+    The liquidity distribution from every mint/burn before as_of
+    """
+    return (
+        liqDeltas(mb.filter(pl.col("as_of") < as_of))
+        .with_columns(
+            liquidity=(pl.col("liquidity_lower") + pl.col("liquidity_upper"))
+        )
+        .sort("tick")
+        .select(["tick", "liquidity"])
+        .with_columns(liquidity=(pl.col("liquidity").cumsum()))
+    )
+
+
+def test_createLiq_snapshots_match_full_rebuild(example_path):
+    for unit, every in [("events", 3), ("blocks", 50)]:
+        pool = state.v3Pool(
+            EXAMPLE_POOL,
+            "ethereum",
+            data_path=example_path,
+            snapshot_every=every,
+            snapshot_unit=unit,
+        )
+        mb = pool.mb
+        # walk forward and then back, so snapshots are built and reused
+        as_ofs = mb["as_of"].to_list() + [mb["as_of"].max() + 1]
+        for as_of in as_ofs + as_ofs[::-1]:
+            expected = fullRebuild(mb, as_of)
+            # the snapshots sum the amounts in another order (float rounding)
+            atol = 1e-12 * max(expected["liquidity"].abs().max() or 0, 1)
+            assert_frame_equal(
+                createLiq(as_of, pool, "pool_mint_burn_events", pool.data_path),
+                expected,
+                check_exact=False,
+                rtol=0,
+                atol=atol,
+            )
+
+        assert len(pool.cache["liq_snapshots"]["snapshots"]) > 0
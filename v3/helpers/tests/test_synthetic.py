@@ -0,0 +1,61 @@
+from collections import Counter
+
+import polars as pl
+import pytest
+
+from v3 import state
+from v3.helpers.conftest import EXAMPLES, TABLES
+from v3.helpers.partitions import scanTable
+from v3.helpers.schema import canonicalize
+from v3.helpers.synthetic import generateSynthetic
+
+
+@pytest.fixture(scope="module")
+def synthetic(tmp_path_factory):
+    data_path = str(tmp_path_factory.mktemp("synthetic"))
+    pools = generateSynthetic(
+        data_path, n_pools=3, swaps_per_pool=300, positions_per_pool=60, seed=1
+    )
+    return data_path, [state.v3Pool(pool, "ethereum", data_path=data_path) for pool in pools]
+
+
+def test_synthetic_schema_matches_the_examples(synthetic):
+    data_path, _ = synthetic
+    for table in TABLES:
+        example = canonicalize(pl.read_parquet(EXAMPLES / table / "example.parquet"), table)
+        assert scanTable(data_path, table).collect().schema == example.schema
+
+
+def test_synthetic_mints_and_burns_balance(synthetic):
+    _, pools = synthetic
+    for pool in pools:
+        # every burn closes a position that was minted before
+        positions = Counter()
+        for lower, upper, amount, kind in pool.mb.select(
+            ["tick_lower", "tick_upper", "amount", "type_of_event"]
+        ).iter_rows():
+            positions[(lower, upper, amount)] += kind
+            assert positions[(lower, upper, amount)] >= 0
+
+        assert (pool.mb["amount0"].cast(pl.Float64) >= 0).all()
+        assert (pool.mb["amount1"].cast(pl.Float64) >= 0).all()
+
+
+def test_synthetic_swaps_follow_the_positions(synthetic):
+    _, pools = synthetic
+    for pool in pools:
+        onchain = dict(pool.swaps.select(["as_of", "liquidity"]).iter_rows())
+        for s in pool.replay():
+            if s.event == "swap":
+                assert s.liquidity == pytest.approx(float(onchain[s.as_of]), rel=1e-12)
+
+        # the first swap has no price before it
+        for row in pool.swaps.slice(1).iter_rows(named=True):
+            amount0, amount1 = float(row["amount0"]), float(row["amount1"])
+            tokenIn, swapIn, amountOut = (
+                (pool.token0, amount0, -amount1)
+                if amount0 > 0
+                else (pool.token1, amount1, -amount0)
+            )
+            amt, _ = pool.swapIn({"as_of": row["as_of"], "tokenIn": tokenIn, "swapIn": swapIn})
+            assert amt == pytest.approx(amountOut, rel=1e-9, abs=1), row
@@ -16,7 +16,14 @@ class v3Pool:
         pull=True,
         tgt_max_rows=200_000,
         test_mode=False,
-        tables = []
+        tables = [],
+        snapshot_every=10_000,
+        snapshot_unit="events",
+        cache_entries=32,
+        cache_bytes=None,
+        update_workers=1,
+        read_ahead=4,
+        data_path=None,
     ):
         """
         Impliments and maintains a representation of Uniswap v3 Pool
@@ -29,6 +36,21 @@ class v3Pool:
         4. Allows swap simulating
         5. Creates liquidity distributions
         6. Historical price helpers
+
+        Notice: snapshot_every/snapshot_unit control how often the liquidity
+        distribution is checkpointed ("events" or "blocks") for createLiq
+        Notice: cache_entries/cache_bytes bound the LRU caches of swap states
+        and liquidity distributions (None disables the bound)
+        Notice: update_workers > 1 pulls the tables (and the ovm1 tables
+        on optimism) concurrently
+        Notice: read_ahead is the number of segments of a table that are
+        read from remote at once while updating
+        Notice: data_path overrides where the data is stored and read from
+        (defaults to v3/data), e.g. a folder of synthetic data
+        Notice: pull=False keeps the swaps and mints/burns on disk (LazyFrames),
+        the helpers then only read the columns and as_ofs they need
+        Notice: low_memory only keeps the columns the simulator needs in compact
+        dtypes (see pool_helpers.compactEvents) and streams the reads
         """
         # uniswap v3 immutables
         self._Q96 = 2**96
@@ -36,8 +58,11 @@ class v3Pool:
 
         # data adjustments
         self.tgt_max_rows = tgt_max_rows
+        self.read_ahead = read_ahead
         self.pull = pull
         self.low_memory = low_memory
+        self.snapshot_every = snapshot_every
+        self.snapshot_unit = snapshot_unit
 
         # specific v3 pool/chain data
         self.chain = chain
@@ -46,11 +71,14 @@ class v3Pool:
 
         # this is the cache where we store data if needed
         self.cache = {}
-        self.cache["as_of"] = 0
+        self.cache["swapStates"] = lruCache(cache_entries, cache_bytes)
+        self.cache["liquidity"] = lruCache(cache_entries, cache_bytes)
 
         # data checkers
         self.path = str(Path(f"{PACKAGEDIR}/data").resolve())
         self.data_path = str(Path(f"{PACKAGEDIR}/data").resolve())
+        if data_path is not None:
+            self.data_path = str(Path(data_path).resolve())
         checkPath("", self.data_path)
 
         # tables to update
@@ -70,20 +98,17 @@ class v3Pool:
         self.max_supported = -1
 
         if update:
-            update_tables(self, update_from, self.tables, test_mode)
+            chains = [self.chain]
 
             if self.chain == "optimism":
-                print("Chain = optimism - Start pulling the ovm1")
+                print("Chain = optimism - Also pulling the ovm1")
                 # the ovm1 = optimism, but they are in seperate databases
                 # pain
-                try:
-                    self.chain = "optimism_legacy_ovm1"
-                    update_tables(self, update_from, self.tables, test_mode)
-                except Exception as e:
-                    raise (e)
-                # we dont want these race condition
-                finally:
-                    self.chain = "optimism"
+                chains.append("optimism_legacy_ovm1")
+
+            update_tables(
+                self, update_from, self.tables, test_mode, chains, update_workers
+            )
         else:
             if test_mode:
                 raise ValueError("test_mode true but update false")
@@ -105,13 +130,62 @@ class v3Pool:
 
             self.max_supported = min(max_bn_of_mb, max_bn_of_swaps)
 
+            if low_memory:
+                footprint = self.memoryFootprint()
+                print(
+                    f"Loaded {self.cache['swaps'].shape[0]} swaps and "
+                    f"{self.cache['mb'].shape[0]} mints/burns "
+                    f"in {footprint['total'] / 2**20:.1f} MB"
+                )
+        else:
+            # only the block numbers are read
+            max_bn_of_swaps, max_bn_of_mb = [
+                self.readFromMemoryOrDisk(table, self.data_path, lazy=True)
+                .select(pl.col("block_number").max())
+                .collect()
+                .item()
+                for table in ["pool_swap_events", "pool_mint_burn_events"]
+            ]
+
+            self.max_supported = min(max_bn_of_mb, max_bn_of_swaps)
+
     def delete_tables(self, tables):
         """
         See pool_helpers.drop_tables
         """
         drop_tables(self, tables)
 
-    def readFromMemoryOrDisk(self, data, data_path, save=False):
+    def migrate_tables(self, tables=[]):
+        """
+        See data_update.migrate_tables
+        Moves the flat files of the data path into the chain=/pool= layout
+        """
+        if tables == []:
+            tables = self.tables
+
+        migrate_tables(self.data_path, tables)
+
+    def migrate_schema(self, tables=[]):
+        """
+        See schema.migrate_schema
+        Rewrites the files written before the canonical schema
+        """
+        if tables == []:
+            tables = self.tables
+
+        migrate_schema(self.data_path, tables)
+
+    def compact_tables(self, tables=[], target_rows=2_000_000, row_group_size=100_000):
+        """
+        See data_update.compact_tables
+        Merges the small segment files of the pool into large sorted files
+        """
+        if tables == []:
+            tables = self.tables
+
+        compact_tables(self, tables, target_rows, row_group_size)
+
+    def readFromMemoryOrDisk(self, data, data_path, save=False, lazy=False):
         """
         Function that either returns a cached version for speed of
         the dataset or calculates them on the fly. This is used by all
@@ -119,99 +193,208 @@ class v3Pool:
 
         Notice: data is the table
         Notice: data_path is the saved path to the data
-        Notice: pull=False caches the data instead of pulling
+        Notice: save caches the data in memory
+        Notice: lazy returns a LazyFrame (of the cache, or a scan of the disk)
+        so callers can push down the columns and as_ofs they need
         """
         if data == "pool_swap_events":
-            if "swaps" in self.cache.keys():
-                return self.cache["swaps"]
-
-            else:
-                df = (
-                    pl.scan_parquet(f"{data_path}/{data}/*.parquet")
-                    .filter(
-                        (pl.col("address") == self.pool)
-                        & (pl.col("chain_name") == self.chain)
-                    )
-                    .with_columns(
-                        as_of=pl.col("block_number") + pl.col("transaction_index") / 1e4
-                    )
-                    .collect()
-                    .sort("as_of")
-                )
-                if save:
-                    self.cache["swaps"] = df
+            key = "swaps"
+        elif data == "pool_mint_burn_events":
+            key = "mb"
+        else:
+            raise ValueError(f"Table {data} not recognized")
 
-                return df
+        if key in self.cache.keys():
+            if lazy:
+                return self.cache[key].lazy()
 
-        elif data == "pool_mint_burn_events":
-            if "mb" in self.cache.keys():
-                return self.cache["mb"]
-
-            else:
-                df = (
-                    pl.scan_parquet(f"{data_path}/{data}/*.parquet")
-                    .filter(
-                        (pl.col("address") == self.pool)
-                        & (pl.col("chain_name") == self.chain)
-                    )
-                    .cast(
-                        {
-                            "amount": pl.Float64,
-                            "tick_lower": pl.Int64,
-                            "tick_upper": pl.Int64,
-                            "type_of_event": pl.Float64,
-                        }
-                    )
-                    .with_columns(
-                        as_of=pl.col("block_number") + pl.col("transaction_index") / 1e4
-                    )
-                    .collect()
-                    .sort("as_of")
+            return self.cache[key]
+
+        lf = scanTable(data_path, data, self.chain, self.pool).filter(
+            (pl.col("address") == self.pool) & (pl.col("chain_name") == self.chain)
+        )
+
+        if key == "mb":
+            lf = floatColumns(lf, ["amount"])
+
+            # canonical data already stores the ticks and event types as Int64
+            if not tableIsCanonical(data_path, data):
+                lf = lf.cast(
+                    {
+                        "tick_lower": pl.Int64,
+                        "tick_upper": pl.Int64,
+                        "type_of_event": pl.Float64,
+                    }
                 )
-                if save:
-                    self.cache["mb"] = df
 
-                return df
+        lf = lf.with_columns(
+            as_of=pl.col("block_number") + pl.col("transaction_index") / 1e4
+        )
+
+        if self.low_memory:
+            lf = compactEvents(lf, data)
+
+        lf = lf.sort("as_of")
+
+        if lazy:
+            return lf
+
+        df = lf.collect(streaming=self.low_memory)
+        if save:
+            self.cache[key] = df
+            # everything derived from the previous events is stale
+            self.clearCaches()
+
+        return df
 
     def calcSwapDF(self, as_of):
         """
         @inherit from pool_helpers.createSwapDF
         Helper function that calculates and caches swapDFs
         swapDFs are pre-computed datasets required for swap computation
-        They are cached to optimize for multiple swaps at one as_of
+        They are cached in an LRU keyed by as_of to optimize for multiple
+        swaps at one as_of and interleaved swaps across as_ofs
 
         Notice: as_of is the block + transaction index / 1e4.
         Notice: Returns the value before the transaction at that index was done
         """
-        if self.cache["as_of"] == as_of:
-            return self.cache["swapDF"], self.cache["inRangeValues"]
+        swapState = self.cache["swapStates"].get(as_of)
+        if swapState is not None:
+            return swapState
 
         as_of, df, inRangeValues = createSwapDF(as_of, self)
 
-        self.cache["as_of"] = as_of
-        self.cache["swapDF"] = df
-        self.cache["inRangeValues"] = inRangeValues
+        swapState = (df, inRangeValues)
+        self.cache["swapStates"].put(as_of, swapState)
 
-        return df, inRangeValues
+        return swapState
+
+    def calcSwapArrays(self, as_of):
+        """
+        @inherit from pool_helpers.createSwapArrays
+        Helper function that calculates and caches the swap arrays
+        (the ticks outside of the current range and the cumulative amounts
+        to swap through them) of the swapDF as_of that time
+        They are cached next to the swapDFs in the same LRU
+
+        Notice: as_of is the block + transaction index / 1e4.
+        Notice: Returns the value before the transaction at that index was done
+        """
+        swapArrays = self.cache["swapStates"].get(("swapArrays", as_of))
+        if swapArrays is not None:
+            return swapArrays
+
+        df, inRangeValues = self.calcSwapDF(as_of)
+        # the last in-range value is the lower tick of the current range
+        swapArrays = createSwapArrays(df, inRangeValues[-1])
+        self.cache["swapStates"].put(("swapArrays", as_of), swapArrays)
+
+        return swapArrays
+
+    def clearCaches(self):
+        """
+        Drops the swap states, liquidity distributions and liquidity snapshots
+        These are derived from the swaps and mints/burns, so they are cleared
+        whenever the events are replaced (see readFromMemoryOrDisk)
+
+        Notice: the hit/miss/eviction counters are kept
+        """
+        self.cache["swapStates"].clear()
+        self.cache["liquidity"].clear()
+        self.cache.pop("liq_snapshots", None)
+
+    def cacheStats(self):
+        """
+        Returns the hit/miss/eviction counters of the swap state
+        and liquidity distribution caches
+        """
+        return {
+            "swapStates": self.cache["swapStates"].stats(),
+            "liquidity": self.cache["liquidity"].stats(),
+        }
+
+    def memoryFootprint(self):
+        """
+        Returns the (estimated) bytes held in memory by the swaps,
+        mints/burns, liquidity snapshots and the LRU caches
+        """
+        footprint = {
+            key: self.cache[key].estimated_size() if key in self.cache else 0
+            for key in ["swaps", "mb"]
+        }
+
+        snapshots = self.cache.get("liq_snapshots", {"snapshots": {}})["snapshots"]
+        footprint["liq_snapshots"] = sum(
+            [snapshot.estimated_size() for snapshot in snapshots.values()]
+        )
+
+        footprint["swapStates"] = self.cache["swapStates"].stats()["bytes"]
+        footprint["liquidity"] = self.cache["liquidity"].stats()["bytes"]
+        footprint["total"] = sum(footprint.values())
+
+        return footprint
 
     def getPropertyFrom(self, as_of, pool_property):
         """
         Helper function that returns values from columns at the desired time
 
+        Swaps are sorted on as_of, so this is a binary search for
+        the last swap before as_of
+
         Notice: as_of is the block + transaction index / 1e4.
         Notice: Returns the value before the transaction at that index was done
+        Notice: pull=False only reads the column up to as_of from disk
         """
-        pool_property = (
-            self.readFromMemoryOrDisk("pool_swap_events", self.data_path)
-            .filter(pl.col("as_of") < as_of)
-            .tail(1)
-            .select(pool_property)
-        )
+        if not self.pull:
+            swaps = self.readFromMemoryOrDisk(
+                "pool_swap_events", self.data_path, lazy=True
+            )
+            value = eventsBefore(swaps, as_of, [pool_property]).last().collect()
+
+            if value.is_empty():
+                return None
+
+            return value
+
+        swaps = self.readFromMemoryOrDisk("pool_swap_events", self.data_path)
+
+        idx = swaps["as_of"].search_sorted(as_of, side="left")
 
-        if pool_property.is_empty():
+        if idx == 0:
             return None
 
-        return pool_property
+        return swaps.slice(idx - 1, 1).select(pool_property)
+
+    def getPropertiesFrom(self, as_of, pool_property):
+        """
+        Vectorized version of getPropertyFrom that resolves an array of as_ofs
+        in one binary search
+
+        Returns a series aligned with as_of that is null where the pool
+        was not initialized yet
+
+        Notice: as_of is the block + transaction index / 1e4.
+        Notice: Returns the value before the transaction at that index was done
+        """
+        as_of = pl.Series("as_of", as_of, dtype=pl.Float64)
+
+        if not self.pull:
+            # only read the column up to the last as_of from disk
+            swaps = eventsBefore(
+                self.readFromMemoryOrDisk("pool_swap_events", self.data_path, lazy=True),
+                as_of.max(),
+                ["as_of", pool_property],
+            ).collect()
+        else:
+            swaps = self.readFromMemoryOrDisk("pool_swap_events", self.data_path)
+
+        idx = swaps["as_of"].search_sorted(as_of, side="left").cast(pl.Int64) - 1
+
+        values = swaps[pool_property].gather(idx.clip(lower_bound=0))
+
+        return pl.select(
+            pl.when(idx >= 0).then(values).otherwise(None).alias(pool_property)
+        ).to_series()
 
     def getTickAt(self, as_of, revert_on_uninitialized=False):
         """
@@ -243,6 +426,51 @@ class v3Pool:
         else:
             return int(price.item())
 
+    def getTicksAt(self, as_of):
+        """
+        Vectorized version of getTickAt over an array of as_ofs
+        Returns an Int64 series that is null where the pool was not initialized
+
+        Notice: as_of is the block + transaction index / 1e4.
+        Notice: Returns the value before the transaction at that index was done
+        """
+        return self.getPropertiesFrom(as_of, "tick").cast(pl.Int64)
+
+    def getPricesAt(self, as_of):
+        """
+        Vectorized version of getPriceAt over an array of as_ofs
+        Returns the exact sqrtPriceX96 as a Utf8 series (like the stored big
+        integers) that is null where the pool was not initialized
+
+        Notice: as_of is the block + transaction index / 1e4.
+        Notice: Returns the value before the transaction at that index was done
+        Notice: data without the exact prices (e.g. Float64 prices) is returned
+        as the integer of the float (like getPriceAt)
+        Notice: getPricesAtF64 skips the strings but rounds to float precision
+        """
+        prices = self.getPropertiesFrom(as_of, "sqrtPriceX96")
+
+        if prices.dtype != pl.Utf8:
+            prices = intStrings(prices)
+
+        return prices
+
+    def getPricesAtF64(self, as_of):
+        """
+        Float version of getPricesAt, a Float64 sqrtPriceX96 series that is
+        null where the pool was not initialized
+
+        Notice: as_of is the block + transaction index / 1e4.
+        Notice: Returns the value before the transaction at that index was done
+        Notice: the prices lose the digits past float precision (~16 digits)
+        """
+        # canonical data holds a float mirror of the exact price
+        column = "sqrtPriceX96"
+        if mirrorColumn(column) in self.swaps.columns:
+            column = mirrorColumn(column)
+
+        return self.getPropertiesFrom(as_of, column).cast(pl.Float64).alias("sqrtPriceX96")
+
     def getPriceSeries(self, as_of, frequency="6h", gas=False):
         """
         @inhert from pool_helpers.getPriceSeries
@@ -260,11 +488,19 @@ class v3Pool:
         @inhert from pool_helpers.dtToBN
         Returns the last block number at that datetime
 
-        Notice: as_of is the block + transaction index / 1e4.
+        Notice: as_of is a datetime
         """
 
         return dtToBN(as_of, self)
 
+    def getDateAtBN(self, bn):
+        """
+        @inhert from pool_helpers.bnToDt
+        Returns the datetime of the last block at or before bn
+        """
+
+        return bnToDt(bn, self)
+
     def createLiq(self, as_of):
         """
         @inhert from pool_helpers.createSwapDF
@@ -289,7 +525,7 @@ class v3Pool:
                     'swapIn': amount
                     # skips the swap and calculates max amount out
                     'findMax': False,
-                    # calculates fees accured to each tick
+                    # calculates fees accured to each tick (as a dataframe)
                     'fees': True
                     }
 
@@ -298,14 +534,138 @@ class v3Pool:
 
         return swapIn(calldata, self)
 
+    def swapOut(self, calldata):
+        """
+        @inherit from swap.swapOut
+        Simulates an exact output swap using the given "calldata"
+
+        Calldata takes the form:
+        calldata = {# the time of the swap
+                    'as_of': as_of,
+                    # the token address going in
+                    'tokenIn': address
+                    # the amount of tokens to receive
+                    'swapOut': amount
+                    # (optional) stops the swap once the price reaches it
+                    'sqrtPriceLimitX96': None
+                    }
+
+        amtIn, (amtOut, sqrtPriceLast, sqrt_P, fees) = pool.swapOut(calldata)
+
+        Notice: as_of is the block + transaction index / 1e4.
+        """
+
+        return swapOut(calldata, self)
+
+    def swapInBatch(self, calldata, fees=False):
+        """
+        @inherit from swap.swapInBatch
+        Simulates many swaps given as a polars dataframe of calldata
+
+        Calldata takes the form:
+        calldata = pl.DataFrame({# the time of each swap
+                                 'as_of': [as_of, ...],
+                                 # the token address going in
+                                 'tokenIn': [address, ...],
+                                 # the amount of tokens going in
+                                 'swapIn': [amount, ...]
+                                 })
+
+        Returns the calldata with amountOut, sqrtPriceLast and ticksCrossed
+        (and the fees paid to every tick with fees=True)
+        Notice: as_of is the block + transaction index / 1e4.
+        """
+
+        return swapInBatch(calldata, self, fees=fees)
+
+    def depthCurve(self, as_of, tokenIn, sizes):
+        """
+        @inherit from swap.depthCurve
+        Simulates swaps of every size of tokenIn at one pool state in one
+        vectorized pass, returning the amount out, effective price, price
+        impact and final price/tick of every size
+
+        depth = pool.depthCurve(as_of, pool.token0, np.geomspace(1e15, 1e21, 50))
+
+        Notice: as_of is the block + transaction index / 1e4.
+        Notice: Returns the value before the transaction at that index was done
+        """
+        return depthCurve(as_of, self, tokenIn, sizes)
+
+    def depthAt(self, as_of, pct):
+        """
+        @inherit from swap.depthAt
+        Returns the token0 liquidity up to pct percent above the price and
+        the token1 liquidity down to pct percent below it
+
+        depth = pool.depthAt(as_of, [0.5, 1, 2])
+
+        Notice: as_of is the block + transaction index / 1e4.
+        """
+        return depthAt(as_of, self, pct)
+
+    def session(self, as_of):
+        """
+        @inherit from session.createSession
+        Creates a mutable simulation session from the pool as_of, which
+        applies swaps (moving the price and crossing ticks), mints and burns
+        without rebuilding the liquidity distribution
+
+        session = pool.session(as_of)
+        amtOut = session.swap(pool.token0, 1e18)
+        amount0, amount1 = session.mint(tick_lower, tick_upper, liquidity)
+
+        Notice: as_of is the block + transaction index / 1e4.
+        Notice: Returns the state before the transaction at that index was done
+        """
+
+        return createSession(as_of, self)
+
+    def replay(self, start=None, end=None):
+        """
+        @inherit from replay.replay
+        Replays the swaps and mints/burns in one pass, yielding the
+        state of the pool (tick, price, liquidity) after every event
+
+        Notice: start and end are as_ofs (start <= as_of < end)
+        Notice: the same state is yielded every time, updated in place
+        """
+
+        return replay(self, start, end)
+
+    def runReplay(self, callbacks, start=None, end=None):
+        """
+        @inherit from replay.runReplay
+        Replays the pool and calls callbacks[event](state) after every
+        "swap", "mint" or "burn", returning the final state
+
+        Notice: start and end are as_ofs (start <= as_of < end)
+        """
+
+        return runReplay(self, callbacks, start, end)
+
+    def feeGrowth(self, start=None, end=None):
+        """
+        @inherit from replay.feeGrowth
+        Replays the historical swaps against the liquidity at the time and
+        aggregates the volume, fees and fee growth (per unit of liquidity)
+        of every tick
+
+        Notice: start and end are as_ofs (start <= as_of < end)
+        """
+
+        return feeGrowth(self, start, end)
+
     @property
     def swaps(self):
         """
         Getter for swaps
+
+        Notice: pull=False returns a LazyFrame
         """
         if not self.pull:
             return self.readFromMemoryOrDisk(
-                "pool_swap_events", self.data_path, pull=True
+                "pool_swap_events", self.data_path, lazy=True
             )
         else:
             return self.cache["swaps"]
@@ -314,10 +674,12 @@ class v3Pool:
     def mb(self):
         """
         Getter for mints/burns
+
+        Notice: pull=False returns a LazyFrame
         """
         if not self.pull:
             return self.readFromMemoryOrDisk(
-                "pool_mint_burn_events", self.data_path, pull=True
+                "pool_mint_burn_events", self.data_path, lazy=True
             )
         else:
             return self.cache["mb"]